@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+PDF Backend Benchmark
+Runs every PDF backend over the same exams and reports, per exam:
+  - timings for word extraction, crop text extraction and crop rendering
+  - whether the backends find the same question markers
+  - how closely their crop texts agree with the reference backend
+
+Crops are planned once (from the reference backend's layout) so every backend
+extracts and renders exactly the same boxes.
+"""
+
+import argparse
+import difflib
+import re
+import time
+from pathlib import Path
+
+from layout_cache import _extract_layout
+from pdf_backend import BACKENDS, DEFAULT_BACKEND, open_pdf, set_backend
+from question_cropper import (
+    extract_crop_text, parse_exam_folders, plan_exam_crops, render_crop_segments
+)
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace so line-wrapping differences do not count as mismatches."""
+    return " ".join(text.split())
+
+
+def crop_texts(doc, crops) -> list[str]:
+    """Text of every crop, from one open document."""
+    return [extract_crop_text(doc, crop) for crop in crops]
+
+
+def timed(func, *args):
+    """Run func, returning (result, seconds), or (None, error message) if it fails."""
+    start = time.perf_counter()
+    try:
+        result = func(*args)
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+    return result, time.perf_counter() - start
+
+
+def benchmark_backend(backend: str, pdf_path: Path, crops) -> dict:
+    """Time one backend on one exam."""
+    result = {}
+
+    pages, result['layout'] = timed(_extract_layout, pdf_path, backend)
+    result['markers'] = None
+    if pages is not None:
+        result['markers'] = sorted(
+            int(m.group(1)) for page in pages for text, *_ in page.words
+            if (m := re.match(r'^Q(\d+)\.$', text))
+        )
+
+    with open_pdf(pdf_path, backend) as doc:
+        result['texts'], result['text'] = timed(crop_texts, doc, crops)
+        _, result['render'] = timed(lambda: [render_crop_segments(doc, crop) for crop in crops])
+    return result
+
+
+def format_time(value) -> str:
+    return f"{value:8.2f}s" if isinstance(value, float) else "     n/a"
+
+
+def compare_texts(reference: list[str], other: list[str]) -> tuple[float, float, list]:
+    """
+    Compare the crop texts of two backends.
+
+    Returns:
+        (share of crops with identical normalized text, mean similarity ratio,
+         [(ratio, index), ...] sorted from the least similar)
+    """
+    equal = 0
+    ratios = []
+    for i, (a, b) in enumerate(zip(reference, other)):
+        a, b = normalize_text(a), normalize_text(b)
+        equal += a == b
+        ratios.append((difflib.SequenceMatcher(None, a, b).ratio(), i))
+    count = max(1, len(ratios))
+    return equal / count, sum(r for r, _ in ratios) / count, sorted(ratios)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark PDF backends against each other")
+    parser.add_argument("--exam", action="append", default=[],
+                        help="Only exams whose folder name contains this (repeatable)")
+    parser.add_argument("--limit", type=int, default=None, help="Benchmark at most N exams")
+    parser.add_argument("--reference", choices=sorted(BACKENDS), default=DEFAULT_BACKEND,
+                        help=f"Backend the others are compared to (default: {DEFAULT_BACKEND})")
+    parser.add_argument("--show-diffs", type=int, default=0, metavar="N",
+                        help="Print the N least similar crop texts per exam and backend")
+    args = parser.parse_args()
+
+    # Crops are planned from the reference backend's layout
+    set_backend(args.reference)
+    backends = [args.reference] + sorted(b for b in BACKENDS if b != args.reference)
+
+    exams = [e for e in parse_exam_folders()
+             if not args.exam or any(s in e.folder_name for s in args.exam)]
+    if args.limit:
+        exams = exams[:args.limit]
+    if not exams:
+        print("❌ No exams found.")
+        return
+
+    totals = {b: {'layout': 0.0, 'text': 0.0, 'render': 0.0} for b in backends}
+    print(f"Benchmarking {', '.join(backends)} on {len(exams)} exam(s) (reference: {args.reference})\n")
+
+    for exam in exams:
+        crops = plan_exam_crops(exam.pdf_path)
+        print(f"{exam.display_name} ({exam.pdf_path.name}, {len(crops)} crops)")
+        print(f"  {'backend':<12}{'words':>9}{'crop text':>10}{'render':>9}  markers   text agreement")
+
+        results = {b: benchmark_backend(b, exam.pdf_path, crops) for b in backends}
+        reference = results[args.reference]
+
+        for backend in backends:
+            r = results[backend]
+            for key in totals[backend]:
+                if isinstance(r[key], float) and totals[backend][key] is not None:
+                    totals[backend][key] += r[key]
+                else:
+                    totals[backend][key] = None
+
+            markers = "n/a" if r['markers'] is None else (
+                "same" if r['markers'] == reference['markers'] else f"{len(r['markers'])} found")
+            agreement = "-"
+            diffs = []
+            if backend != args.reference and r['texts'] is not None and reference['texts'] is not None:
+                equal, mean_ratio, diffs = compare_texts(reference['texts'], r['texts'])
+                agreement = f"{equal:.0%} identical, {mean_ratio:.3f} mean similarity"
+            print(f"  {backend:<12}{format_time(r['layout'])} {format_time(r['text'])} "
+                  f"{format_time(r['render'])}  {markers:<9} {agreement}")
+
+            for ratio, i in diffs[:args.show_diffs]:
+                print(f"      Q{crops[i].question_num} (similarity {ratio:.3f})")
+                print(f"        {args.reference}: {normalize_text(reference['texts'][i])[:160]!r}")
+                print(f"        {backend}: {normalize_text(r['texts'][i])[:160]!r}")
+
+        for backend in backends:
+            for key in ('layout', 'text', 'render'):
+                if isinstance(results[backend][key], str):
+                    print(f"  ⚠️ {backend} {key}: {results[backend][key]}")
+        print()
+
+    print("Totals")
+    for backend in backends:
+        t = totals[backend]
+        print(f"  {backend:<12}{format_time(t['layout'])} {format_time(t['text'])} {format_time(t['render'])}")
+
+    for key, label in (('layout', 'word extraction'), ('text', 'crop text'), ('render', 'crop rendering')):
+        timings = {b: t[key] for b, t in totals.items() if t[key] is not None}
+        if timings:
+            fastest = min(timings, key=timings.get)
+            print(f"✓ Fastest {label}: {fastest}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Classifier Throughput Benchmark
+Runs the classifier's request path (key pool, concurrent engine, grouping and
+retry rounds) against the offline Gemini stand-in (fake_gemini.py), once for
+every combination of --concurrency and --rpm, and reports for each:
+  - questions per second and wall time
+  - p50/p95 latency per question, from its first request to its answer
+    (including 429 backoff and retries)
+  - requests sent, retries, and wasted calls (429s, quota and key errors,
+    malformed answers)
+
+Nothing is written: no tags, no cache entries, no key pool state, and the
+state store is only opened read-only (texts come from the legacy cropper
+progress file if there is no store yet). Real crops and texts are used, so
+payload planning and grouping run as in a real run.
+    python3 app/benchmark_classifier.py --concurrency 2,4,8 --rpm 15,60
+"""
+
+import argparse
+import json
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+
+from classifier_journal import load_topics
+from classify_engine import ClassificationEngine
+from classify_questions import (
+    DEFAULT_GROUP_SIZE, QUESTIONS_DIR, classify_group_with_errors, classify_in_rounds, format_topic_list
+)
+from fake_gemini import FakeConfig, FakeGeminiServer
+from key_pool import KeyPool
+from state_store import CROPPER_PROGRESS_FILE, StateStore
+
+
+def percentile(values: list[float], p: float) -> float:
+    """p-th percentile (0-100) by nearest rank; 0 for no values."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(p / 100 * len(ordered)) - 1))]
+
+
+def load_questions(limit: int) -> list[tuple]:
+    """(rel_path, img_path, ocr_text) of the first `limit` cropped questions."""
+    try:
+        store = StateStore(read_only=True)
+        texts = store.question_texts()
+        store.close()
+    except sqlite3.OperationalError:  # No state store yet: read the progress file it would import
+        progress = json.loads(CROPPER_PROGRESS_FILE.read_text()) if CROPPER_PROGRESS_FILE.exists() else {}
+        texts = {f"{exam_key}/Q{crop['question_num']:02d}.png": crop.get('extracted_text') or ""
+                 for exam_key, crops in progress.items() for crop in crops}
+    paths = sorted(QUESTIONS_DIR.glob("*/Q*.png"))[:limit]
+    return [(f"{p.parent.name}/{p.name}", p, texts.get(f"{p.parent.name}/{p.name}", "")) for p in paths]
+
+
+def run_benchmark(questions: list[tuple], topics: dict, config: FakeConfig, keys: int, concurrency: int,
+                  rpm: float, group_size: int, max_wait: float) -> dict:
+    """One classifier run against a fresh fake service. Returns its measurements."""
+    server = FakeGeminiServer(config)
+    topic_list = format_topic_list(topics)
+    taxonomy = {cat: list(subcategories) for cat, subcategories in topics.items()}
+    first_request, last_answer = {}, {}  # Per question: start of its first request, end of its last
+    first_round_groups = set()  # Ids of the groups sent in the first round
+    rounds = [0]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pool = KeyPool([f"fake-key-{i}" for i in range(keys)], rpm, config.rpd, max_wait,
+                       state_file=Path(tmp) / "key_pool.json")
+        models = {k.id: server.model(k.key) for k in pool.keys}
+
+        def classify(group, k):
+            now = time.monotonic()
+            for question in group:
+                first_request.setdefault(question[0], now)
+            if rounds[0] == 1:
+                first_round_groups.add(id(group))
+            try:
+                return classify_group_with_errors(models[k.id], group, taxonomy, topic_list)
+            finally:
+                now = time.monotonic()
+                for question in group:
+                    last_answer[question[0]] = now
+
+        latencies, failed = [], []
+
+        def on_question(question, result, error=None):
+            if result is None:
+                failed.append(question[0])
+            if question[0] in last_answer:
+                latencies.append(last_answer[question[0]] - first_request[question[0]])
+
+        def next_round():
+            rounds[0] += 1
+
+        engine = ClassificationEngine(classify, pool, concurrency)
+        start = time.monotonic()
+        left = classify_in_rounds(engine, questions, group_size, on_question, before_round=next_round)
+        elapsed = time.monotonic() - start
+
+    counts = server.counts
+    answered = len(questions) - len(failed) - left
+    return {
+        "seconds": elapsed,
+        "qps": answered / elapsed if elapsed else 0.0,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "requests": counts["requests"],
+        "retries": counts["requests"] - len(first_round_groups),
+        "wasted": counts["rate_limited"] + counts["quota"] + counts["invalid_key"] + counts["malformed"],
+        "rate_limited": counts["rate_limited"],
+        "malformed": counts["malformed"],
+        "failed": len(failed),
+        "left": left,
+    }
+
+
+def parse_list(value: str, kind=float) -> list:
+    return [kind(v) for v in value.split(",") if v.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark classifier throughput against an offline Gemini stand-in")
+    parser.add_argument("--questions", type=int, default=60, help="Questions per run (default: 60)")
+    parser.add_argument("--keys", type=int, default=3, help="Fake API keys (default: 3)")
+    parser.add_argument("--concurrency", default="2,4,8", help="Comma-separated concurrency settings (default: 2,4,8)")
+    parser.add_argument("--rpm", default="15,60",
+                        help="Comma-separated client pacing per key, requests per minute (default: 15,60)")
+    parser.add_argument("--group-size", type=int, default=DEFAULT_GROUP_SIZE, help="Questions per request")
+    parser.add_argument("--max-wait", type=float, default=60, help="Seconds to wait for a free key (default: 60)")
+    fake = parser.add_argument_group("fake service")
+    fake.add_argument("--latency", type=float, default=1.0, help="Median seconds per request (default: 1.0)")
+    fake.add_argument("--latency-sigma", type=float, default=0.5, help="Lognormal latency spread (default: 0.5)")
+    fake.add_argument("--server-rpm", type=float, default=30,
+                      help="Requests per minute a key gets before 429s (default: 30)")
+    fake.add_argument("--server-rpd", type=int, default=1500, help="Requests per day per key (default: 1500)")
+    fake.add_argument("--rate-limit-rate", type=float, default=0.02, help="Share of random 429s (default: 0.02)")
+    fake.add_argument("--malformed-rate", type=float, default=0.05,
+                      help="Share of malformed answers (default: 0.05)")
+    fake.add_argument("--invalid-keys", type=int, default=0, help="How many of the keys are invalid (default: 0)")
+    fake.add_argument("--seed", type=int, default=0, help="Random seed of the fake service")
+    args = parser.parse_args()
+
+    questions = load_questions(args.questions)
+    if not questions:
+        print("No cropped questions found.")
+        return
+    topics = load_topics()
+    config = FakeConfig(latency=args.latency, latency_sigma=args.latency_sigma, rpm=args.server_rpm,
+                        rpd=args.server_rpd, rate_limit_rate=args.rate_limit_rate,
+                        malformed_rate=args.malformed_rate, seed=args.seed,
+                        invalid_keys=tuple(f"fake-key-{i}" for i in range(args.invalid_keys)))
+
+    print(f"Benchmarking {len(questions)} questions on {args.keys} fake key(s): {args.latency:g}s median latency, "
+          f"{args.server_rpm:g} RPM limit, {args.rate_limit_rate:.0%} random 429s, "
+          f"{args.malformed_rate:.0%} malformed answers\n")
+    print(f"  {'conc':>4} {'rpm':>5} {'q/s':>6} {'p50':>6} {'p95':>6} {'requests':>8} {'retries':>7} "
+          f"{'wasted':>6} {'429s':>5} {'failed':>6} {'time':>6}")
+    results = []
+    for concurrency in parse_list(args.concurrency, int):
+        for rpm in parse_list(args.rpm):
+            r = run_benchmark(questions, topics, config, args.keys, concurrency, rpm, args.group_size, args.max_wait)
+            results.append((concurrency, rpm, r))
+            left = f"  ⚠️ {r['left']} left without quota" if r["left"] else ""
+            print(f"  {concurrency:>4} {rpm:>5g} {r['qps']:>6.2f} {r['p50']:>5.1f}s {r['p95']:>5.1f}s "
+                  f"{r['requests']:>8} {r['retries']:>7} {r['wasted']:>6} {r['rate_limited']:>5} "
+                  f"{r['failed']:>6} {r['seconds']:>5.0f}s{left}", flush=True)
+
+    concurrency, rpm, best = max(results, key=lambda x: (x[2]["qps"], -x[2]["wasted"]))
+    print(f"\n✓ Fastest: --concurrency {concurrency} --rpm {rpm:g} ({best['qps']:.2f} questions/s, "
+          f"{best['wasted']} wasted call(s))")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Keyword Rule Benchmark
+Matches the textbook index terms against KEYWORD_RULES with the per-rule
+regexes (the old build_topics loop) and with the one-pass keyword automaton,
+at several multiples of the current term volume, checks that both pick the
+same rule for every term and reports the time each takes.
+
+Terms beyond the real ones are made by joining words of two random real terms
+("cache coherence protocol" + "page table" -> "cache page table"), so they
+look like index entries and hit and miss rules as the real ones do.
+    python3 app/benchmark_keywords.py --scales 1,10,100
+"""
+
+import argparse
+import random
+import time
+
+from build_topics import KEYWORD_RULES, RAW_FILE
+from keyword_automaton import RegexRules, RuleMatcher
+
+
+def scaled_terms(terms: list[str], scale: int, seed: int = 0) -> list[str]:
+    """The real terms plus synthetic ones, scale times as many in total."""
+    rng = random.Random(seed)
+    out = list(terms)
+    while len(out) < len(terms) * scale:
+        a, b = rng.choice(terms).split(), rng.choice(terms).split()
+        out.append(" ".join(a[:rng.randint(1, len(a))] + b[rng.randint(0, len(b) - 1):]))
+    return out
+
+
+def timed_rules(matcher, terms: list[str]) -> tuple[list, float]:
+    start = time.perf_counter()
+    rules = [matcher.first_rule(term) for term in terms]
+    return rules, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark KEYWORD_RULES matching: per-rule regexes vs one automaton")
+    parser.add_argument("--scales", default="1,10,100", help="Comma-separated multiples of the term list (default: 1,10,100)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed of the synthetic terms")
+    args = parser.parse_args()
+
+    if not RAW_FILE.exists():
+        print("Error: raw_terms.txt not found.")
+        return
+    terms = [line.strip() for line in RAW_FILE.read_text().splitlines() if line.strip()]
+    patterns = [pattern for pattern, *_ in KEYWORD_RULES]
+
+    start = time.perf_counter()
+    matcher = RuleMatcher(patterns)
+    build_seconds = time.perf_counter() - start
+    reference = RegexRules(patterns)
+    print(f"{len(patterns)} rules -> {matcher.keyword_count} keywords in {len(matcher.automaton.next)} automaton states "
+          f"({len(matcher.regexes)} rule(s) left as regexes), built in {build_seconds * 1000:.1f} ms\n")
+
+    print(f"  {'scale':>5} {'terms':>8} {'regexes':>9} {'automaton':>9} {'speedup':>7} {'matched':>8}")
+    all_same = True
+    for scale in [int(s) for s in args.scales.split(",") if s.strip()]:
+        batch = scaled_terms(terms, scale, args.seed)
+        expected, regex_seconds = timed_rules(reference, batch)
+        actual, automaton_seconds = timed_rules(matcher, batch)
+        differing = [t for t, e, a in zip(batch, expected, actual) if e != a]
+        all_same = all_same and not differing
+        matched = sum(rule is not None for rule in actual)
+        mark = "" if not differing else f"  ❌ {len(differing)} differ, e.g. {differing[0]!r}"
+        print(f"  {scale:>4}x {len(batch):>8} {regex_seconds:>8.2f}s {automaton_seconds:>8.2f}s "
+              f"{regex_seconds / max(automaton_seconds, 1e-9):>6.1f}x {matched:>8}{mark}", flush=True)
+
+    print("\n✓ Same rule for every term" if all_same else "\n❌ Matchers disagree")
+
+
+if __name__ == "__main__":
+    main()
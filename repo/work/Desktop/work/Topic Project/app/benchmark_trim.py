@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Trim Engine Benchmark
+Crops every question of the selected exams twice, with the per-image trim passes
+(combine_multipage_crop + trim_whitespace_bottom) and with cached row-content
+profiles (crop_question_image), checks that both give the same pixels and
+reports the time each takes.
+
+Besides the planned crops, each question is also cropped with its box stretched
+past the page edges, so the padding rules are compared as well.
+"""
+
+import argparse
+import time
+from dataclasses import replace
+
+import numpy as np
+
+from content_profile import PageProfiles
+from pdf_backend import BACKENDS, open_pdf
+from question_cropper import (
+    DPI, combine_crop_segments, combine_multipage_crop, crop_question_image, parse_exam_folders,
+    plan_exam_crops, render_crop_segments, trim_rendered_segments, trim_whitespace_bottom
+)
+
+
+def same_pixels(a, b) -> bool:
+    return a.size == b.size and a.mode == b.mode and np.array_equal(np.asarray(a), np.asarray(b))
+
+
+def stretched(crop):
+    """The crop with its box pushed past every page edge."""
+    return replace(crop, x1=crop.x1 - 25, y1=crop.y1 - 40, x2=crop.x2 + 25, y2=crop.y2 + 400)
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark and verify the row-profile trim engine")
+    parser.add_argument("--exam", action="append", default=[],
+                        help="Only exams whose folder name contains this (repeatable)")
+    parser.add_argument("--limit", type=int, default=3, help="Benchmark at most N exams (default: 3)")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="pymupdf",
+                        help="Backend used to render the test pages (default: pymupdf)")
+    args = parser.parse_args()
+
+    exams = [e for e in parse_exam_folders()
+             if not args.exam or any(s in e.folder_name for s in args.exam)][:args.limit]
+    if not exams:
+        print("❌ No exams found.")
+        return
+
+    totals = {'images': [0.0, 0.0], 'arrays': [0.0, 0.0], 'clips': [0.0, 0.0]}
+    mismatches = 0
+    checked = 0
+
+    for exam in exams:
+        crops = plan_exam_crops(exam.pdf_path)
+        crops += [stretched(c) for c in crops]
+
+        with open_pdf(exam.pdf_path, args.backend) as doc:
+            images = [doc.render(n, DPI, grayscale=True) for n in range(doc.page_count)]
+            clips = [render_crop_segments(doc, crop) for crop in crops]
+        sources = {'images': images, 'arrays': [np.asarray(img) for img in images]}
+
+        print(f"{exam.display_name} ({len(crops)} crops incl. stretched)")
+        for name, pages in sources.items():
+            old, old_time = timed(lambda: [trim_whitespace_bottom(combine_multipage_crop(pages, c))
+                                           for c in crops])
+            profiles = PageProfiles(pages)
+            new, new_time = timed(lambda: [crop_question_image(pages, c, profiles) for c in crops])
+            bad = sum(not same_pixels(a, b) for a, b in zip(old, new))
+            mismatches += bad
+            checked += len(crops)
+            totals[name][0] += old_time
+            totals[name][1] += new_time
+            print(f"  pages as {name:<7} {old_time:7.3f}s -> {new_time:7.3f}s  "
+                  f"{'✓ identical' if not bad else f'❌ {bad} differ'}")
+
+        old, old_time = timed(lambda: [trim_whitespace_bottom(combine_crop_segments(s)) for s in clips])
+        new, new_time = timed(lambda: [trim_rendered_segments(s) for s in clips])
+        bad = sum(not same_pixels(a, b) for a, b in zip(old, new))
+        mismatches += bad
+        checked += len(clips)
+        totals['clips'][0] += old_time
+        totals['clips'][1] += new_time
+        print(f"  clip renders    {old_time:7.3f}s -> {new_time:7.3f}s  "
+              f"{'✓ identical' if not bad else f'❌ {bad} differ'}")
+
+    print("\nTotals (trim passes -> row profiles)")
+    for name, (old_time, new_time) in totals.items():
+        speedup = old_time / new_time if new_time else float('inf')
+        print(f"  {name:<7} {old_time:7.3f}s -> {new_time:7.3f}s  ({speedup:.1f}x)")
+
+    if mismatches:
+        print(f"❌ {mismatches} of {checked} crops differ")
+        raise SystemExit(1)
+    print(f"✅ All {checked} crops are pixel-identical")
+
+
+if __name__ == "__main__":
+    main()
@@ -14,13 +14,18 @@ from dataclasses import dataclass
 
 # Import crop logic for fallback extraction
 sys.path.append(str(Path(__file__).parent))
-from question_cropper import parse_exam_folders, extract_text_from_crop
+from question_cropper import parse_exam_folders, extract_texts_from_crops
+from pdf_backend import add_backend_argument, set_backend
+from image_encoder import image_formats
+from build_thumbnails import thumbnail_info
+from state_store import StateStore
+from term_tagger import tag_corpus
+from PIL import Image
 
 BASE_DIR = Path(__file__).parent.parent
-PROGRESS_FILE = BASE_DIR / "data" / "state" / ".cropper_progress.json"
 OUTPUT_DIR = BASE_DIR / "data" / "output" / "cropped_questions"
 WEB_DATA_FILE = BASE_DIR / "web" / "data.js"
-STATE_FILE = BASE_DIR / "data" / "state" / ".search_index_state.json"
+MAX_INDEX_TERMS = 8  # Textbook terms shown per question, highest weight first
 
 @dataclass
 class CropWrapper:
@@ -52,47 +57,28 @@ def get_file_hash(filepath):
     with open(filepath, 'rb') as f:
         return hashlib.md5(f.read()).hexdigest()
 
-def load_state():
-    """Load previous processing state."""
-    if STATE_FILE.exists():
-        try:
-            with open(STATE_FILE) as f:
-                return json.load(f)
-        except:
-            pass
-    return {"processed": {}, "index": []}
-
-def save_state(state):
-    """Save processing state."""
-    with open(STATE_FILE, 'w') as f:
-        json.dump(state, f, indent=2)
-
 def build_index(force=False):
     """Build search index."""
     
-    if not PROGRESS_FILE.exists():
-        print("No progress file found. Run question_cropper.py first.")
-        return
-
+    store = StateStore()
     print("Loading progress data...")
-    with open(PROGRESS_FILE) as f:
-        progress_data = json.load(f)
+    progress_data = store.all_crops()
+    if not progress_data:
+        print("No cropped questions found. Run question_cropper.py first.")
+        return
 
     # Load previous state
-    state = load_state()
-    processed_hashes = state.get("processed", {})
-    existing_index = {r["id"]: r for r in state.get("index", [])}
+    existing_index = store.index_records()
     
     # Prepare Data Structures
     exams = parse_exam_folders()
     exam_map = {e.output_folder: e for e in exams}
     
-    # Load all tags from question_tags.json
-    all_tags = {}
-    tags_file = BASE_DIR / "data" / "output" / "question_tags.json"
-    if tags_file.exists():
-        with open(tags_file) as f:
-            all_tags = json.load(f)
+    # Load all classifier tags
+    all_tags = store.tags()
+    
+    # Copies of each question in other exams (find_duplicates.py)
+    duplicates = store.duplicates()
              
     # Prepare list of items
     items_to_keep = set()
@@ -105,6 +91,7 @@ def build_index(force=False):
             continue
             
         exam_info = exam_map[exam_folder]
+        exam_texts = None  # question_num -> text, extracted for the whole exam on first need
         
         for crop_data in crops:
             if not crop_data.get('confirmed'):
@@ -125,6 +112,16 @@ def build_index(force=False):
             # But mostly we care if text is missing
             
             current_hash = get_file_hash(img_path)
+            # Image formats on disk, smallest first (the web UI serves the first one it supports),
+            # full-resolution size and the thumbnail pyramid shown in the results grid
+            with Image.open(img_path) as img:  # Reads the header only
+                width, height = img.size
+            image_fields = {
+                "formats": image_formats(img_path),
+                "width": width,
+                "height": height,
+                "thumbs": thumbnail_info(img_path),
+            }
             # Tag lookup
             img_rel_path = f"{exam_folder}/Q{q_num:02d}.png"
             tag_info = all_tags.get(img_rel_path, {})
@@ -146,6 +143,7 @@ def build_index(force=False):
             elif existing_index[item_id].get('tag') != tag:
                 # Just update tag, no need to re-extract text
                 existing_index[item_id]['tag'] = tag
+                existing_index[item_id].update(image_fields)
                 new_index.append(existing_index[item_id])
                 continue
                 
@@ -154,6 +152,7 @@ def build_index(force=False):
                 existing_index[item_id]['term'] = "April" if exam_info.session == "S" else "October"
                 existing_index[item_id]['type'] = "Morning" if exam_info.exam_type == "A" else "Afternoon"
                 existing_index[item_id]['year'] = exam_info.year
+                existing_index[item_id].update(image_fields)
                 new_index.append(existing_index[item_id])
                 continue
                 
@@ -165,10 +164,13 @@ def build_index(force=False):
             if not text:
                 print(f"Extracting text for {item_id} from PDF...")
                 try:
-                    crop_obj = CropWrapper.from_dict(crop_data)
-                    text = extract_text_from_crop(exam_info.pdf_path, crop_obj)
-                    if not text:
-                        text = ""
+                    if exam_texts is None:
+                        crop_objs = [CropWrapper.from_dict(c) for c in crops]
+                        exam_texts = dict(zip(
+                            (c.question_num for c in crop_objs),
+                            extract_texts_from_crops(exam_info.pdf_path, crop_objs)
+                        ))
+                    text = exam_texts.get(q_num) or ""
                 except Exception as e:
                     print(f"Failed extraction fallback for {item_id}: {e}")
             
@@ -181,6 +183,7 @@ def build_index(force=False):
                 "type": "Morning" if exam_info.exam_type == "A" else "Afternoon",
                 "q_num": q_num,
                 "img_path": f"../cropped_questions/{exam_folder}/Q{q_num:02d}.png",
+                **image_fields,
                 "text": text,
                 "tag": tag,
                 "_hash": current_hash
@@ -188,7 +191,6 @@ def build_index(force=False):
             
             new_index.append(record)
             existing_index[item_id] = record
-            processed_hashes[item_id] = current_hash
             updated_count += 1
             
             if updated_count % 10 == 0:
@@ -199,6 +201,40 @@ def build_index(force=False):
     # Sort
     new_index.sort(key=lambda x: (-x.get('year', 0), x.get('q_num', 0)))
     
+    # "Also appeared in" links: ids of the question's copies that are in the index, newest first
+    position = {item['id']: n for n, item in enumerate(new_index)}
+    linked = 0
+    for item in new_index:
+        img_rel_path = f"{item['exam_id']}/Q{item['q_num']:02d}.png"
+        also_in = [f"{rel_path.split('/')[0]}_{Path(rel_path).stem}" for rel_path in duplicates.get(img_rel_path, [])]
+        also_in = sorted((i for i in also_in if i in position), key=position.get)
+        if also_in:
+            item['also_in'] = also_in
+            linked += 1
+        else:
+            item.pop('also_in', None)
+    if linked:
+        print(f"Linked {linked} questions to their copies in other exams")
+
+    # Textbook index terms each question mentions and its best-matching section (term_tagger.py)
+    term_tags = tag_corpus(store, {f"{item['exam_id']}/Q{item['q_num']:02d}.png": item.get('text', "")
+                                   for item in new_index})
+    with_terms = 0
+    for item in new_index:
+        found = term_tags.get(f"{item['exam_id']}/Q{item['q_num']:02d}.png", {})
+        terms = sorted(found.get('terms', []), key=lambda t: -t['weight'])[:MAX_INDEX_TERMS]
+        if terms:
+            item['terms'] = [t['term'] for t in terms]
+            with_terms += 1
+        else:
+            item.pop('terms', None)
+        if found.get('sections'):
+            best = found['sections'][0]
+            item['section'] = f"{best['category']} > {best['subcategory']}"
+        else:
+            item.pop('section', None)
+    print(f"Tagged {with_terms} questions with textbook terms")
+    
     # Save JS
     # Remove internal fields for output
     output_index = []
@@ -211,12 +247,9 @@ def build_index(force=False):
     with open(WEB_DATA_FILE, 'w') as f:
         f.write(f"window.SEARCH_DATA = {json_str};")
         
-    # Save State
-    state = {
-        "processed": processed_hashes,
-        "index": new_index
-    }
-    save_state(state)
+    # Save State (one transaction; items no longer in the index are dropped)
+    store.save_index_records(new_index)
+    store.close()
     
     print(f"✓ Index built successfully! {len(output_index)} items.")
 
@@ -224,5 +257,8 @@ if __name__ == "__main__":
     import argparse
     parser = argparse.ArgumentParser()
     parser.add_argument("--force", "-f", action="store_true", help="Force rebuild")
+    add_backend_argument(parser)
     args = parser.parse_args()
+    if args.backend:
+        set_backend(args.backend)
     build_index(force=args.force)
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Build Thumbnail Pyramid for Cropped Questions
+Writes a small and a medium version of every cropped question next to the
+full-resolution image, so the results grid can show cards without downloading
+150-DPI scans. Incremental: only crops that are new or changed since their
+thumbnails were written are processed, in parallel across cores.
+"""
+
+import os
+from pathlib import Path
+
+from PIL import Image
+
+from image_encoder import add_variants_argument, image_formats, save_question_image, set_variants
+
+BASE_DIR = Path(__file__).parent.parent
+SOURCE_DIR = BASE_DIR / "data" / "output" / "cropped_questions"
+THUMB_DIR = BASE_DIR / "data" / "output" / "thumbnails"
+THUMB_WIDTHS = {"small": 400, "medium": 800}  # Maximum width of each level in pixels
+
+
+def thumbnail_path(source: Path, level: str) -> Path:
+    """Path of one pyramid level of a cropped question, e.g. thumbnails/2024A_A/Q01_small.png."""
+    return THUMB_DIR / source.parent.name / f"{source.stem}_{level}.png"
+
+
+def is_up_to_date(source: Path) -> bool:
+    """Check if every thumbnail of a crop exists and is newer than the crop."""
+    source_mtime = source.stat().st_mtime
+    for level in THUMB_WIDTHS:
+        path = thumbnail_path(source, level)
+        if not path.exists() or path.stat().st_mtime < source_mtime:
+            return False
+    return True
+
+
+def make_thumbnails(source: Path) -> Path:
+    """Write every pyramid level of one cropped question."""
+    with Image.open(source) as img:
+        img = img.convert("RGB" if img.mode in ("RGB", "RGBA") else "L")
+    for level, max_width in THUMB_WIDTHS.items():
+        thumb = img
+        if img.width > max_width:
+            height = max(1, round(img.height * max_width / img.width))
+            thumb = img.resize((max_width, height), Image.Resampling.LANCZOS)
+        path = thumbnail_path(source, level)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        save_question_image(thumb, path)
+    return source
+
+
+def thumbnail_info(source: Path) -> dict:
+    """
+    Describe the pyramid of a cropped question for the web UI.
+
+    Returns:
+        {level: {"path", "width", "height", "formats"}} for every level on disk
+    """
+    info = {}
+    for level in THUMB_WIDTHS:
+        path = thumbnail_path(source, level)
+        if not path.exists():
+            continue
+        with Image.open(path) as img:  # Reads the header only
+            width, height = img.size
+        info[level] = {
+            "path": f"../thumbnails/{source.parent.name}/{path.name}",
+            "width": width,
+            "height": height,
+            "formats": image_formats(path),
+        }
+    return info
+
+
+def remove_orphans(sources: list[Path]) -> int:
+    """Delete thumbnails whose cropped question no longer exists."""
+    if not THUMB_DIR.exists():
+        return 0
+    expected = {thumbnail_path(s, level).with_suffix("") for s in sources for level in THUMB_WIDTHS}
+    removed = 0
+    for path in THUMB_DIR.glob("*/*_*.*"):
+        if path.with_suffix("") not in expected:
+            path.unlink()
+            removed += 1
+    return removed
+
+
+def build_thumbnails(force: bool = False, jobs: int = None):
+    """Build missing or outdated thumbnails on a process pool."""
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    sources = sorted(SOURCE_DIR.glob("*/Q*.png"))
+    todo = sources if force else [s for s in sources if not is_up_to_date(s)]
+    removed = remove_orphans(sources)
+
+    if not todo:
+        print(f"✓ Thumbnails already up to date ({len(sources)} crops).")
+        if removed:
+            print(f"  Removed {removed} orphaned thumbnail files")
+        return
+
+    jobs = jobs or os.cpu_count() or 1
+    print(f"Building thumbnails for {len(todo)} of {len(sources)} crops with {jobs} worker(s)...")
+    failed = 0
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = {pool.submit(make_thumbnails, s): s for s in todo}
+        for n, future in enumerate(as_completed(futures), 1):
+            try:
+                future.result()
+            except Exception as e:
+                failed += 1
+                print(f"\n❌ {futures[future].relative_to(SOURCE_DIR)}: {e}")
+            if n % 100 == 0:
+                print(f"  {n}/{len(todo)}...", end="\r")
+
+    print(f"\n✓ Thumbnails built: {len(todo) - failed} crops ({', '.join(THUMB_WIDTHS)})")
+    if removed:
+        print(f"  Removed {removed} orphaned thumbnail files")
+    if failed:
+        print(f"  {failed} crop(s) failed; re-run to retry")
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Build small/medium thumbnails of cropped questions")
+    parser.add_argument("--force", "-f", action="store_true", help="Rebuild every thumbnail")
+    parser.add_argument("--jobs", "-j", type=int, default=None,
+                        help="Worker processes (default: CPU count)")
+    add_variants_argument(parser)
+    args = parser.parse_args()
+    if args.variants is not None:
+        set_variants(args.variants)
+
+    build_thumbnails(force=args.force, jobs=args.jobs)
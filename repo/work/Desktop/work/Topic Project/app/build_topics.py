@@ -3,12 +3,20 @@
 Build Topics Taxonomy for FE Question Bank
 Aligned with New FE Textbook Vol 1 & 2
 Structure: Chapter (Category) > Section (Subcategory) > Topic (Specific)
+
+Terms are matched against KEYWORD_RULES in one pass (keyword_automaton.py).
+Check that this gives the same taxonomy as trying each rule's regex in turn,
+without writing topics.json:
+    python3 app/build_topics.py --check
 """
 
 import json
 import re
 from pathlib import Path
 
+from classifier_journal import Journal
+from keyword_automaton import RegexRules, RuleMatcher
+
 BASE_DIR = Path(__file__).parent.parent
 RAW_FILE = BASE_DIR / "data" / "output" / "raw_terms.txt"
 OUTPUT_FILE = BASE_DIR / "data" / "output" / "topics.json"
@@ -111,21 +119,21 @@ def clean_term(term):
     term = term.strip()
     return term
 
-def build_taxonomy():
-    if not RAW_FILE.exists():
-        print("Error: raw_terms.txt not found.")
-        return
-    
-    with open(RAW_FILE) as f:
-        raw_list = f.readlines()
-        
-    taxonomy = {}
-    
-    # Pre-compile regex
-    compiled_rules = []
-    for pattern, cat, sub, *top in KEYWORD_RULES:
-        compiled_rules.append((re.compile(pattern, re.IGNORECASE), cat, sub, top[0] if top else "General"))
+def rule_patterns():
+    return [pattern for pattern, *_ in KEYWORD_RULES]
+
+def assign_terms(raw_list, matcher):
+    """
+    Sort raw index terms into the taxonomy by their first matching rule.
+
+    Args:
+        raw_list: Lines of raw_terms.txt
+        matcher: RuleMatcher (or RegexRules) over KEYWORD_RULES
 
+    Returns:
+        {chapter: {section: {topic: sorted terms}}}, keys sorted
+    """
+    taxonomy = {}
     for line in raw_list:
         original_term = line.strip()
         if not original_term: continue
@@ -134,14 +142,12 @@ def build_taxonomy():
         if not term_clean or term_clean.lower() in BLACKLIST or len(term_clean) < 2:
             continue
             
-        for regex, cat, sub, top in compiled_rules:
-            if regex.search(original_term):
-                if cat not in taxonomy: taxonomy[cat] = {}
-                if sub not in taxonomy[cat]: taxonomy[cat][sub] = {}
-                if top not in taxonomy[cat][sub]: taxonomy[cat][sub][top] = []
-                
-                taxonomy[cat][sub][top].append(original_term)
-                break # Stop at first match (priority)
+        rule = matcher.first_rule(original_term)  # First match wins (priority)
+        if rule is None:
+            continue
+        _, cat, sub, *top = KEYWORD_RULES[rule]
+        top = top[0] if top else "General"
+        taxonomy.setdefault(cat, {}).setdefault(sub, {}).setdefault(top, []).append(original_term)
 
     # Sort and clean
     sorted_taxonomy = {}
@@ -153,10 +159,61 @@ def build_taxonomy():
                 terms = sorted(list(set(taxonomy[cat][sub][top])))
                 if terms:
                     sorted_taxonomy[cat][sub][top] = terms
+    return sorted_taxonomy
+
+def read_raw_terms():
+    if not RAW_FILE.exists():
+        print("Error: raw_terms.txt not found.")
+        return None
+    with open(RAW_FILE) as f:
+        return f.readlines()
 
-    with open(OUTPUT_FILE, 'w') as f:
-        json.dump(sorted_taxonomy, f, indent=2)
+def build_taxonomy():
+    raw_list = read_raw_terms()
+    if raw_list is None:
+        return
+
+    sorted_taxonomy = assign_terms(raw_list, RuleMatcher(rule_patterns()))
+
+    # Under the journal lock, so a classifier worker cannot journal a topic between the two
+    journal = Journal()
+    with journal.locked():
+        with open(OUTPUT_FILE, 'w') as f:
+            json.dump(sorted_taxonomy, f, indent=2)
+        journal.clear()  # Topics journaled by the classifier belong to the old taxonomy
     print(f"✓ FE Textbook-Aligned Taxonomy Rebuilt! Saved to {OUTPUT_FILE}")
 
+def check_taxonomy():
+    """Golden check: the one-pass matcher must give the same taxonomy as the per-rule regexes."""
+    raw_list = read_raw_terms()
+    if raw_list is None:
+        return False
+    patterns = rule_patterns()
+    expected = assign_terms(raw_list, RegexRules(patterns))
+    actual = assign_terms(raw_list, RuleMatcher(patterns))
+    if actual == expected:
+        count = sum(len(terms) for subs in actual.values() for topics in subs.values() for terms in topics.values())
+        print(f"✓ Same taxonomy from both matchers ({count} terms in {len(actual)} chapters)")
+        return True
+
+    def flatten(taxonomy):
+        return {term: (cat, sub, top) for cat, subs in taxonomy.items() for sub, topics in subs.items()
+                for top, terms in topics.items() for term in terms}
+    expected, actual = flatten(expected), flatten(actual)
+    differing = sorted(t for t in expected.keys() | actual.keys() if expected.get(t) != actual.get(t))
+    print(f"❌ {len(differing)} term(s) placed differently:")
+    for term in differing[:20]:
+        print(f"  {term}: expected {expected.get(term)}, got {actual.get(term)}")
+    return False
+
 if __name__ == "__main__":
+    import argparse
+    import sys
+    parser = argparse.ArgumentParser(description="Rebuild topics.json from the textbook index terms")
+    parser.add_argument("--check", action="store_true",
+                        help="Compare the one-pass matcher with the per-rule regexes instead of writing")
+    args = parser.parse_args()
+
+    if args.check:
+        sys.exit(0 if check_taxonomy() else 1)
     build_taxonomy()
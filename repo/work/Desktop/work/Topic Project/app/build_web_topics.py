@@ -3,19 +3,19 @@ import json
 import os
 from pathlib import Path
 
+from state_store import StateStore
+
 BASE_DIR = Path(__file__).parent.parent
-TAGS_FILE = BASE_DIR / "data" / "output" / "question_tags.json"
 TOPICS_FILE = BASE_DIR / "data" / "output" / "topics.json"
 OUTPUT_FILE = BASE_DIR / "web" / "topics_data.js"
 
 def build_web_topics():
-    if not TAGS_FILE.exists():
-        print("No question_tags.json found. Run classifier first.")
+    with StateStore() as store:
+        tags = store.tags()
+    if not tags:
+        print("No question tags found. Run classifier first.")
         return
 
-    with open(TAGS_FILE, "r") as f:
-        tags = json.load(f)
-
     # Structure: { Category: { Subcategory: { Topic: [item_ids] } } }
     hierarchy = {}
 
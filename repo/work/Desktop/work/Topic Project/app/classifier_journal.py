@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Classifier Journal
+Append-only, fsync'd JSONL journal for what the classifier adds to the
+canonical JSON files, plus the compaction step that folds it back in.
+
+  - topics the model suggests are appended to data/state/classifier_journal.jsonl
+    instead of rewriting all of topics.json each time one appears
+  - compact() writes topics.json (snapshot + journal) and question_tags.json
+    (from the state store) atomically, then empties the journal
+
+load_topics() always returns snapshot + journal, so readers never need to know
+whether a compaction has run. A crash mid-append leaves at most one partial
+last line, which is ignored; a crash mid-compaction leaves the old snapshot and
+the journal, which replays to the same result.
+
+Appends and compactions take an exclusive lock on classifier_journal.jsonl.lock,
+so several classifier workers can share the journal without a compaction
+dropping another worker's appends.
+"""
+
+import json
+import os
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks; run one classifier at a time
+    fcntl = None
+
+BASE_DIR = Path(__file__).parent.parent
+JOURNAL_FILE = BASE_DIR / "data" / "state" / "classifier_journal.jsonl"
+TOPICS_FILE = BASE_DIR / "data" / "output" / "topics.json"
+TAGS_FILE = BASE_DIR / "data" / "output" / "question_tags.json"
+COMPACT_INTERVAL = 300  # Seconds between compactions during a classifier run
+
+
+def _fsync_dir(path: Path):
+    """Persist a rename in a directory (no-op where directories cannot be opened)."""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def write_json_durable(path: Path, data):
+    """Write a JSON file atomically and fsync it, so a crash leaves the old or the new file."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp_file, "w") as f:
+        json.dump(data, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_file, path)
+    _fsync_dir(path.parent)
+
+
+class Journal:
+    """Append-only JSONL file; every record is on disk before append() returns."""
+
+    def __init__(self, path: Path = None):
+        self.path = Path(path or JOURNAL_FILE)
+        self._file = None
+
+    @contextmanager
+    def locked(self):
+        """Hold the journal's inter-process lock."""
+        if fcntl is None:
+            yield
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path.with_name(self.path.name + ".lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def append(self, record: dict):
+        with self.locked():
+            self._append(record)
+
+    def _append(self, record: dict):
+        if self._file is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.path, "a", encoding="utf-8")
+            if self._file.tell() and not self.path.read_bytes().endswith(b"\n"):
+                self._file.write("\n")  # Start after a line torn by a crash
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def records(self) -> list[dict]:
+        """Every complete record, oldest first (a torn last line from a crash is skipped)."""
+        if not self.path.exists():
+            return []
+        records = []
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+        return records
+
+    def clear(self):
+        """Empty the journal after its records are in a snapshot."""
+        self.close()
+        if self.path.exists():
+            with open(self.path, "w") as f:
+                os.fsync(f.fileno())
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def apply_topic(topics: dict, category: str, subcategory: str, topic: str) -> bool:
+    """Add a topic to a taxonomy dict. Returns True if it was new."""
+    subcategories = topics.setdefault(category, {})
+    specific_topics = subcategories.setdefault(subcategory, {})
+    if topic in specific_topics:
+        return False
+    specific_topics[topic] = []
+    return True
+
+
+def load_topics(journal: Journal = None) -> dict:
+    """Topic taxonomy: topics.json with the journaled additions replayed on top."""
+    topics = {}
+    if TOPICS_FILE.exists():
+        with open(TOPICS_FILE) as f:
+            topics = json.load(f)
+    for record in (journal or Journal()).records():
+        if record.get("kind") == "topic":
+            apply_topic(topics, record["category"], record["subcategory"], record["topic"])
+    return topics
+
+
+def add_topic(topics: dict, journal: Journal, category: str, subcategory: str, topic: str) -> bool:
+    """Add a topic to the in-memory taxonomy and journal it if it is new."""
+    if not apply_topic(topics, category, subcategory, topic):
+        return False
+    journal.append({"kind": "topic", "category": category, "subcategory": subcategory, "topic": topic})
+    return True
+
+
+def compact(store=None, journal: Journal = None):
+    """
+    Fold the journal into topics.json and export the store's tags to question_tags.json.
+
+    Args:
+        store: StateStore to export tags from (tags are left alone if None)
+        journal: Journal to fold (default: the classifier journal)
+    """
+    journal = journal or Journal()
+    with journal.locked():
+        write_json_durable(TOPICS_FILE, load_topics(journal))
+        if store is not None:
+            write_json_durable(TAGS_FILE, store.tags())
+        journal.clear()
+
+
+if __name__ == "__main__":
+    import argparse
+    from state_store import StateStore
+
+    parser = argparse.ArgumentParser(description="Fold the classifier journal into topics.json and question_tags.json")
+    parser.parse_args()
+
+    journal = Journal()
+    pending = len(journal.records())
+    with StateStore() as store:
+        compact(store, journal)
+    print(f"✓ Compacted {pending} journal record(s) into {TOPICS_FILE.name} and {TAGS_FILE.name}")
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Classification Cache
+Content-addressed store of parsed classifier results, so an unchanged question
+is never sent to the API twice. The key is a hash of everything the answer
+depends on:
+
+    cropped PNG bytes, OCR text, topic list in the prompt, prompt version, model name
+
+Re-running the classifier after reset_classifier.sh, or after re-confirming a
+crop that came out identical, costs no quota. Entries live in
+data/state/classification_cache.db and survive resets; clear them with
+    python3 app/classify_cache.py --clear
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).parent.parent
+CACHE_FILE = BASE_DIR / "data" / "state" / "classification_cache.db"
+
+
+def cache_key(image_bytes: bytes, ocr_text: str, topic_list: str, prompt_version, model_name: str) -> str:
+    """Hash of every input of one classification."""
+    h = hashlib.sha256()
+    h.update(hashlib.sha256(image_bytes).digest())
+    for part in (ocr_text or "", topic_list, str(prompt_version), model_name):
+        data = part.encode("utf-8")
+        h.update(len(data).to_bytes(8, "big"))  # Length-prefixed, so parts cannot run together
+        h.update(data)
+    return h.hexdigest()
+
+
+class ClassificationCache:
+    """Thread-safe result cache (one SQLite connection shared by the classifier's workers)."""
+
+    def __init__(self, path: Path = None):
+        self.path = Path(path or CACHE_FILE)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        with self.conn:
+            self.conn.execute("CREATE TABLE IF NOT EXISTS results ("
+                              "key TEXT PRIMARY KEY, result TEXT NOT NULL, created_at REAL NOT NULL)")
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str):
+        """Cached result for a key, or None. Every result returned counts as a hit."""
+        with self._lock:
+            row = self.conn.execute("SELECT result FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self.hits += 1
+            return json.loads(row[0])
+
+    def __contains__(self, key: str) -> bool:
+        """Whether a key is cached (not counted as a hit)."""
+        with self._lock:
+            return self.conn.execute("SELECT 1 FROM results WHERE key = ?", (key,)).fetchone() is not None
+
+    def put(self, key: str, result):
+        """Store the result of an API call. Every stored result counts as a miss."""
+        with self._lock:
+            self.misses += 1
+            with self.conn:
+                self.conn.execute("INSERT OR REPLACE INTO results (key, result, created_at) VALUES (?, ?, ?)",
+                                  (key, json.dumps(result, ensure_ascii=False), time.time()))
+
+    def clear(self):
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM results")
+
+    def __len__(self):
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def stats_str(self) -> str:
+        total = self.hits + self.misses
+        rate = f" ({self.hits / total:.0%} hit rate)" if total else ""
+        return f"Cache: {self.hits} hits, {self.misses} misses{rate}, {len(self)} entries"
+
+    def close(self):
+        self.conn.close()
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Classification result cache")
+    parser.add_argument("--clear", action="store_true", help="Delete every cached result")
+    args = parser.parse_args()
+
+    cache = ClassificationCache()
+    if args.clear:
+        cache.clear()
+        print("✓ Cleared the classification cache")
+    size = cache.path.stat().st_size / 1024 if cache.path.exists() else 0
+    print(f"{cache.path.relative_to(BASE_DIR)}: {len(cache)} cached results ({size:.0f} KB)")
+    cache.close()
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Concurrent Classification Engine
+Runs classification calls on a thread pool, paced by a per-key rate limiter
+instead of a fixed sleep between requests:
+
+  - TokenBucket: steady refill with a burst allowance
+  - KeyLimiter: one key's requests-per-minute bucket plus adaptive backoff when
+    the API answers 429 (the minute rate is halved and then creeps back up with
+    every success)
+  - ClassificationEngine: up to `concurrency` calls in flight, each on a key
+    handed out by a scheduler (key_pool.KeyPool), results handed back in input
+    order so they are written deterministically
+
+The engine knows nothing about Gemini: it calls classify(item, key) and reacts
+to RateLimitError / QuotaExhaustedError / KeyDisabledError, which the caller
+raises from API errors.
+"""
+
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+
+DEFAULT_RPM = 15  # Gemini free tier
+DEFAULT_RPD = 1500
+DEFAULT_CONCURRENCY = 4
+MAX_ATTEMPTS = 2  # Calls per item that fail or return nothing before giving up
+MAX_RATE_LIMIT_STRIKES = 6  # Consecutive 429s before a key counts as exhausted
+MAX_RATE_LIMIT_RETRIES = 24  # 429s of one item, over all keys, before the run stops
+BACKOFF_BASE = 2.0  # Seconds; doubled with every consecutive 429
+BACKOFF_MAX = 120.0
+RECOVERY_STEP = 0.05  # Share of the configured rate regained per successful request
+
+
+class RateLimitError(Exception):
+    """The API refused a request for going too fast (HTTP 429)."""
+
+    def __init__(self, message: str = "", retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class QuotaExhaustedError(Exception):
+    """The key has no quota left (e.g. its daily limit is used up)."""
+
+
+class KeyDisabledError(Exception):
+    """The key cannot be used at all (invalid, revoked or without permission)."""
+
+
+def parse_retry_after(message: str) -> Optional[float]:
+    """Retry delay suggested in an API error message ("retry in 23.4s", "seconds: 23", "retryDelay: 23s"), if any."""
+    match = re.search(r"retry in ([\d.]+)\s*s", message, re.IGNORECASE) or \
+        re.search(r"retry_delay\s*\{\s*seconds:\s*(\d+)", message) or \
+        re.search(r"retryDelay['\"]?\s*:\s*['\"]?([\d.]+)s", message)
+    return float(match.group(1)) if match else None
+
+
+class TokenBucket:
+    """Token bucket: `rate` tokens per second, holding at most `capacity`."""
+
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.clock = clock
+        self.updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self) -> float:
+        """Seconds until a token is available (0 if one is available now)."""
+        self._refill()
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate if self.rate > 0 else float("inf")
+
+    def take(self):
+        self._refill()
+        self.tokens -= 1
+
+
+class KeyLimiter:
+    """Per-minute rate limit of one API key: a token bucket plus 429 backoff."""
+
+    def __init__(self, rpm: float = DEFAULT_RPM, clock: Callable[[], float] = time.monotonic):
+        self.rpm = rpm
+        self.minute = TokenBucket(rpm / 60.0, rpm, clock)
+        self.clock = clock
+        self.blocked_until = 0.0
+        self.strikes = 0  # Consecutive 429s
+        self._lock = threading.Lock()
+
+    def wait_time(self) -> float:
+        """Seconds until this key may send a request."""
+        with self._lock:
+            return max(0.0, self.blocked_until - self.clock(), self.minute.wait_time())
+
+    def reserve(self) -> float:
+        """Take a request slot if one is free now. Returns 0 if taken, else seconds to wait."""
+        with self._lock:
+            wait_for = max(self.blocked_until - self.clock(), self.minute.wait_time())
+            if wait_for <= 0:
+                self.minute.take()
+                return 0.0
+            return wait_for
+
+    def on_success(self):
+        with self._lock:
+            self.strikes = 0
+            # Additive increase back towards the configured rate
+            self.minute.rate = min(self.rpm / 60.0, self.minute.rate + RECOVERY_STEP * self.rpm / 60.0)
+
+    def on_rate_limited(self, retry_after: Optional[float] = None) -> int:
+        """
+        Back off after a 429: pause the key and halve its minute rate.
+
+        Returns:
+            Number of consecutive 429s so far
+        """
+        with self._lock:
+            self.strikes += 1
+            backoff = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (self.strikes - 1))
+            backoff = max(backoff * random.uniform(0.8, 1.2), retry_after or 0.0)
+            self.blocked_until = max(self.blocked_until, self.clock() + backoff)
+            self.minute.rate = max(1 / 60.0, self.minute.rate / 2)
+            return self.strikes
+
+
+@dataclass
+class Outcome:
+    """Result of one item: result is None if every attempt failed (error says why)."""
+    index: int
+    item: Any
+    result: Any = None
+    error: Optional[str] = None
+
+
+class ClassificationEngine:
+    """
+    Thread-pool runner for classification calls. Keys come from a scheduler
+    (key_pool.KeyPool) with these methods:
+        acquire() -> key         blocks for a free key; raises QuotaExhaustedError when none will be
+        on_success(key)          the call went through
+        on_rate_limited(key, retry_after) -> int   consecutive 429s of the key so far
+        on_exhausted(key)        the key's quota is used up
+        on_error(key, fatal)     any other failure (fatal: the key itself is unusable)
+    """
+
+    def __init__(self, classify: Callable[[Any, Any], Any], scheduler,
+                 concurrency: int = DEFAULT_CONCURRENCY, max_attempts: int = MAX_ATTEMPTS,
+                 lookup: Optional[Callable[[Any], Any]] = None):
+        """
+        Args:
+            classify: Makes one API call for an item with a key; returns a result, or None if
+                the response was unusable. Raises RateLimitError / QuotaExhaustedError /
+                KeyDisabledError for API errors about the key.
+            scheduler: Hands out keys and tracks their limits
+            concurrency: Maximum calls in flight
+            max_attempts: Calls per item that fail or return None before giving up
+            lookup: Returns a stored result for an item, or None. Consulted before a key is
+                taken, so items it answers use no quota.
+        """
+        self.classify = classify
+        self.scheduler = scheduler
+        self.concurrency = max(1, concurrency)
+        self.max_attempts = max_attempts
+        self.lookup = lookup
+        self._stop = threading.Event()
+
+    def _run_one(self, index: int, item) -> Outcome:
+        if self.lookup is not None:
+            cached = self.lookup(item)
+            if cached is not None:
+                return Outcome(index, item, cached)
+        attempts = 0
+        rate_limits = 0
+        error = None
+        while attempts < self.max_attempts:
+            if self._stop.is_set():
+                raise QuotaExhaustedError("stopped")
+            key = self.scheduler.acquire()
+            try:
+                result = self.classify(item, key)
+            except RateLimitError as e:
+                if self.scheduler.on_rate_limited(key, e.retry_after) >= MAX_RATE_LIMIT_STRIKES:
+                    self.scheduler.on_exhausted(key)  # Out of service until its quota resets
+                rate_limits += 1
+                if rate_limits >= MAX_RATE_LIMIT_RETRIES:
+                    raise QuotaExhaustedError(str(e)) from e
+                continue  # Not the item's fault; does not use up an attempt
+            except QuotaExhaustedError:
+                self.scheduler.on_exhausted(key)
+                continue
+            except KeyDisabledError:
+                self.scheduler.on_error(key, fatal=True)
+                continue
+            except Exception as e:
+                self.scheduler.on_error(key)
+                attempts += 1
+                error = str(e)
+                continue
+            self.scheduler.on_success(key)
+            if result is not None:
+                return Outcome(index, item, result)
+            attempts += 1
+            error = "Parse Error"
+        return Outcome(index, item, error=error)
+
+    def run(self, items: list, on_result: Callable[[Outcome], None]) -> list:
+        """
+        Classify items concurrently, calling on_result in input order from this thread.
+
+        Returns:
+            Items not handed back because every key ran out of quota, in order. Items that
+            finished after the first unfinished one are included, so order is kept.
+        """
+        self._stop.clear()
+        outcomes = {}
+        next_index = 0
+        exhausted = False
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            pending = {pool.submit(self._run_one, i, item): i for i, item in enumerate(items)}
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = pending.pop(future)
+                    if future.cancelled():
+                        continue
+                    try:
+                        outcomes[index] = future.result()
+                    except QuotaExhaustedError:
+                        exhausted = True
+                        self._stop.set()
+                # Hand back finished items in order, up to the first gap
+                while next_index in outcomes:
+                    on_result(outcomes.pop(next_index))
+                    next_index += 1
+                if exhausted:
+                    for future in pending:
+                        future.cancel()
+
+        return items[next_index:]
@@ -3,24 +3,47 @@ import os
 import json
 import time
 import argparse
+import math
 import re
+import socket
+import threading
 from pathlib import Path
-from PIL import Image
-import google.generativeai as genai
+from google import genai
+from google.genai import types
+
+from classifier_journal import COMPACT_INTERVAL, Journal, add_topic, compact, load_topics
+from classify_cache import ClassificationCache, cache_key
+from classify_engine import (
+    DEFAULT_CONCURRENCY, DEFAULT_RPD, DEFAULT_RPM, ClassificationEngine, KeyDisabledError, QuotaExhaustedError,
+    RateLimitError, parse_retry_after
+)
+from key_pool import DEFAULT_MAX_WAIT, KeyPool
+from local_classifier import DEFAULT_THRESHOLD as LOCAL_THRESHOLD, MIN_EXAMPLES, LocalClassifier, training_examples
+from payload_planner import plan_payload
+from state_store import StateStore
 
 # Setup paths
 BASE_DIR = Path(__file__).parent.parent
-TOPICS_FILE = BASE_DIR / "data" / "output" / "topics.json"
 QUESTIONS_DIR = BASE_DIR / "data" / "output" / "cropped_questions"
-TAGS_FILE = BASE_DIR / "data" / "output" / "question_tags.json"
-PROGRESS_FILE = BASE_DIR / "data" / "state" / ".classifier_progress.json"
 API_COLLECTION_FILE = BASE_DIR / ".api_collection"
+MODEL_NAME = 'gemini-flash-latest'
+PROMPT_VERSION = 2  # Bump when the prompt changes, so cached results are not reused
+DEFAULT_GROUP_SIZE = 1  # Questions per request; 1 sends each question on its own
+GROUP_TOKEN_BUDGET = 12000  # Estimated input + output tokens of one grouped request
+IMAGE_TILE_TOKENS = 258  # Gemini counts an image as 258 tokens per 768x768 tile
+ANSWER_TOKENS = 80  # Output tokens of one question's JSON answer
+LEASE_SECONDS = 300  # A worker's claim on queued questions lapses this long after its last heartbeat
+IMAGE_NOTES = {  # How the prompt describes each kind of payload (see payload_planner.py)
+    "text": "(none; the text above is the whole question)",
+    "figure": "(Attached: only the figures and tables of the question)",
+    "image": "(Attached)",
+    "full": "(Attached)",
+}
 
 class ApiKeyManager:
     def __init__(self, key_file):
         self.key_file = Path(key_file)
         self.keys = []
-        self.current_index = 0
         self.load_keys()
 
     def load_keys(self):
@@ -34,45 +57,9 @@ class ApiKeyManager:
         
         return len(self.keys) > 0
 
-    def get_current_key(self):
-        return self.keys[self.current_index] if self.keys else None
-
-    def switch_to_next_key(self):
-        if self.current_index + 1 < len(self.keys):
-            self.current_index += 1
-            return True
-        return False
-
-    def get_status_str(self):
-        return f"API Key {self.current_index + 1}/{len(self.keys)}"
-
-def load_json(file_path, default):
-    if not file_path.exists():
-        return default
-    with open(file_path, "r") as f:
-        try:
-            return json.load(f)
-        except json.JSONDecodeError:
-            return default
-
-def save_json(file_path, data):
-    with open(file_path, "w") as f:
-        json.dump(data, f, indent=2)
-
-def get_untagged_questions():
-    progress = load_json(PROGRESS_FILE, {"completed": []})
-    completed = set(progress["completed"])
-    
-    cropper_progress_file = BASE_DIR / "data" / "state" / ".cropper_progress.json"
-    ocr_map = {}
-    if cropper_progress_file.exists():
-        cp_data = load_json(cropper_progress_file, {})
-        for exam_id, crops in cp_data.items():
-            for crop in crops:
-                q_num = crop.get("question_num")
-                text = crop.get("extracted_text", "")
-                if q_num:
-                    ocr_map[f"{exam_id}/Q{q_num:02d}.png"] = text
+def get_untagged_questions(store):
+    completed = set(store.completed_tags())
+    ocr_map = store.question_texts()
 
     untagged = []
     if not QUESTIONS_DIR.exists(): return []
@@ -86,6 +73,61 @@ def get_untagged_questions():
                     untagged.append((rel_path, img_file, text))
     return untagged
 
+def share_duplicate_tags(store, untagged):
+    """
+    Tag questions whose copy in another exam is already tagged (see find_duplicates.py), and
+    keep only one question of each duplicate group for the API.
+
+    Returns:
+        (questions to classify, {rel_path: [untagged copies that get its result]}, tags copied)
+    """
+    duplicates = store.duplicates()
+    if not duplicates:
+        return untagged, {}, 0
+    tags = store.tags()
+    to_classify, followers, leader_of = [], {}, {}
+    copied = 0
+    for item in untagged:
+        rel_path = item[0]
+        others = duplicates.get(rel_path, [])
+        source = next((other for other in others if other in tags), None)
+        leader = next((leader_of[other] for other in others if other in leader_of), None)
+        if source:
+            store.save_tag(rel_path, {**tags[source], "duplicate_of": source})
+            copied += 1
+        elif leader:
+            followers[leader].append(rel_path)
+        else:
+            leader_of[rel_path] = rel_path
+            followers[rel_path] = []
+            to_classify.append(item)
+    return to_classify, followers, copied
+
+def tag_locally(store, untagged, topics, followers, threshold):
+    """
+    Tag the questions the local pre-classifier (local_classifier.py) is confident
+    about, and their duplicates; the rest are left for the API.
+
+    Returns:
+        (questions to classify, questions tagged locally)
+    """
+    examples = training_examples(store.tags(), store.question_texts())
+    if len(examples) < MIN_EXAMPLES:
+        return untagged, 0
+    model = LocalClassifier(examples, topics)
+    to_classify, tagged = [], 0
+    for item in untagged:
+        rel_path, _, text = item
+        result, confidence = model.predict(text) if text else (None, 0.0)
+        if result is None or confidence < threshold:
+            to_classify.append(item)
+            continue
+        store.save_tag(rel_path, result)
+        for copy in followers.get(rel_path, []):
+            store.save_tag(copy, {**result, "duplicate_of": rel_path})
+        tagged += 1
+    return to_classify, tagged
+
 def format_topic_list(topics):
     lines = []
     for category, subcategories in topics.items():
@@ -98,8 +140,28 @@ def format_topic_list(topics):
             #     lines.append(f"    - {topic}")
     return "\n".join(lines)
 
-def classify_question(model, img_path, ocr_text, topic_list_str):
-    img = Image.open(img_path)
+def question_cache_key(img_path, ocr_text, topic_list_str, full_images=False):
+    """
+    Cache key of one classification: image bytes, OCR text, topic list, prompt version,
+    payload mode and model. Results from a text-only, figure or full-image upload are kept apart.
+    """
+    mode = plan_payload(str(img_path), ocr_text or "", full_images).mode
+    return cache_key(Path(img_path).read_bytes(), ocr_text, topic_list_str, f"{PROMPT_VERSION}/{mode}", MODEL_NAME)
+
+def classify_question(model, img_path, ocr_text, topic_list_str, cache=None, full_images=False, sent=None):
+    """
+    Classify one question. Unless full_images is set, the upload is planned by
+    payload_planner (text only, figures only or a shrunken crop); the payload sent
+    is recorded in sent[img_path].
+    """
+    key = None
+    if cache is not None:
+        key = question_cache_key(img_path, ocr_text, topic_list_str, full_images)
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+    
+    payload = plan_payload(str(img_path), ocr_text or "", full_images)
     
     prompt = f"""
 You are an expert IT Exam Classifier for the FE (Fundamental IT Engineer) Examination.
@@ -110,7 +172,7 @@ Classify the question based *strictly* on the official FE Textbook structure.
 
 ### Input:
 - Question Text: {ocr_text}
-- Image: (Attached)
+- Image: {IMAGE_NOTES[payload.mode]}
 
 ### Instructions:
 1. **Analyze** the question content (text + image).
@@ -127,21 +189,291 @@ Classify the question based *strictly* on the official FE Textbook structure.
 }}
 """
     
-    response = model.generate_content([prompt, img])
+    if sent is not None:
+        sent[str(img_path)] = payload
+    response = model.generate_content([prompt, payload.blob()] if payload.image else [prompt])
     try:
         text = response.text.strip()
         match = re.search(r'\{.*\}', text, re.DOTALL)
         if match:
-            return json.loads(match.group())
+            result = json.loads(match.group())
+            if cache is not None:
+                cache.put(key, result)
+            return result
         return None
     except Exception as e:
         print(f"Error parsing Gemini response: {e}")
         return None
 
+def estimate_tokens(img_path, ocr_text, full_images=False):
+    """Rough tokens one question adds to a grouped request (image tiles, OCR text, its answer)."""
+    payload = plan_payload(str(img_path), ocr_text or "", full_images)
+    width, height = payload.size
+    if payload.image is None:
+        tiles = 0
+    else:
+        tiles = 1 if max(width, height) <= 384 else math.ceil(width / 768) * math.ceil(height / 768)
+    return tiles * IMAGE_TILE_TOKENS + len(ocr_text or "") // 4 + ANSWER_TOKENS
+
+def pack_groups(questions, max_size, token_budget=GROUP_TOKEN_BUDGET, full_images=False):
+    """Split questions, in order, into groups of at most max_size questions and about token_budget tokens."""
+    groups, group, tokens = [], [], 0
+    for question in questions:
+        cost = estimate_tokens(question[1], question[2], full_images)
+        if group and (len(group) >= max_size or tokens + cost > token_budget):
+            groups.append(group)
+            group, tokens = [], 0
+        group.append(question)
+        tokens += cost
+    if group:
+        groups.append(group)
+    return groups
+
+def match_taxonomy(taxonomy, category, subcategory):
+    """Exact (category, subcategory) names from the taxonomy, matched ignoring case, or None."""
+    if not isinstance(category, str) or not isinstance(subcategory, str):
+        return None
+    for cat, subcategories in taxonomy.items():
+        if cat.casefold() == category.strip().casefold():
+            for sub in subcategories:
+                if sub.casefold() == subcategory.strip().casefold():
+                    return cat, sub
+    return None
+
+def classify_group(model, group, taxonomy, topic_list_str, cache=None, full_images=False, sent=None):
+    """
+    Classify several questions with one request that asks for a JSON array back.
+
+    Args:
+        model: Gemini model
+        group: (rel_path, img_path, ocr_text) of each question
+        taxonomy: {category: [subcategory]} every answer must name an entry of
+        topic_list_str: Taxonomy as listed in the prompt
+        cache: ClassificationCache (questions found in it are not sent)
+        full_images: Send every crop as is instead of the planned payload
+        sent: Dict the payload of every question sent is recorded in, by image path
+
+    Returns:
+        {rel_path: result} of the questions that got a valid answer, or None if none did
+    """
+    results = {}
+    pending = []  # (question, cache key) of the questions to send
+    for question in group:
+        key = question_cache_key(question[1], question[2], topic_list_str, full_images) if cache is not None else None
+        cached = cache.get(key) if cache is not None else None
+        if cached is not None:
+            results[question[0]] = cached
+        else:
+            pending.append((question, key))
+    if not pending:
+        return results
+    
+    prompt = f"""
+You are an expert IT Exam Classifier for the FE (Fundamental IT Engineer) Examination.
+Classify each question below based *strictly* on the official FE Textbook structure.
+
+### Taxonomy Structure (Chapter > Section):
+{topic_list_str}
+
+### Input:
+{len(pending)} questions follow. Each starts with its ID, then its text, then its image if it has one
+(some images show only the figures and tables of their question).
+
+### Instructions:
+For EACH question:
+1. **Analyze** the question content (text + image).
+2. **Categorize** it into exactly ONE "Category" (Chapter) and ONE "Subcategory" (Section) from the list above.
+3. **Specific Topic:** Provide a short, specific topic name (2-4 words) that fits under the subcategory. Use existing topics if they fit, or suggest a new accurate one.
+4. **Reasoning:** Briefly explain your choice.
+
+### Output JSON Format:
+A JSON array with one object per question:
+[
+  {{
+    "id": 1,
+    "category": "Exact Chapter Name from list",
+    "subcategory": "Exact Section Name from list",
+    "topic": "Specific Topic Name",
+    "explanation": "One sentence reason."
+  }}
+]
+"""
+    parts = [prompt]
+    for n, ((rel_path, img_path, ocr_text), _) in enumerate(pending, 1):
+        parts.append(f"### Question ID {n}\nQuestion Text: {ocr_text}")
+        payload = plan_payload(str(img_path), ocr_text or "", full_images)
+        if payload.image:
+            parts.append(payload.blob())
+        if sent is not None:
+            sent[str(img_path)] = payload
+    
+    response = model.generate_content(parts)
+    try:
+        text = response.text.strip()
+        match = re.search(r'\[.*\]', text, re.DOTALL)
+        entries = json.loads(match.group()) if match else []
+    except Exception as e:
+        print(f"Error parsing Gemini response: {e}")
+        entries = []
+    
+    for entry in entries if isinstance(entries, list) else []:
+        # Keep only answers that name one of the questions and an entry of the taxonomy
+        if not isinstance(entry, dict):
+            continue
+        try:
+            (rel_path, _, _), key = pending[int(entry.get("id")) - 1]
+        except (TypeError, ValueError, IndexError):
+            continue
+        names = match_taxonomy(taxonomy, entry.get("category"), entry.get("subcategory"))
+        topic = entry.get("topic")
+        if rel_path in results or names is None or not isinstance(topic, str) or not topic.strip():
+            continue
+        result = {
+            "category": names[0],
+            "subcategory": names[1],
+            "topic": topic.strip(),
+            "explanation": entry.get("explanation", ""),
+        }
+        results[rel_path] = result
+        if cache is not None:
+            cache.put(key, result)
+    return results or None
+
+def cached_group(cache, group, topic_list_str, full_images=False):
+    """Cached results of every question of a group, or None unless all are cached."""
+    keys = [question_cache_key(img_path, ocr_text, topic_list_str, full_images) for _, img_path, ocr_text in group]
+    if not all(key in cache for key in keys):
+        return None
+    return {question[0]: cache.get(key) for question, key in zip(group, keys)}
+
+def raise_engine_error(e):
+    """Re-raise a Gemini API error as the engine error it stands for."""
+    message = str(e)
+    if "API_KEY_INVALID" in message or "API key not valid" in message or "PERMISSION_DENIED" in message:
+        raise KeyDisabledError(message) from e
+    if "429" not in message and "ResourceExhausted" not in message:
+        raise e
+    if "PerDay" in message:
+        raise QuotaExhaustedError(message) from e
+    raise RateLimitError(message, parse_retry_after(message)) from e
+
+def classify_with_errors(model, img_path, ocr_text, topic_list_str, cache=None, full_images=False, sent=None):
+    """classify_question, with Gemini quota errors raised as engine errors."""
+    try:
+        return classify_question(model, img_path, ocr_text, topic_list_str, cache, full_images, sent)
+    except Exception as e:
+        raise_engine_error(e)
+
+def classify_group_with_errors(model, group, taxonomy, topic_list_str, cache=None, full_images=False, sent=None):
+    """classify_group (classify_question for a group of one), with Gemini quota errors raised as engine errors."""
+    if len(group) == 1:
+        rel_path, img_path, ocr_text = group[0]
+        result = classify_with_errors(model, img_path, ocr_text, topic_list_str, cache, full_images, sent)
+        return {rel_path: result} if result is not None else None
+    try:
+        return classify_group(model, group, taxonomy, topic_list_str, cache, full_images, sent)
+    except Exception as e:
+        raise_engine_error(e)
+
+class GeminiModel:
+    """Gemini model on its own client for one API key (keys are never shared process-wide)."""
+
+    def __init__(self, key):
+        self.client = genai.Client(api_key=key)
+
+    def generate_content(self, parts):
+        """Send a prompt and its images ({"mime_type", "data"} blobs). The response has .text."""
+        contents = [types.Part.from_bytes(data=part["data"], mime_type=part["mime_type"])
+                    if isinstance(part, dict) else part for part in parts]
+        return self.client.models.generate_content(model=MODEL_NAME, contents=contents)
+
+def setup_model(key):
+    """
+    Gemini model for one API key. Anything with generate_content(parts) returning an object
+    with .text can stand in for it (e.g. fake_gemini.FakeGeminiServer.model(key)).
+    """
+    return GeminiModel(key)
+
+def classify_in_rounds(engine, questions, group_size, on_question, group_tokens=GROUP_TOKEN_BUDGET,
+                       full_images=False, before_round=None):
+    """
+    Classify questions with an engine whose items are groups of questions. Each round sends
+    the questions the last one got no valid answer for, in groups half the size, down to one
+    question per request (whose failures are final).
+
+    Args:
+        engine: ClassificationEngine calling classify_group_with_errors
+        questions: (rel_path, img_path, ocr_text) of each question
+        group_size: Most questions per request in the first round
+        on_question: Called as on_question(question, result, error) in order, on this thread;
+            result is None if the question got no valid answer
+        before_round: Called before every round (e.g. to refresh the taxonomy answers are checked against)
+
+    Returns:
+        Number of questions left unanswered because no API key had quota
+    """
+    group_size = max(1, group_size)
+    pending = list(questions)
+    while pending:
+        if before_round is not None:
+            before_round()
+        groups = (pack_groups(pending, group_size, group_tokens, full_images) if group_size > 1
+                  else [[q] for q in pending])
+        failed = []  # Questions of a group that got no valid answer, for the next round
+
+        def on_result(outcome):
+            results = outcome.result or {}
+            for question in outcome.item:
+                if question[0] in results:
+                    on_question(question, results[question[0]])
+                elif len(outcome.item) > 1:
+                    failed.append(question)  # Only this question is sent again, in a smaller group
+                else:
+                    on_question(question, None, outcome.error or "Invalid answer")
+
+        remaining = engine.run(groups, on_result)
+        if remaining:
+            return sum(len(group) for group in remaining) + len(failed)
+        pending = failed
+        group_size = max(1, group_size // 2)
+        if pending:
+            print(f"↻ Retrying {len(pending)} question(s) without a valid answer (up to {group_size} per request)")
+    return 0
+
+def keep_claims(worker, stop):
+    """Renew a worker's leases until stop is set (the heartbeat thread; it has its own connection)."""
+    store = StateStore(migrate=False)
+    try:
+        while not stop.wait(LEASE_SECONDS / 3):
+            store.renew_claims(worker, LEASE_SECONDS)
+    finally:
+        store.close()
+
 def main():
     parser = argparse.ArgumentParser(description="Classify questions using Gemini API")
     parser.add_argument("--batch-size", type=int, default=20, help="Number of questions to process")
-    parser.add_argument("--delay", type=float, default=2.0, help="Delay between requests")
+    parser.add_argument("--concurrency", type=int, default=None,
+                        help=f"Requests in flight at once (default: {DEFAULT_CONCURRENCY} per key)")
+    parser.add_argument("--rpm", type=float, default=DEFAULT_RPM,
+                        help=f"Requests per minute allowed per key (default: {DEFAULT_RPM})")
+    parser.add_argument("--rpd", type=int, default=DEFAULT_RPD,
+                        help=f"Requests per day allowed per key (default: {DEFAULT_RPD})")
+    parser.add_argument("--max-wait", type=float, default=DEFAULT_MAX_WAIT,
+                        help=f"Stop if no key frees up within this many seconds (default: {DEFAULT_MAX_WAIT})")
+    parser.add_argument("--no-duplicates", action="store_true",
+                        help="Classify every question, even copies of already tagged questions")
+    parser.add_argument("--group-size", type=int, default=DEFAULT_GROUP_SIZE,
+                        help="Most questions packed into one request (default: 1, one question per request)")
+    parser.add_argument("--group-tokens", type=int, default=GROUP_TOKEN_BUDGET,
+                        help=f"Estimated token budget of one grouped request (default: {GROUP_TOKEN_BUDGET})")
+    parser.add_argument("--full-images", action="store_true",
+                        help="Upload every crop as is instead of text only, figures only or a shrunken crop")
+    parser.add_argument("--local-threshold", type=float, default=LOCAL_THRESHOLD,
+                        help=f"Confidence needed to tag a question locally instead of with Gemini (default: {LOCAL_THRESHOLD})")
+    parser.add_argument("--no-local", action="store_true",
+                        help="Send every question to Gemini, without the local pre-classifier")
+    parser.add_argument("--worker", default=None,
+                        help="Name of this worker in the shared work queue (default: host name and process id)")
     args = parser.parse_args()
 
     api_manager = ApiKeyManager(API_COLLECTION_FILE)
@@ -149,72 +481,134 @@ def main():
         print("Error: No API keys found.")
         return
 
-    def setup_model(key):
-        genai.configure(api_key=key)
-        return genai.GenerativeModel('gemini-flash-latest')
-
-    model = setup_model(api_manager.get_current_key())
-    topics = load_json(TOPICS_FILE, {})
-    tags = load_json(TAGS_FILE, {})
-    progress = load_json(PROGRESS_FILE, {"completed": []})
+    store = StateStore()
+    journal = Journal()
+    topics = load_topics(journal)
+    topic_list = [format_topic_list(topics)]  # Replaced (not mutated) when a topic is added
     
-    untagged = get_untagged_questions()
+    untagged = get_untagged_questions(store)
+    questions = {question[0]: question for question in untagged}  # Anything another worker queued, too
+    followers, copied = {}, 0
+    if untagged and not args.no_duplicates:
+        untagged, followers, copied = share_duplicate_tags(store, untagged)
+        if copied:
+            print(f"↺ Copied tags to {copied} question(s) from their tagged copies in other exams")
+    local = 0
+    if untagged and not args.no_local:
+        start = time.perf_counter()
+        considered = len(untagged)
+        untagged, local = tag_locally(store, untagged, topics, followers, args.local_threshold)
+        if local:
+            print(f"⚡ Tagged {local} of {considered} question(s) locally (confidence ≥ {args.local_threshold:g}, "
+                  f"{(time.perf_counter() - start) * 1000 / considered:.1f} ms per question), saving {local} API call(s)")
     if not untagged:
+        if copied or local:
+            compact(store, journal)
         print("No untagged questions found.")
         return
 
-    batch = untagged[:args.batch_size]
-    print(f"Processing {len(batch)} questions with {api_manager.get_status_str()}...")
+    # Questions go through the shared work queue, so several classifier processes (other keys,
+    # other hosts sharing data/) each claim their own questions instead of all taking the same ones
+    worker = args.worker or f"{socket.gethostname()}-{os.getpid()}"
+    store.enqueue([question[0] for question in untagged])
+    total = min(args.batch_size, len(untagged))
+    done = 0
+    last_compact = time.monotonic()
+    group_size = max(1, args.group_size)
+    taxonomy = [{}]  # Category/subcategory names answers are checked against; replaced every round
+    sent = {}  # Payload last uploaded for each question, by image path (written by the workers)
+    uploaded = {"questions": 0, "bytes": 0, "source_bytes": 0}
 
-    for i, (rel_path, img_file, ocr_text) in enumerate(batch):
-        print(f"[{i+1}/{len(batch)}] {rel_path}...", end=" ", flush=True)
+    def on_question(question, result, error=None):
+        # Called in batch order, on this thread: all writes happen here
+        nonlocal done, last_compact
+        done += 1
+        rel_path = question[0]
+        payload = sent.pop(str(question[1]), None)
+        size = ""
+        if payload is not None:
+            uploaded["questions"] += 1
+            uploaded["bytes"] += payload.sent_bytes
+            uploaded["source_bytes"] += payload.source_bytes
+            size = f" [{payload.mode}, {payload.sent_bytes / 1024:.1f} KB]"
+        if result is None:
+            print(f"[{done}/{total}] {rel_path}... ❌ ({error}){size}")
+            return  # Stays claimed until the run ends, then goes back to the queue
+        if not store.finish_claim(rel_path, worker) and store.is_tagged(rel_path):
+            # Our lease ran out and another worker tagged it first: keep its result
+            print(f"[{done}/{total}] {rel_path}... ↷ (already tagged by another worker)")
+            return
+        store.save_tag(rel_path, result)
+        for copy in followers.get(rel_path, []):
+            store.save_tag(copy, {**result, "duplicate_of": rel_path})
         
-        retry_count = 0
-        while retry_count < 2:
-            try:
-                topic_list_str = format_topic_list(topics)
-                result = classify_question(model, img_file, ocr_text, topic_list_str)
-                
-                if result:
-                    tags[rel_path] = result
-                    save_json(TAGS_FILE, tags)
-                    
-                    # Update local topics if Gemini suggested something new and valid
-                    cat = result.get("category")
-                    sub = result.get("subcategory")
-                    top = result.get("topic", "General")
-                    
-                    if cat and sub:
-                        if cat not in topics: topics[cat] = {}
-                        if sub not in topics[cat]: topics[cat][sub] = {}
-                        if top not in topics[cat][sub]:
-                            topics[cat][sub][top] = []
-                            save_json(TOPICS_FILE, topics)
-                    
-                    progress["completed"].append(rel_path)
-                    save_json(PROGRESS_FILE, progress)
-                    print("✅")
-                    break
-                else:
-                    print("❌ (Parse Error)", end=" ")
-                    retry_count += 1
-            except Exception as e:
-                if "429" in str(e) or "ResourceExhausted" in str(e):
-                    print("\n⚠️ Quota exceeded.", end=" ")
-                    if api_manager.switch_to_next_key():
-                        print(f"Switching to {api_manager.get_status_str()}...")
-                        model = setup_model(api_manager.get_current_key())
-                        continue
-                    else:
-                        print("No more keys. Stopping.")
-                        return
-                else:
-                    print(f"❌ ({e})", end=" ")
-                    retry_count += 1
+        # Update local topics if Gemini suggested something new and valid
+        cat = result.get("category")
+        sub = result.get("subcategory")
+        top = result.get("topic", "General")
+        if cat and sub and add_topic(topics, journal, cat, sub, top):
+            topic_list[0] = format_topic_list(topics)
+        copies = len(followers.get(rel_path, []))
+        print(f"[{done}/{total}] {rel_path}... ✅{size}" + (f" (+{copies} duplicate(s))" if copies else ""))
         
-        if i < len(batch) - 1:
-            time.sleep(args.delay)
+        # Fold new topics and tags into the JSON files now and then, not after every question
+        if time.monotonic() - last_compact > COMPACT_INTERVAL:
+            compact(store, journal)
+            last_compact = time.monotonic()
+
+    pool = KeyPool(api_manager.keys, args.rpm, args.rpd, args.max_wait)
+    models = {k.id: setup_model(k.key) for k in pool.keys}
+    cache = ClassificationCache()
+    concurrency = args.concurrency or DEFAULT_CONCURRENCY * len(pool.keys)
+    engine = ClassificationEngine(
+        lambda group, k: classify_group_with_errors(models[k.id], group, taxonomy[0], topic_list[0], cache,
+                                                    args.full_images, sent),
+        pool, concurrency,
+        # Cached results are found before a key is taken, so they use no quota
+        lookup=lambda group: cached_group(cache, group, topic_list[0], args.full_images))
+    claim_size = group_size * concurrency * 2  # Enough to keep every request slot busy
+    queued = store.queue_status()
+    print(f"Processing up to {total} questions as worker {worker} with {pool.status_str()} "
+          f"({concurrency} concurrent, {args.rpm:g} RPM per key"
+          + (f", up to {group_size} questions per request" if group_size > 1 else "") + ")...")
+    if queued["leased"]:
+        print(f"  {queued['leased']} queued question(s) are claimed by other workers")
+
+    def refresh_taxonomy():
+        taxonomy[0] = {cat: list(subcategories) for cat, subcategories in topics.items()}
+
+    stop = threading.Event()
+    threading.Thread(target=keep_claims, args=(worker, stop), daemon=True).start()
+    try:
+        left = 0
+        while done < total and not left:
+            claimed = store.claim(worker, min(claim_size, total - done), LEASE_SECONDS)
+            if not claimed:
+                break
+            unknown = [rel_path for rel_path in claimed if rel_path not in questions]
+            for rel_path in unknown:
+                # Queued by a worker that saw it untagged, but not untagged here (tagged meanwhile, or
+                # its crop is gone): drop it from the queue instead of renewing its lease all run
+                store.finish_claim(rel_path, worker)
+            batch = [questions[rel_path] for rel_path in claimed if rel_path in questions]
+            if batch:
+                left = classify_in_rounds(engine, batch, group_size, on_question, args.group_tokens,
+                                          args.full_images, before_round=refresh_taxonomy)
+        if left:
+            print(f"⚠️ No API key has quota left; {left} question(s) left for the next run.")
+    finally:
+        stop.set()
+        store.release_claims(worker)  # Failed and unsent questions go back to the queue
+        pool.save()
+        compact(store, journal)
+        store.close()
 
+    if uploaded["questions"]:
+        print(f"Uploaded {uploaded['bytes'] / 1024:.0f} KB for {uploaded['questions']} question(s) "
+              f"({uploaded['bytes'] / max(1, uploaded['source_bytes']):.0%} of their full crops)")
+    print(cache.stats_str())
+    cache.close()
+    print("\n".join(pool.report()))
     print("Done.")
 
 if __name__ == "__main__":
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Row Content Profiles
+Whitespace trimming from per-row content flags instead of pixel rescans.
+A page's row-content profile (which rows have a pixel darker than the threshold)
+is computed once per column range and cached; every trim decision for every crop
+on that page is then a lookup over rows. Once the trimmed extents are known,
+compose_segments() writes the page slices straight into one output buffer.
+"""
+
+import numpy as np
+from PIL import Image
+
+TRIM_THRESHOLD = 245  # Pixels above this are "white"
+BOTTOM_PADDING = 70  # Rows kept below the last content row
+MIN_BOTTOM_TRIM = 60  # Only trim the bottom if more whitespace than this would go
+TOP_MARGIN = 10  # Rows kept above the first content row
+MIN_TOP_TRIM = 30  # Only trim the top if the new top would be lower than this
+
+GRAY_PALETTE = [v for v in range(256) for _ in range(3)]  # Identity palette for 'P' output
+
+
+def row_content(pixels: np.ndarray, threshold: int = TRIM_THRESHOLD) -> np.ndarray:
+    """Per row of a 2D grayscale array, whether any pixel is darker than threshold."""
+    return np.any(pixels < threshold, axis=1)
+
+
+def bottom_trim_height(row_has_content: np.ndarray) -> int:
+    """Height to keep when trimming bottom whitespace (the full height if nothing is trimmed)."""
+    height = len(row_has_content)
+    content_rows = np.flatnonzero(row_has_content)
+    if len(content_rows) == 0:
+        return height  # All white
+
+    # Add generous padding to ensure text isn't cut
+    new_height = min(int(content_rows[-1]) + BOTTOM_PADDING, height)
+
+    # Only crop if there's substantial whitespace
+    return new_height if height - new_height > MIN_BOTTOM_TRIM else height
+
+
+def top_trim_offset(row_has_content: np.ndarray) -> int:
+    """First row to keep when trimming top whitespace (0 if nothing is trimmed)."""
+    content_rows = np.flatnonzero(row_has_content)
+    if len(content_rows) == 0:
+        return 0
+
+    # Keep a small margin at the top
+    new_top = max(0, int(content_rows[0]) - TOP_MARGIN)
+    return new_top if new_top > MIN_TOP_TRIM else 0
+
+
+def plan_segment_rows(profiles: list[np.ndarray], final_trim: bool = True) -> list[tuple[int, int]]:
+    """
+    Decide which rows of each page segment of a question survive trimming.
+    Same decisions as trimming the bottom of the first segment, the top and bottom of
+    every other segment, stacking them, and trimming the bottom of the stack again.
+
+    Args:
+        profiles: Row-content profile of each segment, first page first
+        final_trim: Also trim the bottom of the stacked segments
+
+    Returns:
+        (first_row, end_row) to keep of each segment (end_row exclusive)
+    """
+    ranges = []
+    for i, rows in enumerate(profiles):
+        top = top_trim_offset(rows) if i else 0
+        ranges.append((top, top + bottom_trim_height(rows[top:])))
+
+    if final_trim:
+        stacked = np.concatenate([rows[top:end] for rows, (top, end) in zip(profiles, ranges)])
+        keep = bottom_trim_height(stacked)
+        trimmed = []
+        for top, end in ranges:
+            rows = min(end - top, keep)
+            trimmed.append((top, top + rows))
+            keep -= rows
+        ranges = trimmed
+
+    return ranges
+
+
+class PageProfiles:
+    """Cached row-content profiles of the pages of one PDF."""
+
+    def __init__(self, pages, threshold: int = TRIM_THRESHOLD):
+        """
+        Args:
+            pages: Sequence of grayscale pages indexed by page number
+                (PIL Images or 2D uint8 arrays, e.g. PageView or RasterPages)
+            threshold: Pixel brightness threshold (0-255)
+        """
+        self.pages = pages
+        self.threshold = threshold
+        self._profiles: dict = {}  # (page_num, x1, x2) -> (profile over the page height, page width)
+
+    def _page_rows(self, page_num: int, x1: int, x2: int) -> tuple[np.ndarray, int]:
+        key = (page_num, x1, x2)
+        if key not in self._profiles:
+            page = self.pages[page_num]
+            pixels = page if isinstance(page, np.ndarray) else np.asarray(page.convert('L'))
+            width = pixels.shape[1]
+            self._profiles[key] = (row_content(pixels[:, max(0, x1):min(width, x2)], self.threshold), width)
+        return self._profiles[key]
+
+    def segment_rows(self, page_num: int, box: tuple[int, int, int, int]) -> np.ndarray:
+        """
+        Row-content profile of the box (x1, y1, x2, y2) of a page. Like a crop of the
+        page, areas outside it count as black (content).
+        """
+        x1, y1, x2, y2 = box
+        if x2 <= x1:
+            return np.zeros(max(0, y2 - y1), dtype=bool)
+
+        page_rows, width = self._page_rows(page_num, x1, x2)
+        rows = np.ones(max(0, y2 - y1), dtype=bool)
+        if x1 >= 0 and x2 <= width:
+            # Rows inside the page take the page's profile; rows beyond it are padding
+            sy1, sy2 = max(y1, 0), min(y2, len(page_rows))
+            if sy2 > sy1:
+                rows[sy1 - y1:sy2 - y1] = page_rows[sy1:sy2]
+        return rows
+
+    def clear(self):
+        self._profiles.clear()
+
+
+def stack_segments(segments: list) -> Image.Image:
+    """Vertically concatenate segments (PIL Images or 2D arrays) onto a white canvas."""
+    images = [Image.fromarray(np.ascontiguousarray(img)) if isinstance(img, np.ndarray) else img
+              for img in segments]
+
+    if len(images) == 1:
+        return images[0]
+
+    total_height = sum(img.height for img in images)
+    max_width = max(img.width for img in images)
+
+    # Create combined image (same mode as the segments, white background)
+    combined = Image.new(images[0].mode, (max_width, total_height), 'white')
+
+    y_offset = 0
+    for img in images:
+        combined.paste(img, (0, y_offset))
+        y_offset += img.height
+
+    return combined
+
+
+def _source_pixels(source, box: tuple[int, int, int, int]) -> np.ndarray:
+    """Grayscale pixels of an in-bounds box of a PIL page or 2D array (arrays are not copied)."""
+    x1, y1, x2, y2 = box
+    if isinstance(source, np.ndarray):
+        return source[y1:y2, x1:x2]
+    region = source.crop(box)
+    return np.asarray(region if region.mode == 'L' else region.convert('L'))
+
+
+def compose_segments(parts: list, mode: str = 'L') -> Image.Image:
+    """
+    Stack the boxes of several pages into one image, allocating the output once.
+    Every box is copied straight from its source into the output buffer, which the
+    returned image shares, so saving it (PIL encodes row by row) needs no other copy.
+    Same pixels as stacking crops of the boxes: areas of a box outside its page are
+    black, and boxes narrower than the widest one are padded with white.
+
+    Args:
+        parts: [(source, (x1, y1, x2, y2)), ...] top to bottom; a source is a grayscale
+            page as a PIL Image or 2D uint8 array (e.g. a memory-mapped page)
+        mode: 'L' for grayscale, or 'P' for the same pixels with a gray palette
+
+    Returns:
+        Composed image
+    """
+    heights = [max(0, y2 - y1) for _, (x1, y1, x2, y2) in parts]
+    widths = [max(0, x2 - x1) for _, (x1, y1, x2, y2) in parts]
+    width, height = max(widths), sum(heights)
+    out = np.empty((height, width), dtype=np.uint8)
+
+    y = 0
+    for (source, (x1, y1, x2, y2)), w, h in zip(parts, widths, heights):
+        region = out[y:y + h]
+        region[:, w:] = 255
+        if isinstance(source, np.ndarray):
+            page_height, page_width = source.shape
+        else:
+            page_width, page_height = source.size
+        sx1, sy1 = max(x1, 0), max(y1, 0)
+        sx2, sy2 = min(x2, page_width), min(y2, page_height)
+        if (sx1, sy1, sx2, sy2) != (x1, y1, x2, y2):
+            region[:, :w] = 0  # Outside the page
+        if sx2 > sx1 and sy2 > sy1:
+            region[sy1 - y1:sy2 - y1, sx1 - x1:sx2 - x1] = _source_pixels(source, (sx1, sy1, sx2, sy2))
+        y += h
+
+    if mode == 'P':
+        img = Image.frombuffer('P', (width, height), out, 'raw', 'P', 0, 1)
+        img.putpalette(GRAY_PALETTE)
+        return img
+    return Image.frombuffer('L', (width, height), out, 'raw', 'L', 0, 1)
@@ -3,26 +3,45 @@
 Extract Index Terms from FE Textbooks
 This script extracts index terms from the official FE textbook PDFs.
 Supports incremental processing - skips if output is up to date.
+
+Every PDF in data/input/pdfs is treated as a volume. Its index pages are found
+automatically: a cheap first pass reads page text backwards from the end of
+the book (with PyMuPDF when installed) and keeps the last run of pages where
+most lines are "Term ······ 123" entries. Those pages are then extracted with
+the selected backend on a process pool.
 """
 
-import pdfplumber
-import re
 import os
+import re
 from pathlib import Path
 
+from pdf_backend import add_backend_argument, open_pdf, set_backend
+
 BASE_DIR = Path(__file__).parent.parent
-VOL1 = BASE_DIR / "data" / "input" / "pdfs" / "New FE Textbook Vol1.pdf"
-VOL2 = BASE_DIR / "data" / "input" / "pdfs" / "New FE Textbook Vol2.pdf"
+PDF_DIR = BASE_DIR / "data" / "input" / "pdfs"
 OUTPUT_FILE = BASE_DIR / "data" / "output" / "raw_terms.txt"
 
+DETECT_BACKEND = "pymupdf"  # Fast text for the first pass; the selected backend if it is not installed
+MIN_ENTRY_LINES = 10  # Index entries a page needs to be an index page
+MIN_ENTRY_SHARE = 0.5  # Share of its non-blank lines that must be entries (a table of contents has ~20%)
+MAX_GAP = 1  # Non-index pages allowed inside the index run (e.g. a letter divider)
+CHUNKS_PER_WORKER = 2  # Page sets per worker process and volume
+
+# "Term ······ 123" or "Term .... 12, 345": a run of leaders, then page numbers
+ENTRY_LINE = re.compile(r"(?:[·…]{3,}|\.{4,})\s*\d+(?:\s*,\s*\d+)*\s*$")
+# Parsing of an index line (text before the leaders, ending in a page number)
+PAGE_NUMBER_END = re.compile(r'\d+$')
+LEADERS = re.compile(r'[·…\.]+')
+
+
+def textbook_pdfs():
+    """Every volume in data/input/pdfs, in name order."""
+    return sorted(PDF_DIR.glob("*.pdf"))
+
 
 def get_source_mtime():
     """Get the most recent modification time of source PDFs."""
-    mtimes = []
-    if VOL1.exists():
-        mtimes.append(VOL1.stat().st_mtime)
-    if VOL2.exists():
-        mtimes.append(VOL2.stat().st_mtime)
+    mtimes = [pdf.stat().st_mtime for pdf in textbook_pdfs()]
     return max(mtimes) if mtimes else 0
 
 
@@ -30,53 +49,122 @@ def is_up_to_date():
     """Check if output file is newer than all source PDFs."""
     if not OUTPUT_FILE.exists():
         return False
-    
+
     output_mtime = OUTPUT_FILE.stat().st_mtime
     source_mtime = get_source_mtime()
-    
+
     return output_mtime > source_mtime
 
 
-def extract_from_pdf(pdf_path, start_page, end_page):
+def is_index_page(text):
+    """Whether most lines of a page's text are index entries."""
+    lines = [line for line in (text or "").split('\n') if line.strip()]
+    entries = sum(1 for line in lines if ENTRY_LINE.search(line))
+    return entries >= MIN_ENTRY_LINES and entries >= MIN_ENTRY_SHARE * len(lines)
+
+
+def open_for_detection(pdf_path):
+    try:
+        return open_pdf(pdf_path, DETECT_BACKEND)
+    except ImportError:
+        return open_pdf(pdf_path)
+
+
+def find_index_pages(pdf_path):
+    """
+    Locate the index of a textbook: the last run of index pages, read from the back.
+
+    Returns:
+        (first page, last page), 1-based and inclusive, or None if the book has no index
+    """
+    last = first = None
+    with open_for_detection(pdf_path) as pdf:
+        gap = 0
+        for i in range(pdf.page_count - 1, -1, -1):
+            if is_index_page(pdf.page_text(i)):
+                last = last or i + 1
+                first, gap = i + 1, 0
+            elif last:
+                gap += 1
+                if gap > MAX_GAP:
+                    break
+    return (first, last) if last else None
+
+
+def parse_index_text(text):
+    """Terms of the "Term ····· 123" lines of one index page."""
+    terms = set()
+    for line in (text or "").split('\n'):
+        # Match lines ending with page numbers
+        if not PAGE_NUMBER_END.search(line):
+            continue
+
+        # The text BEFORE the leaders (middle dots or dots) is the term
+        parts = LEADERS.split(line)
+
+        if len(parts) >= 2:
+            term = parts[0].strip()
+            # Filter logic
+            if len(term) > 2 and not term.isdigit():
+                # Remove page number artifacts if any remain
+                term = PAGE_NUMBER_END.sub('', term).strip()
+                terms.add(term)
+    return terms
+
+
+def extract_pages(pdf_path, pages):
+    """Worker: terms of some pages (1-based) of one PDF, with the backend chosen by the parent."""
     terms = set()
-    print(f"Processing {pdf_path.name}...")
-    
-    with pdfplumber.open(pdf_path) as pdf:
-        for i in range(start_page - 1, end_page):  # 0-indexed
-            if i >= len(pdf.pages):
-                break
-            
-            page = pdf.pages[i]
-            text = page.extract_text()
-            if not text:
-                continue
-                
-            lines = text.split('\n')
-            for line in lines:
-                # Regex to match "Term ····· 123" or "Term ... 123"
-                # The textbooks use middle dots or dots for leaders
-                # We want to capture the text BEFORE the leaders
-                
-                # Match lines ending with page numbers
-                if not re.search(r'\d+$', line):
-                    continue
-                
-                # Split by dots or special leader characters
-                # Unicode for middle dot might be used
-                parts = re.split(r'[·…\.]+', line)
-                
-                if len(parts) >= 2:
-                    term = parts[0].strip()
-                    # Filter logic
-                    if len(term) > 2 and not term.isdigit():
-                        # Remove page number artifacts if any remain
-                        term = re.sub(r'\d+$', '', term).strip()
-                        terms.add(term)
-    
+    with open_pdf(pdf_path) as pdf:
+        for page in pages:
+            terms |= parse_index_text(pdf.page_text(page - 1))
     return terms
 
 
-def main(force=False):
+def extract_all(pdfs, jobs=None):
+    """
+    Detect each volume's index and extract its pages on a process pool.
+
+    Returns:
+        Set of terms of every volume
+    """
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    jobs = jobs or os.cpu_count() or 1
+    tasks = []
+    for pdf_path in pdfs:
+        pages = find_index_pages(pdf_path)
+        if not pages:
+            print(f"Warning: no index pages found in {pdf_path.name}, skipping...")
+            continue
+        first, last = pages
+        print(f"  {pdf_path.name}: index on pages {first}-{last}")
+        # A few runs of pages per worker: every task opens the PDF, which costs about a page
+        pages = list(range(first, last + 1))
+        chunks = min(len(pages), jobs * CHUNKS_PER_WORKER)
+        tasks += [(pdf_path, pages[n::chunks]) for n in range(chunks)]
+    if not tasks:
+        return set()
+
+    page_total = sum(len(pages) for _, pages in tasks)
+    print(f"Extracting {page_total} index pages with {jobs} worker(s)...")
+    all_terms = set()
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = {pool.submit(extract_pages, pdf_path, pages): (pdf_path, pages) for pdf_path, pages in tasks}
+        done = 0
+        for future in as_completed(futures):
+            pdf_path, pages = futures[future]
+            done += len(pages)
+            try:
+                all_terms |= future.result()
+            except Exception as e:
+                print(f"\n❌ {pdf_path.name} pages {', '.join(map(str, pages))}: {e}")
+            print(f"  {done}/{page_total} pages, {len(all_terms)} terms...", end="\r")
+    print()
+    return all_terms
+
+
+def main(force=False, jobs=None):
     # Check if we need to do anything
     if not force and is_up_to_date():
         term_count = sum(1 for _ in open(OUTPUT_FILE)) if OUTPUT_FILE.exists() else 0
@@ -84,42 +172,49 @@ def main(force=False):
         print(f"  Output: {OUTPUT_FILE}")
         print(f"  Terms: {term_count}")
         return
-    
+
     # Check if source PDFs exist
-    if not VOL1.exists() and not VOL2.exists():
+    pdfs = textbook_pdfs()
+    if not pdfs:
         print("Error: No textbook PDFs found.")
-        print(f"  Expected: {VOL1}")
-        print(f"  Expected: {VOL2}")
+        print(f"  Expected: PDF files in {PDF_DIR}")
         return
-    
-    all_terms = set()
-    
-    # Vol 1 Index: 455 to 476
-    if VOL1.exists():
-        all_terms.update(extract_from_pdf(VOL1, 455, 477))
-    else:
-        print(f"Warning: {VOL1.name} not found, skipping...")
-    
-    # Vol 2 Index: 393 to 415
-    if VOL2.exists():
-        all_terms.update(extract_from_pdf(VOL2, 393, 416))
-    else:
-        print(f"Warning: {VOL2.name} not found, skipping...")
-    
+
+    print(f"Finding index pages in {len(pdfs)} volume(s)...")
+    all_terms = extract_all(pdfs, jobs)
+    if not all_terms:
+        print("Error: No index terms found; raw_terms.txt left unchanged.")
+        return
+
     print(f"✓ Extracted {len(all_terms)} unique terms.")
-    
-    with open(OUTPUT_FILE, 'w') as f:
+
+    # Written to a temporary file first, so a failed run never truncates the old list
+    tmp_file = OUTPUT_FILE.with_suffix(OUTPUT_FILE.suffix + ".tmp")
+    with open(tmp_file, 'w') as f:
         for term in sorted(all_terms):
             f.write(term + "\n")
-    
+    os.replace(tmp_file, OUTPUT_FILE)
+
     print(f"  Saved to {OUTPUT_FILE}")
 
 
 if __name__ == "__main__":
     import argparse
     parser = argparse.ArgumentParser(description="Extract index terms from FE textbooks")
-    parser.add_argument("--force", "-f", action="store_true", 
+    parser.add_argument("--force", "-f", action="store_true",
                         help="Force re-extraction even if output is up to date")
+    parser.add_argument("--jobs", "-j", type=int, default=None,
+                        help="Worker processes (default: CPU count)")
+    parser.add_argument("--find-pages", action="store_true",
+                        help="Only print the index pages found in each volume")
+    add_backend_argument(parser)
     args = parser.parse_args()
-    
-    main(force=args.force)
+    if args.backend:
+        set_backend(args.backend)
+
+    if args.find_pages:
+        for pdf_path in textbook_pdfs():
+            pages = find_index_pages(pdf_path)
+            print(f"{pdf_path.name}: " + (f"pages {pages[0]}-{pages[1]}" if pages else "no index found"))
+    else:
+        main(force=args.force, jobs=args.jobs)
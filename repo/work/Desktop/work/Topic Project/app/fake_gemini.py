@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Offline Gemini Stand-In
+Fake of the one call the classifier makes (model.generate_content(parts).text),
+for load tests that use no quota:
+
+  - latency: lognormal around a median, plus a little per question of a
+    grouped request
+  - per-key limits like the real service: requests per minute and per day,
+    refused with the API's own 429 / daily quota messages
+  - injected faults: random 429s, malformed answers, invalid keys
+  - answers: JSON naming a section of the taxonomy listed in the prompt, one
+    object for a single question or an array for a group
+
+FakeGeminiServer holds the state every key shares; server.model(key) returns a
+model that drops in for the Gemini model of classify_questions.setup_model().
+Errors are raised with the API's wording, so classify_questions maps them to
+engine errors exactly as it does real ones. Used by benchmark_classifier.py.
+"""
+
+import json
+import random
+import re
+import threading
+import time
+import zlib
+from collections import deque
+from dataclasses import dataclass
+
+ERROR_LATENCY = 0.05  # Seconds to refuse a request (429, quota, bad key)
+
+
+@dataclass
+class FakeConfig:
+    """Behaviour of the fake service."""
+    latency: float = 1.0  # Median seconds per request
+    latency_sigma: float = 0.5  # Spread of the lognormal latency (0: always the median)
+    question_latency: float = 0.1  # Extra seconds per question of a grouped request
+    rpm: float = 60  # Requests per minute a key may send before it gets 429s
+    rpd: int = 1500  # Requests per day a key may send
+    rate_limit_rate: float = 0.0  # Share of requests refused with 429 at any rate
+    malformed_rate: float = 0.0  # Share of answers that are not valid JSON
+    invalid_keys: tuple = ()  # Keys answered with API_KEY_INVALID
+    seed: int = 0
+
+
+class FakeApiError(Exception):
+    """An error response, worded like the Gemini API's."""
+
+
+class FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeModel:
+    """Model bound to one key (the fake's counterpart of genai.GenerativeModel)."""
+
+    def __init__(self, server: "FakeGeminiServer", key: str):
+        self.server = server
+        self.key = key
+
+    def generate_content(self, parts) -> FakeResponse:
+        return FakeResponse(self.server.handle(self.key, parts))
+
+
+class FakeGeminiServer:
+    """Shared state of the fake service: per-key limits, faults and counters."""
+
+    def __init__(self, config: FakeConfig = None):
+        self.config = config or FakeConfig()
+        self.rng = random.Random(self.config.seed)
+        self.recent = {}  # key -> deque of request times in the last minute
+        self.used = {}  # key -> requests accepted in total (the fake's "day")
+        self.counts = {"requests": 0, "answered": 0, "rate_limited": 0, "quota": 0, "invalid_key": 0,
+                       "malformed": 0}
+        self._lock = threading.Lock()
+
+    def model(self, key: str) -> FakeModel:
+        return FakeModel(self, key)
+
+    def _refuse(self, kind: str, message: str):
+        self.counts[kind] += 1
+        raise FakeApiError(message)
+
+    def _admit(self, key: str) -> float:
+        """Check a request against the key's limits and faults. Returns its latency."""
+        config = self.config
+        with self._lock:
+            self.counts["requests"] += 1
+            if key in config.invalid_keys:
+                self._refuse("invalid_key", '400 API key not valid. Please pass a valid API key. '
+                                            '[reason: "API_KEY_INVALID"]')
+            if self.used.get(key, 0) >= config.rpd:
+                self._refuse("quota", "429 Quota exceeded for metric: generate_content_free_tier_requests, "
+                                      "limit: GenerateRequestsPerDayPerProjectPerModel-FreeTier")
+            now = time.monotonic()
+            recent = self.recent.setdefault(key, deque())
+            while recent and recent[0] <= now - 60:
+                recent.popleft()
+            if len(recent) >= config.rpm:
+                self._refuse("rate_limited", f"429 Resource has been exhausted (e.g. check quota). "
+                                             f"Please retry in {recent[0] + 60 - now:.1f}s.")
+            if self.rng.random() < config.rate_limit_rate:
+                self._refuse("rate_limited", "429 Resource has been exhausted (e.g. check quota).")
+            recent.append(now)
+            self.used[key] = self.used.get(key, 0) + 1
+            if config.latency_sigma > 0:
+                return self.rng.lognormvariate(0, config.latency_sigma) * config.latency
+            return config.latency
+
+    def handle(self, key: str, parts) -> str:
+        """Answer one generate_content call (blocking for its latency)."""
+        try:
+            latency = self._admit(key)
+        except FakeApiError:
+            time.sleep(ERROR_LATENCY)
+            raise
+
+        prompt = parts[0] if isinstance(parts, list) else parts
+        questions = [p for p in parts[1:] if isinstance(p, str) and p.startswith("### Question ID")]
+        time.sleep(latency + self.config.question_latency * len(questions))
+
+        with self._lock:
+            malformed = self.rng.random() < self.config.malformed_rate
+            if malformed:
+                self.counts["malformed"] += 1
+            else:
+                self.counts["answered"] += 1
+        sections = taxonomy_sections(prompt)
+        if questions:
+            answer = json.dumps([{"id": n, **fake_answer(sections, text)} for n, text in enumerate(questions, 1)])
+        else:
+            text = re.search(r"Question Text:(.*)", prompt)
+            answer = json.dumps(fake_answer(sections, text.group(1) if text else prompt))
+        if malformed:
+            return "```json\n" + answer[:len(answer) // 2]  # Cut off mid-answer
+        return "```json\n" + answer + "\n```"
+
+
+def taxonomy_sections(prompt: str) -> list[tuple[str, str]]:
+    """(category, subcategory) pairs listed in a classifier prompt's taxonomy."""
+    match = re.search(r"### Taxonomy Structure.*?\n(.*?)\n###", prompt, re.DOTALL)
+    sections, category = [], None
+    for line in (match.group(1) if match else "").splitlines():
+        if line.startswith("- "):
+            category = line[2:].strip()
+        elif line.startswith("  - ") and category:
+            sections.append((category, line[4:].strip()))
+    return sections or [("General", "General")]
+
+
+def fake_answer(sections: list[tuple[str, str]], text: str) -> dict:
+    """A deterministic answer for a question's text."""
+    category, subcategory = sections[zlib.crc32(text.encode("utf-8")) % len(sections)]
+    return {
+        "category": category,
+        "subcategory": subcategory,
+        "topic": "Benchmark Topic",
+        "explanation": "Answer from the offline stand-in.",
+    }
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Find Duplicate Questions Across Exams
+ITPEC reuses many morning questions across years. This script fingerprints
+every cropped question and groups the copies:
+
+  - MinHash signature over character shingles of the extracted text (with the
+    "Q12." label stripped, since the number changes between exams)
+  - 256-bit difference hash (dHash) of the image, for crops without text
+
+Signatures are split into LSH bands and hashed into buckets, so only questions
+that share a bucket are compared: near-linear in the number of crops instead of
+every pair. Candidate pairs are then verified (shingle Jaccard similarity, or
+dHash distance when a crop has no text) and joined into clusters.
+
+Fingerprints and clusters are kept in the state store (incremental: only new or
+changed crops are fingerprinted). The classifier copies tags within a cluster
+instead of calling the API, and build_search_index.py links every question to
+its other appearances.
+"""
+
+import hashlib
+import os
+import re
+import zlib
+from itertools import combinations
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from state_store import StateStore
+
+BASE_DIR = Path(__file__).parent.parent
+SOURCE_DIR = BASE_DIR / "data" / "output" / "cropped_questions"
+
+FINGERPRINT_VERSION = 1  # Bump when any fingerprint parameter changes, so old ones are recomputed
+SHINGLE_SIZE = 5  # Characters per text shingle
+MIN_SHINGLES = 20  # Texts shorter than this are matched by image instead
+NUM_PERM = 128  # MinHash signature length
+TEXT_BANDS = 32  # LSH bands of NUM_PERM / TEXT_BANDS rows; pairs above ~0.5 similarity share a bucket
+TEXT_THRESHOLD = 0.7  # Shingle Jaccard similarity of two copies of a question (reworded copies score 0.7-0.9)
+FIGURE_PIXELS_PER_SHINGLE = 4  # A crop taller than this per shingle is mostly figure, so its text says little
+DHASH_SIZE = 16  # dHash grid (DHASH_SIZE x DHASH_SIZE bits); 8x8 cannot tell text crops apart
+IMAGE_BANDS = 16  # Any two hashes within IMAGE_BANDS - 1 bits share a band
+IMAGE_THRESHOLD = 8  # Maximum differing dHash bits of two copies of a question (image-only matches)
+FIGURE_IMAGE_THRESHOLD = 40  # Same, for a text match where a crop is mostly figure ("the circuit shown below")
+HEIGHT_TOLERANCE = 0.05  # Maximum height difference of two copies (image-only matches)
+
+_PRIME = (1 << 31) - 1
+_rng = np.random.default_rng(20240101)  # Fixed seed: stored signatures must stay comparable
+_PERM_A = _rng.integers(1, _PRIME, NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.integers(0, _PRIME, NUM_PERM, dtype=np.uint64)
+
+
+def shingles(text: str) -> set[str]:
+    """Character shingles of a question's text, ignoring its number, case, spacing and punctuation."""
+    text = re.sub(r"^\s*Q?\d+\s*[.)]", "", text or "")
+    text = " ".join(re.findall(r"\w+", text.lower()))
+    return {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+
+def minhash(shingle_set: set[str]) -> np.ndarray:
+    """MinHash signature (NUM_PERM uint32 values) of a shingle set."""
+    x = np.fromiter((zlib.crc32(s.encode()) % _PRIME for s in shingle_set), dtype=np.uint64, count=len(shingle_set))
+    return ((np.outer(x, _PERM_A) + _PERM_B) % _PRIME).min(axis=0).astype(np.uint32)
+
+
+def dhash(img: Image.Image) -> bytes:
+    """Difference hash: whether each pixel of a small grayscale copy is brighter than its left neighbour."""
+    small = np.asarray(img.convert("L").resize((DHASH_SIZE + 1, DHASH_SIZE), Image.BILINEAR), dtype=np.int16)
+    return np.packbits((small[:, 1:] > small[:, :-1]).ravel()).tobytes()
+
+
+def hamming(a: bytes, b: bytes) -> int:
+    return int(np.unpackbits(np.frombuffer(a, np.uint8) ^ np.frombuffer(b, np.uint8)).sum())
+
+
+def jaccard(a: set, b: set) -> float:
+    return len(a & b) / len(a | b) if a or b else 0.0
+
+
+def source_hash(path: Path, text: str) -> str:
+    """Hash of everything a fingerprint depends on (image bytes, text, fingerprint version)."""
+    h = hashlib.md5(path.read_bytes())
+    h.update(f"\0{text}\0{FINGERPRINT_VERSION}".encode("utf-8"))
+    return h.hexdigest()
+
+
+def fingerprint(path: Path, rel_path: str, text: str) -> dict:
+    """Fingerprint of one cropped question, in the state store's layout."""
+    with Image.open(path) as img:
+        height = img.height
+        image_hash = dhash(img)
+    text_shingles = shingles(text)
+    return {
+        "rel_path": rel_path,
+        "source_hash": source_hash(path, text),
+        "height": height,
+        "shingles": len(text_shingles),
+        "dhash": image_hash,
+        "minhash": minhash(text_shingles).tobytes() if len(text_shingles) >= MIN_SHINGLES else None,
+    }
+
+
+def _buckets(keys: dict[str, list]) -> list[list[str]]:
+    """Groups of paths sharing a bucket, from {path: [bucket keys]}."""
+    buckets = {}
+    for rel_path, path_keys in keys.items():
+        for key in path_keys:
+            buckets.setdefault(key, []).append(rel_path)
+    return [members for members in buckets.values() if len(members) > 1]
+
+
+def candidate_pairs(fingerprints: dict[str, dict]) -> set[tuple[str, str]]:
+    """Pairs of paths that share an LSH bucket (text pairs, and image pairs where a side has no text)."""
+    rows = NUM_PERM // TEXT_BANDS
+    text_keys = {rel_path: [(band, fp["minhash"][band * rows * 4:(band + 1) * rows * 4])
+                            for band in range(TEXT_BANDS)]
+                 for rel_path, fp in fingerprints.items() if fp["minhash"] is not None}
+    band_bytes = len(next(iter(fingerprints.values()))["dhash"]) // IMAGE_BANDS if fingerprints else 0
+    image_keys = {rel_path: [(band, fp["dhash"][band * band_bytes:(band + 1) * band_bytes])
+                             for band in range(IMAGE_BANDS)]
+                  for rel_path, fp in fingerprints.items()}
+
+    pairs = set()
+    for members in _buckets(text_keys):
+        pairs.update(combinations(sorted(members), 2))
+    for members in _buckets(image_keys):
+        # Image-only matches are only needed where a side has no text to compare
+        textless = [m for m in members if fingerprints[m]["minhash"] is None]
+        for a in textless:
+            pairs.update(tuple(sorted((a, b))) for b in members if b != a)
+    return pairs
+
+
+def is_figure(fp: dict) -> bool:
+    """Whether a crop is mostly figure, i.e. much taller than its text needs."""
+    return fp["height"] > FIGURE_PIXELS_PER_SHINGLE * fp["shingles"]
+
+
+def is_duplicate(a: dict, b: dict, shingles_a: set, shingles_b: set) -> bool:
+    """Verify a candidate pair: by text if both have some, else by image."""
+    if a["minhash"] is not None and b["minhash"] is not None:
+        if jaccard(shingles_a, shingles_b) < TEXT_THRESHOLD:
+            return False
+        # The same short stem over different figures is a different question
+        return not (is_figure(a) or is_figure(b)) or hamming(a["dhash"], b["dhash"]) <= FIGURE_IMAGE_THRESHOLD
+    if abs(a["height"] - b["height"]) > HEIGHT_TOLERANCE * max(a["height"], b["height"]):
+        return False
+    return hamming(a["dhash"], b["dhash"]) <= IMAGE_THRESHOLD
+
+
+def cluster_duplicates(fingerprints: dict[str, dict], texts: dict[str, str]) -> list[list[str]]:
+    """
+    Group duplicate questions.
+
+    Args:
+        fingerprints: Fingerprints by image path
+        texts: Extracted text by image path
+
+    Returns:
+        Clusters of two or more image paths, each sorted, largest first
+    """
+    parent = {}  # Union-find over the paths of verified pairs
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]  # Path halving
+            x = parent[x]
+        return x
+
+    shingle_cache = {}
+    for a, b in candidate_pairs(fingerprints):
+        for p in (a, b):
+            if p not in shingle_cache:
+                shingle_cache[p] = shingles(texts.get(p, ""))
+        if is_duplicate(fingerprints[a], fingerprints[b], shingle_cache[a], shingle_cache[b]):
+            parent.setdefault(a, a)
+            parent.setdefault(b, b)
+            root_a, root_b = find(a), find(b)
+            if root_a != root_b:
+                parent[max(root_a, root_b)] = min(root_a, root_b)
+
+    clusters = {}
+    for rel_path in parent:
+        clusters.setdefault(find(rel_path), []).append(rel_path)
+    return sorted((sorted(members) for members in clusters.values()), key=lambda m: (-len(m), m))
+
+
+def find_duplicates(force: bool = False, jobs: int = None, show: bool = False):
+    """Fingerprint new or changed crops, then rebuild the duplicate clusters in the state store."""
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    store = StateStore()
+    texts = store.question_texts()
+    saved = {} if force else store.fingerprints()
+
+    sources = {f"{p.parent.name}/{p.name}": p for p in sorted(SOURCE_DIR.glob("*/Q*.png"))}
+    fingerprints = {}
+    todo = []
+    for rel_path, path in sources.items():
+        known = saved.get(rel_path)
+        if known and known["source_hash"] == source_hash(path, texts.get(rel_path, "")):
+            fingerprints[rel_path] = known
+        else:
+            todo.append(rel_path)
+
+    if todo:
+        jobs = jobs or os.cpu_count() or 1
+        print(f"Fingerprinting {len(todo)} of {len(sources)} crops with {jobs} worker(s)...")
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = {pool.submit(fingerprint, sources[r], r, texts.get(r, "")): r for r in todo}
+            for n, future in enumerate(as_completed(futures), 1):
+                try:
+                    fingerprints[futures[future]] = future.result()
+                except Exception as e:
+                    print(f"\n❌ {futures[future]}: {e}")
+                if n % 100 == 0:
+                    print(f"  {n}/{len(todo)}...", end="\r")
+        print()
+    store.save_fingerprints(list(fingerprints.values()))
+
+    clusters = cluster_duplicates(fingerprints, texts)
+    store.save_duplicate_clusters(clusters)
+    store.close()
+
+    textless = sum(1 for fp in fingerprints.values() if fp["minhash"] is None)
+    print(f"✓ {len(clusters)} duplicate group(s) covering {sum(map(len, clusters))} of {len(fingerprints)} crops "
+          f"({sum(len(c) - 1 for c in clusters)} copies)")
+    if textless:
+        print(f"  {textless} crop(s) without extracted text were matched by image only")
+    if show:
+        for members in clusters:
+            print("  " + ", ".join(members))
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Find questions reused across exams")
+    parser.add_argument("--force", "-f", action="store_true", help="Recompute every fingerprint")
+    parser.add_argument("--jobs", "-j", type=int, default=None,
+                        help="Worker processes (default: CPU count)")
+    parser.add_argument("--show", action="store_true", help="List every duplicate group")
+    args = parser.parse_args()
+
+    find_duplicates(force=args.force, jobs=args.jobs, show=args.show)
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+API Key Pool
+Schedules classification requests across every key in .api_collection at once.
+
+For each key the pool tracks:
+  - a per-minute token bucket with 429 backoff (classify_engine.KeyLimiter)
+  - requests used in the current quota day (Gemini quotas reset at midnight
+    Pacific time) and a cooldown deadline
+  - request, error and rate-limit counts, and a smoothed error rate
+
+acquire() hands out the key that can send soonest (fewest errors and least
+used on a tie) and waits for one if every key is cooling down. A key that hit
+its limit comes back into service when its window resets. The run only stops
+early when no key frees up within max_wait, e.g. when every daily quota is used.
+
+Daily use and cooldowns are saved to data/state/key_pool.json (keys are stored
+as short hashes, never in plain text), so quotas hold across runs. Saves hold
+an exclusive lock on key_pool.json.lock and add this process's requests to
+the counts in the file, so classifier workers sharing keys count each other's
+use.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks; run one classifier at a time
+    fcntl = None
+
+from classify_engine import DEFAULT_RPD, DEFAULT_RPM, KeyLimiter, QuotaExhaustedError
+
+BASE_DIR = Path(__file__).parent.parent
+POOL_STATE_FILE = BASE_DIR / "data" / "state" / "key_pool.json"
+QUOTA_TIMEZONE = "America/Los_Angeles"  # Where Gemini's daily quota resets at midnight
+DEFAULT_MAX_WAIT = 15 * 60  # Seconds to wait for a key before stopping the run
+SAVE_INTERVAL = 2.0  # Seconds between state saves while requests are flowing
+ERROR_RATE_WEIGHT = 0.2  # Weight of the newest outcome in the smoothed error rate
+COUNTERS = ("day_used", "requests", "errors", "rate_limited")  # Added up across processes on save
+
+
+def key_id(key: str) -> str:
+    """Short, non-reversible name of a key for state files and logs."""
+    return hashlib.sha256(key.encode()).hexdigest()[:12]
+
+
+def _quota_zone():
+    try:
+        from zoneinfo import ZoneInfo
+        return ZoneInfo(QUOTA_TIMEZONE)
+    except Exception:
+        from datetime import timezone
+        return timezone.utc  # No tz database; close enough
+
+
+def quota_day(now: float) -> str:
+    """Quota day (date in the quota time zone) of a Unix time."""
+    return datetime.fromtimestamp(now, _quota_zone()).date().isoformat()
+
+
+def next_quota_reset(now: float) -> float:
+    """Unix time of the next daily quota reset."""
+    local = datetime.fromtimestamp(now, _quota_zone())
+    midnight = (local + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return midnight.timestamp()
+
+
+@dataclass
+class PoolKey:
+    """One key of the pool and its usage."""
+    key: str = field(repr=False)
+    id: str
+    limiter: KeyLimiter = field(repr=False)
+    day: str = ""
+    day_used: int = 0
+    cooldown_until: float = 0.0
+    disabled: bool = False  # Invalid or revoked; skipped for the rest of the run
+    requests: int = 0
+    errors: int = 0
+    rate_limited: int = 0
+    error_rate: float = 0.0
+    synced: dict = field(default_factory=dict, repr=False)  # Counters as of the last load or save
+
+    def record(self, failed: bool):
+        self.error_rate += ERROR_RATE_WEIGHT * (float(failed) - self.error_rate)
+
+    def merge(self, state: dict):
+        """
+        Combine with the key's saved state: counts saved by other processes plus this
+        process's use since the last sync.
+        """
+        day = max(self.day, state.get("day", ""))
+        saved_used = state.get("day_used", 0) if state.get("day") == day else 0
+        own_used = self.day_used - self.synced.get("day_used", 0) if self.day == day else 0
+        for name in ("requests", "errors", "rate_limited"):
+            setattr(self, name, state.get(name, 0) + getattr(self, name) - self.synced.get(name, 0))
+        self.day, self.day_used = day, saved_used + own_used
+        self.cooldown_until = max(self.cooldown_until, state.get("cooldown_until", 0.0))
+        self.synced = {name: getattr(self, name) for name in COUNTERS}
+
+
+class KeyPool:
+    """Thread-safe scheduler of requests across API keys."""
+
+    def __init__(self, keys: list[str], rpm: float = DEFAULT_RPM, rpd: int = DEFAULT_RPD,
+                 max_wait: float = DEFAULT_MAX_WAIT, state_file: Path = None):
+        """
+        Args:
+            keys: API keys
+            rpm: Requests per minute allowed per key
+            rpd: Requests per day allowed per key
+            max_wait: Longest wait for a free key before acquire() gives up
+            state_file: Where usage is persisted (default: data/state/key_pool.json)
+        """
+        self.rpd = rpd
+        self.max_wait = max_wait
+        self.state_file = Path(state_file or POOL_STATE_FILE)
+        self.keys = [PoolKey(k, key_id(k), KeyLimiter(rpm, clock=time.time)) for k in dict.fromkeys(keys)]
+        self._lock = threading.Lock()
+        self._last_save = 0.0
+        self._load()
+
+    # --- Persistence ---
+
+    def _load(self):
+        try:
+            with open(self.state_file) as f:
+                saved = json.load(f).get("keys", {})
+        except (OSError, json.JSONDecodeError):
+            return
+        today = quota_day(time.time())
+        for k in self.keys:
+            state = saved.get(k.id)
+            if not state:
+                continue
+            k.requests = state.get("requests", 0)
+            k.errors = state.get("errors", 0)
+            k.rate_limited = state.get("rate_limited", 0)
+            k.error_rate = state.get("error_rate", 0.0)
+            k.cooldown_until = state.get("cooldown_until", 0.0)
+            if state.get("day") == today:
+                k.day, k.day_used = today, state.get("day_used", 0)
+            k.synced = {name: getattr(k, name) for name in COUNTERS}
+
+    def save(self):
+        """Write usage of every key (merged with keys of other runs still in the file)."""
+        with self._lock:
+            self._save()
+
+    @contextmanager
+    def _file_locked(self):
+        """Hold the state file's inter-process lock."""
+        self.state_file.parent.mkdir(parents=True, exist_ok=True)
+        if fcntl is None:
+            yield
+            return
+        with open(self.state_file.with_name(self.state_file.name + ".lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _save(self):
+        with self._file_locked():
+            try:
+                with open(self.state_file) as f:
+                    saved = json.load(f).get("keys", {})
+            except (OSError, json.JSONDecodeError):
+                saved = {}
+            for k in self.keys:
+                k.merge(saved.get(k.id, {}))
+                saved[k.id] = {
+                    "day": k.day, "day_used": k.day_used, "cooldown_until": k.cooldown_until,
+                    "requests": k.requests, "errors": k.errors, "rate_limited": k.rate_limited,
+                    "error_rate": round(k.error_rate, 4),
+                }
+            # Temp file per writer, so a save never writes into another's
+            tmp_file = self.state_file.with_name(f"{self.state_file.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            with open(tmp_file, "w") as f:
+                json.dump({"keys": saved}, f, indent=2)
+            os.replace(tmp_file, self.state_file)
+        self._last_save = time.monotonic()
+
+    def _maybe_save(self):
+        if time.monotonic() - self._last_save > SAVE_INTERVAL:
+            self._save()
+
+    # --- Scheduling ---
+
+    def _wait_time(self, k: PoolKey, now: float) -> float:
+        if k.disabled:
+            return float("inf")
+        if k.day != quota_day(now):
+            k.day, k.day_used = quota_day(now), 0  # New quota day
+            k.synced["day_used"] = 0
+        if k.day_used >= self.rpd:
+            return next_quota_reset(now) - now
+        return max(0.0, k.cooldown_until - now, k.limiter.wait_time())
+
+    def acquire(self) -> PoolKey:
+        """
+        Block until some key may send a request and reserve it.
+
+        Raises:
+            QuotaExhaustedError: If no key frees up within max_wait
+        """
+        while True:
+            with self._lock:
+                now = time.time()
+                ranked = sorted(self.keys, key=lambda k: (self._wait_time(k, now), k.error_rate, k.day_used))
+                if not ranked:
+                    raise QuotaExhaustedError("No API keys")
+                for k in ranked:
+                    if self._wait_time(k, now) > 0:
+                        break
+                    if k.limiter.reserve() == 0:
+                        k.day_used += 1
+                        k.requests += 1
+                        self._maybe_save()
+                        return k
+                wait_for = min(self._wait_time(k, now) for k in ranked)
+                if wait_for > self.max_wait:
+                    self._save()
+                    raise QuotaExhaustedError(f"Every key is out of quota for {wait_for / 60:.0f} more minutes")
+            time.sleep(min(max(wait_for, 0.05), 1.0))
+
+    def on_success(self, k: PoolKey):
+        k.limiter.on_success()
+        with self._lock:
+            k.record(False)
+
+    def on_rate_limited(self, k: PoolKey, retry_after: float = None) -> int:
+        """
+        Returns:
+            Number of consecutive 429s of the key so far
+        """
+        strikes = k.limiter.on_rate_limited(retry_after)
+        with self._lock:
+            k.rate_limited += 1
+            k.cooldown_until = max(k.cooldown_until, k.limiter.blocked_until)
+            k.record(True)
+        return strikes
+
+    def on_exhausted(self, k: PoolKey):
+        """The key's daily quota is used up (whatever our own count says)."""
+        with self._lock:
+            k.day_used = max(k.day_used, self.rpd)
+            k.rate_limited += 1
+            self._save()
+
+    def on_error(self, k: PoolKey, fatal: bool = False):
+        with self._lock:
+            k.errors += 1
+            k.record(True)
+            if fatal:
+                k.disabled = True
+
+    # --- Reporting ---
+
+    def status_str(self) -> str:
+        now = time.time()
+        with self._lock:
+            ready = sum(1 for k in self.keys if self._wait_time(k, now) == 0)
+            used = sum(k.day_used for k in self.keys)
+        return f"{len(self.keys)} API key(s), {ready} ready, {used}/{len(self.keys) * self.rpd} requests used today"
+
+    def report(self) -> list[str]:
+        """One line of usage per key."""
+        now = time.time()
+        lines = []
+        with self._lock:
+            for k in self.keys:
+                wait_for = self._wait_time(k, now)
+                state = "disabled" if k.disabled else "ready" if wait_for == 0 else f"back in {wait_for:.0f}s"
+                lines.append(f"  key {k.id}: {k.day_used}/{self.rpd} today, {k.requests} requests, "
+                             f"{k.errors} errors, {k.rate_limited} rate-limited, {state}")
+        return lines
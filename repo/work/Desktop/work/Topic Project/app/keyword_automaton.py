@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Keyword Rule Matcher
+Finds the first of an ordered list of keyword rules that matches a term in one
+pass over the term, instead of trying every rule's regex in turn:
+
+  - rules of the form r"\\b(word|two words|c\\+\\+)\\b" (the KEYWORD_RULES of
+    build_topics.py) are split into their literal keywords, which go into one
+    Aho-Corasick automaton over the lowercased term
+  - a keyword found by the automaton counts only with a word boundary on both
+    sides, exactly as \\b decides it (word character on one side, not on the
+    other), so "c++" and "3-tier" keep their regex behaviour
+  - a keyword shared by several rules belongs to the earliest; of all keywords
+    in a term the earliest rule wins, as with the old first-match loop
+  - any rule that is not such a keyword list is matched with its regex, so the
+    rule list can grow without breaking the matcher
+
+The cost per term depends on its length, not on the number of rules.
+RegexRules is the old loop, kept as the reference for --check and benchmarks.
+KeywordAutomaton.matches() lists every keyword found, for taggers that need
+all hits and their positions (term_tagger.py).
+"""
+
+import re
+from collections import deque
+
+KEYWORD_LIST = re.compile(r"\\b\((.*)\)\\b")  # r"\b(a|b|c)\b"
+METACHARS = set(".^$*+?{}[]()|\\")
+
+
+def is_word(c: str) -> bool:
+    """Whether a character is a regex word character (\\w)."""
+    return c.isalnum() or c == "_"
+
+
+def at_boundary(text: str, i: int) -> bool:
+    """Whether position i of the text is a word boundary (\\b)."""
+    return (i > 0 and is_word(text[i - 1])) != (i < len(text) and is_word(text[i]))
+
+
+def lowercase(text: str) -> str:
+    """The text lowercased character by character, so positions stay those of the original."""
+    lowered = text.lower()
+    if len(lowered) != len(text):  # Lowercasing changed positions ("İ"); fold character by character
+        lowered = "".join(c.lower() if len(c.lower()) == 1 else c for c in text)
+    return lowered
+
+
+def split_keywords(pattern: str) -> list[str]:
+    """
+    The literal keywords of a r"\\b(a|b)\\b" rule pattern.
+
+    Returns:
+        Keywords with escapes removed, or None if the pattern is anything else
+    """
+    match = KEYWORD_LIST.fullmatch(pattern)
+    if not match:
+        return None
+    keywords, current, escaped = [], [], False
+    for c in match.group(1):
+        if escaped:
+            if c.isalnum():  # \d, \s, \w ... are classes, not literals
+                return None
+            current.append(c)
+            escaped = False
+        elif c == "\\":
+            escaped = True
+        elif c == "|":
+            keywords.append("".join(current))
+            current = []
+        elif c in METACHARS:
+            return None
+        else:
+            current.append(c)
+    keywords.append("".join(current))
+    if escaped or any(not k or k != k.lower() for k in keywords):
+        return None
+    return keywords
+
+
+class KeywordAutomaton:
+    """Aho-Corasick automaton mapping each keyword to a value (the rule index)."""
+
+    def __init__(self, keywords: dict[str, int]):
+        """
+        Args:
+            keywords: Lowercase keyword -> rule index
+        """
+        self.next = [{}]  # state -> {character: state}, goto and failure links folded together
+        self.outputs = [[]]  # state -> [(keyword length, rule index)] of keywords ending there
+        for keyword, rule in keywords.items():
+            state = 0
+            for c in keyword:
+                if c not in self.next[state]:
+                    self.next.append({})
+                    self.outputs.append([])
+                    self.next[state][c] = len(self.next) - 1
+                state = self.next[state][c]
+            self.outputs[state].append((len(keyword), rule))
+
+        # Breadth-first: every state inherits its failure state's transitions and outputs
+        fail = [0] * len(self.next)
+        queue = deque(self.next[0].values())
+        while queue:
+            state = queue.popleft()
+            for c, child in list(self.next[state].items()):
+                queue.append(child)
+                fail[child] = self.next[fail[state]].get(c, 0)
+                self.outputs[child] = self.outputs[child] + self.outputs[fail[child]]
+            for c, target in self.next[fail[state]].items():
+                self.next[state].setdefault(c, target)
+        for outputs in self.outputs:
+            outputs.sort(key=lambda x: x[1])  # Earliest rule first, so a scan can stop early
+
+    def first_rule(self, text: str) -> int:
+        """Earliest rule with a keyword in the text between word boundaries, or None."""
+        lowered = lowercase(text)
+        best, state, transitions = None, 0, self.next
+        for end, c in enumerate(lowered, 1):
+            state = transitions[state].get(c, 0)
+            for length, rule in self.outputs[state]:
+                if best is not None and rule >= best:
+                    break
+                if at_boundary(lowered, end - length) and at_boundary(lowered, end):
+                    best = rule
+                    break
+            if best == 0:
+                break
+        return best
+
+    def matches(self, text: str, suffixes: tuple = ()) -> list[tuple[int, int, int]]:
+        """
+        Every keyword in the text between word boundaries, overlapping ones included.
+
+        Args:
+            text: Text to scan (matched lowercased)
+            suffixes: Endings a keyword may also carry, e.g. ("s", "es") for plurals
+
+        Returns:
+            (start, end, value) per hit, in order of end position; end includes any suffix
+        """
+        lowered = lowercase(text)
+        hits, state, transitions = [], 0, self.next
+        for end, c in enumerate(lowered, 1):
+            state = transitions[state].get(c, 0)
+            for length, value in self.outputs[state]:
+                start = end - length
+                if not at_boundary(lowered, start):
+                    continue
+                if at_boundary(lowered, end):
+                    hits.append((start, end, value))
+                    continue
+                for suffix in suffixes:
+                    if lowered.startswith(suffix, end) and at_boundary(lowered, end + len(suffix)):
+                        hits.append((start, end + len(suffix), value))
+                        break
+        return hits
+
+
+class RuleMatcher:
+    """Ordered rules compiled into one automaton (plus regexes for rules that are not keyword lists)."""
+
+    def __init__(self, patterns: list[str]):
+        keywords, self.regexes = {}, []
+        for rule, pattern in enumerate(patterns):
+            literals = split_keywords(pattern)
+            if literals is None:
+                self.regexes.append((rule, re.compile(pattern, re.IGNORECASE)))
+                continue
+            for keyword in literals:
+                keywords.setdefault(keyword, rule)
+        self.keyword_count = len(keywords)
+        self.automaton = KeywordAutomaton(keywords)
+
+    def first_rule(self, text: str) -> int:
+        """Index of the first rule that matches the text, or None."""
+        best = self.automaton.first_rule(text)
+        for rule, regex in self.regexes:
+            if best is not None and rule >= best:
+                break
+            if regex.search(text):
+                return rule
+        return best
+
+
+class RegexRules:
+    """The rules as separate regexes tried in order (the reference behaviour)."""
+
+    def __init__(self, patterns: list[str]):
+        self.regexes = [re.compile(pattern, re.IGNORECASE) for pattern in patterns]
+
+    def first_rule(self, text: str) -> int:
+        for rule, regex in enumerate(self.regexes):
+            if regex.search(text):
+                return rule
+        return None
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Per-PDF Word Layout Cache
+Extracts the word boxes of every page once per PDF and stores them on disk,
+keyed by the PDF's content hash and the PDF backend. All layout queries
+(question markers, page numbers, crop text) read from this cache instead of
+re-parsing the PDF.
+"""
+
+import bisect
+import gzip
+import hashlib
+import json
+import os
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from pdf_backend import add_backend_argument, get_backend_name, open_pdf, set_backend
+
+BASE_DIR = Path(__file__).parent.parent
+LAYOUT_DIR = BASE_DIR / "data" / "state" / "layout_cache"
+LAYOUT_VERSION = 1  # Bump when the stored format changes
+
+WORD_EPSILON = 1e-3  # Stored coordinates are rounded to 3 decimals
+LINE_TOLERANCE = 3  # Words whose tops differ by at most this are on one line (as in pdfplumber)
+
+# In-process memos keyed by (path, size, mtime)
+_memo: dict = {}  # (+ backend) -> list[PageLayout]
+_hash_memo: dict = {}  # -> content hash
+
+
+@dataclass
+class PageLayout:
+    """Word layout of a single PDF page (coordinates in PDF points)."""
+    width: float
+    height: float
+    # Each word is (text, x0, top, x1, bottom), in the backend's extraction order
+    words: list = field(default_factory=list)
+    # Word indices sorted by top, and their tops (built on first bbox query)
+    _by_top: list = field(default=None, init=False, repr=False, compare=False)
+    _tops: list = field(default=None, init=False, repr=False, compare=False)
+
+    def iter_words(self):
+        """Yield words as dicts shaped like pdfplumber's extract_words() output."""
+        for text, x0, top, x1, bottom in self.words:
+            yield {'text': text, 'x0': x0, 'top': top, 'x1': x1, 'bottom': bottom}
+
+    def words_in_bbox(self, bbox: tuple[float, float, float, float]) -> list[tuple]:
+        """
+        Words lying entirely inside bbox (x0, top, x1, bottom), in extraction order.
+        Bisects on word tops, so only words in the bbox's vertical band are examined.
+        """
+        if self._by_top is None:
+            self._by_top = sorted(range(len(self.words)), key=lambda i: self.words[i][2])
+            self._tops = [self.words[i][2] for i in self._by_top]
+
+        x0, top, x1, bottom = bbox
+        start = bisect.bisect_left(self._tops, top - WORD_EPSILON)
+        end = bisect.bisect_right(self._tops, bottom + WORD_EPSILON)
+        inside = [
+            i for i in self._by_top[start:end]
+            if self.words[i][1] >= x0 - WORD_EPSILON
+            and self.words[i][3] <= x1 + WORD_EPSILON
+            and self.words[i][4] <= bottom + WORD_EPSILON
+        ]
+        return [self.words[i] for i in sorted(inside)]
+
+
+def words_to_text(words: list[tuple]) -> str:
+    """
+    Join words into text like pdfplumber's extract_text(). Words keep their extraction
+    order; tops are clustered into lines (a gap above LINE_TOLERANCE starts a new
+    cluster) and a newline goes wherever consecutive words fall in different lines.
+    """
+    if not words:
+        return ""
+    line_of_top = {}
+    line = -1
+    prev_top = None
+    for top in sorted({w[2] for w in words}):
+        if prev_top is None or top - prev_top > LINE_TOLERANCE:
+            line += 1
+        line_of_top[top] = line
+        prev_top = top
+
+    lines = []
+    prev_line = None
+    for text, _, top, _, _ in words:
+        if line_of_top[top] != prev_line:
+            lines.append([])
+            prev_line = line_of_top[top]
+        lines[-1].append(text)
+    return "\n".join(" ".join(texts) for texts in lines)
+
+
+def _stat_key(pdf_path: Path) -> tuple:
+    stat = pdf_path.stat()
+    return (str(pdf_path.resolve()), stat.st_size, stat.st_mtime_ns)
+
+
+def get_pdf_hash(pdf_path: Path) -> str:
+    """Get SHA-1 hash of a PDF's contents (hashed once per process while the file is unchanged)."""
+    pdf_path = Path(pdf_path)
+    key = _stat_key(pdf_path)
+    if key not in _hash_memo:
+        h = hashlib.sha1()
+        with open(pdf_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+        _hash_memo[key] = h.hexdigest()
+    return _hash_memo[key]
+
+
+def _cache_path(pdf_hash: str, backend: str) -> Path:
+    return LAYOUT_DIR / f"{pdf_hash}.{backend}.json.gz"
+
+
+def _extract_layout(pdf_path: Path, backend: str) -> list[PageLayout]:
+    """Run a single word-extraction pass over the PDF."""
+    pages = []
+    with open_pdf(pdf_path, backend) as doc:
+        for page_num in range(doc.page_count):
+            words = [
+                (text, round(x0, 3), round(top, 3), round(x1, 3), round(bottom, 3))
+                for text, x0, top, x1, bottom in doc.words(page_num)
+            ]
+            width, height = doc.page_size(page_num)
+            pages.append(PageLayout(width, height, words))
+    return pages
+
+
+def _read_cache(path: Path):
+    try:
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, EOFError, json.JSONDecodeError):
+        return None
+    if data.get('version') != LAYOUT_VERSION:
+        return None
+    return [PageLayout(w, h, [tuple(word) for word in words]) for w, h, words in data['pages']]
+
+
+def _write_cache(path: Path, pages: list[PageLayout]):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    data = {
+        'version': LAYOUT_VERSION,
+        'pages': [[p.width, p.height, p.words] for p in pages],
+    }
+    # Temp file per writer: processes caching the same PDF must not write into one file
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with gzip.open(tmp_path, 'wt', encoding='utf-8', compresslevel=6) as f:
+        json.dump(data, f, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+
+def load_layout(pdf_path: Path, backend: str = None) -> list[PageLayout]:
+    """
+    Get the word layout of every page in a PDF.
+    Served from memory, then from disk, and only parsed when neither has it.
+    """
+    pdf_path = Path(pdf_path)
+    backend = get_backend_name(backend)
+    memo_key = _stat_key(pdf_path) + (backend,)
+    if memo_key in _memo:
+        return _memo[memo_key]
+
+    cache_file = _cache_path(get_pdf_hash(pdf_path), backend)
+    pages = _read_cache(cache_file) if cache_file.exists() else None
+    if pages is None:
+        pages = _extract_layout(pdf_path, backend)
+        _write_cache(cache_file, pages)
+
+    _memo[memo_key] = pages
+    return pages
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Warm the word layout cache for exam PDFs")
+    parser.add_argument("pdfs", nargs="*", type=Path, help="PDFs to cache (default: all exam PDFs)")
+    add_backend_argument(parser)
+    args = parser.parse_args()
+    if args.backend:
+        set_backend(args.backend)
+
+    pdfs = args.pdfs
+    if not pdfs:
+        from question_cropper import parse_exam_folders
+        pdfs = [e.pdf_path for e in parse_exam_folders()]
+
+    for pdf_path in pdfs:
+        pages = load_layout(pdf_path)
+        print(f"  {pdf_path.name}: {len(pages)} pages, {sum(len(p.words) for p in pages)} words")
+    print(f"✓ Layout cache ready in {LAYOUT_DIR}")
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Local Pre-Classifier
+Tags questions offline from the tags Gemini already produced, so only the
+questions it is unsure about are sent to the API:
+
+  - features: TF-IDF of words and word pairs of the extracted text (log term
+    frequency, L2-normalised)
+  - model: one centroid per (chapter, section), the sum of its tagged
+    questions plus the section's topics and terms from topics.json, so
+    sections with few or no examples still have a profile
+  - confidence: softmax over the cosine similarity to every centroid
+  - topic: that of the most similar tagged question of the chosen section
+
+Only tags from Gemini are learned from (not local tags or copied duplicates).
+The classifier trains in well under a second at startup, so no model is stored.
+
+Report agreement with the Gemini tags (cross-validated, copies of a question
+kept in the same fold), API calls saved and latency at a threshold:
+    python3 app/local_classifier.py [--threshold 0.6] [--folds 5]
+"""
+
+import re
+import time
+from collections import Counter
+
+import numpy as np
+
+DEFAULT_THRESHOLD = 0.6  # Confidence needed to tag locally (with 244 tags: ~90% agree with Gemini, ~18% tagged)
+TEMPERATURE = 20.0  # Sharpness of the softmax over centroid similarities
+TAXONOMY_WEIGHT = 2.0  # Weight of a section's topics and terms, in tagged questions
+MIN_EXAMPLES = 50  # Fewer Gemini tags than this are too few to learn from
+STOP_WORDS = set("""
+a an and are as at be by can for from has have in is it its of on or that the this to was were when which
+with what where who how following correct appropriate most least statement statements
+""".split())
+
+
+def tokenize(text: str) -> list[str]:
+    """Words (without the "Q12." label and stop words) and adjacent word pairs of a question's text."""
+    text = re.sub(r"^\s*Q?\d+\s*[.)]", "", text or "").lower()
+    words = [w for w in re.findall(r"[a-z][a-z0-9'\-]+", text) if w not in STOP_WORDS]
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+def taxonomy_documents(topics: dict) -> dict[tuple[str, str], list[str]]:
+    """Tokens of each section's name, topic names and terms, by (chapter, section)."""
+    docs = {}
+    for category, subcategories in topics.items():
+        for subcategory, specific_topics in subcategories.items():
+            words = [subcategory]
+            for topic, terms in specific_topics.items():
+                words.append(topic)
+                words.extend(terms or [])
+            docs[(category, subcategory)] = tokenize(" . ".join(words))
+    return docs
+
+
+def training_examples(tags: dict[str, dict], texts: dict[str, str]) -> list[tuple[str, str, dict]]:
+    """(rel_path, text, tag) of every Gemini tag with extracted text."""
+    return [(rel_path, texts[rel_path], tag) for rel_path, tag in sorted(tags.items())
+            if texts.get(rel_path) and tag.get("source") != "local" and not tag.get("duplicate_of")
+            and tag.get("category") and tag.get("subcategory")]
+
+
+class LocalClassifier:
+    """TF-IDF nearest-centroid classifier over (chapter, section)."""
+
+    def __init__(self, examples: list[tuple[str, str, dict]], topics: dict):
+        """
+        Args:
+            examples: (rel_path, text, tag) of tagged questions
+            topics: Taxonomy as in topics.json
+        """
+        taxonomy = taxonomy_documents(topics)
+        docs = [tokenize(text) for _, text, _ in examples]
+        self.paths = [rel_path for rel_path, _, _ in examples]
+        self.tags = [tag for _, _, tag in examples]
+
+        df = Counter(token for doc in docs + list(taxonomy.values()) for token in set(doc))
+        self.vocab = {token: i for i, token in enumerate(sorted(df))}
+        n = len(docs) + len(taxonomy)
+        self.idf = np.array([np.log((1 + n) / (1 + df[token])) + 1 for token in sorted(df)])
+
+        self.examples = np.array([self.vector(doc) for doc in docs]).reshape(len(docs), len(self.vocab))
+        self.example_labels = [(tag["category"], tag["subcategory"]) for tag in self.tags]
+        self.labels = sorted(set(self.example_labels) | set(taxonomy))
+        label_index = {label: i for i, label in enumerate(self.labels)}
+        centroids = np.zeros((len(self.labels), len(self.vocab)))
+        for vector, label in zip(self.examples, self.example_labels):
+            centroids[label_index[label]] += vector
+        for label, doc in taxonomy.items():
+            centroids[label_index[label]] += TAXONOMY_WEIGHT * self.vector(doc)
+        norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+        self.centroids = centroids / np.where(norms > 0, norms, 1)
+
+    def vector(self, tokens: list[str]) -> np.ndarray:
+        """L2-normalised TF-IDF vector of a token list (unknown tokens are ignored)."""
+        counts = np.zeros(len(self.vocab))
+        for token in tokens:
+            i = self.vocab.get(token)
+            if i is not None:
+                counts[i] += 1
+        weights = np.log1p(counts) * self.idf
+        norm = np.linalg.norm(weights)
+        return weights / norm if norm > 0 else weights
+
+    def predict(self, text: str) -> tuple[dict, float]:
+        """
+        Classify one question.
+
+        Returns:
+            (tag in the classifier's result format, confidence from 0 to 1)
+        """
+        vector = self.vector(tokenize(text))
+        if not vector.any():
+            return None, 0.0
+        scores = self.centroids @ vector
+        probs = np.exp(TEMPERATURE * (scores - scores.max()))
+        probs /= probs.sum()
+        best = int(np.argmax(probs))
+        category, subcategory = self.labels[best]
+
+        # Topic of the most similar tagged question of the chosen section, else the section itself
+        topic, nearest = subcategory, None
+        members = [i for i, label in enumerate(self.example_labels) if label == self.labels[best]]
+        if members:
+            nearest = members[int(np.argmax(self.examples[members] @ vector))]
+            topic = self.tags[nearest].get("topic") or subcategory
+        confidence = float(probs[best])
+        explanation = f"Tagged locally ({confidence:.0%} confident)" + \
+            (f"; most similar to {self.paths[nearest]}" if nearest is not None else "")
+        return {
+            "category": category,
+            "subcategory": subcategory,
+            "topic": topic,
+            "explanation": explanation,
+            "source": "local",
+            "confidence": round(confidence, 3),
+        }, confidence
+
+
+def cross_validate(examples: list[tuple[str, str, dict]], topics: dict, duplicates: dict[str, list[str]],
+                   folds: int = 5) -> list[dict]:
+    """
+    Predict every example with a model trained on the other folds. Copies of a
+    question share a fold, so a question is never predicted from its own copy.
+
+    Returns:
+        Per example: confidence, whether section / chapter / topic agree with its tag, seconds to predict
+    """
+    def fold(rel_path):
+        group = min([rel_path] + duplicates.get(rel_path, []))
+        return sum(group.encode()) % folds  # Stable across runs
+
+    assigned = [fold(rel_path) for rel_path, _, _ in examples]
+    rows = []
+    for f in range(folds):
+        train = [e for e, a in zip(examples, assigned) if a != f]
+        model = LocalClassifier(train, topics)
+        for (_, text, tag), a in zip(examples, assigned):
+            if a != f:
+                continue
+            start = time.perf_counter()
+            result, confidence = model.predict(text)
+            seconds = time.perf_counter() - start
+            result = result or {}
+            rows.append({
+                "confidence": confidence,
+                "section": (result.get("category"), result.get("subcategory")) == (tag["category"], tag["subcategory"]),
+                "chapter": result.get("category") == tag["category"],
+                "topic": result.get("topic") == tag.get("topic"),
+                "seconds": seconds,
+            })
+    return rows
+
+
+def report(threshold: float = DEFAULT_THRESHOLD, folds: int = 5):
+    from classifier_journal import load_topics
+    from state_store import StateStore
+
+    store = StateStore()
+    texts = store.question_texts()
+    tags = store.tags()
+    duplicates = store.duplicates()
+    topics = load_topics()
+    examples = training_examples(tags, texts)
+    if len(examples) < MIN_EXAMPLES:
+        print(f"Only {len(examples)} Gemini-tagged question(s) with text; need {MIN_EXAMPLES} to learn from.")
+        store.close()
+        return
+
+    rows = cross_validate(examples, topics, duplicates, folds)
+    share = lambda selected, key: sum(r[key] for r in selected) / len(selected) if selected else 0.0
+    print(f"Cross-validated on {len(rows)} Gemini-tagged questions ({folds} folds, copies kept in one fold)")
+    print(f"  Every question: {share(rows, 'section'):.0%} same section, {share(rows, 'chapter'):.0%} same chapter, "
+          f"{share(rows, 'topic'):.0%} same topic\n")
+    print("  Threshold  Tagged locally  Same section  Same chapter")
+    for t in sorted({0.3, 0.4, 0.5, 0.6, 0.7, 0.8, threshold}):
+        selected = [r for r in rows if r["confidence"] >= t]
+        marker = "  <-" if t == threshold else ""
+        print(f"  {t:9.2f}  {len(selected):5d} ({len(selected) / len(rows):4.0%})  "
+              f"{share(selected, 'section'):12.0%}  {share(selected, 'chapter'):12.0%}{marker}")
+
+    # Cost of a real run: training on every tag, then predicting the untagged questions
+    start = time.perf_counter()
+    model = LocalClassifier(examples, topics)
+    train_seconds = time.perf_counter() - start
+    untagged = [rel_path for rel_path, text in texts.items() if text and rel_path not in tags]
+    start = time.perf_counter()
+    confident = sum(1 for rel_path in untagged if model.predict(texts[rel_path])[1] >= threshold)
+    predict_seconds = time.perf_counter() - start
+    store.close()
+
+    selected = [r for r in rows if r["confidence"] >= threshold]
+    print(f"\n✓ At threshold {threshold:.2f}: {len(selected) / len(rows):.0%} of questions tagged locally "
+          f"({share(selected, 'section'):.0%} agree with Gemini), saving that share of API calls")
+    print(f"  Untagged now: {confident} of {len(untagged)} would be tagged locally")
+    latency = sum(r["seconds"] for r in rows) / len(rows)
+    print(f"  Latency: {latency * 1000:.2f} ms per question locally "
+          f"(training on {len(examples)} tags: {train_seconds * 1000:.0f} ms, "
+          f"{len(untagged)} untagged: {predict_seconds:.2f} s)")
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Report how well the local pre-classifier agrees with Gemini")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help=f"Confidence needed to tag locally (default: {DEFAULT_THRESHOLD})")
+    parser.add_argument("--folds", type=int, default=5, help="Cross-validation folds (default: 5)")
+    args = parser.parse_args()
+
+    report(args.threshold, args.folds)
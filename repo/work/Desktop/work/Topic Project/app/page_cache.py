@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+On-demand Page Rasterization
+Renders exam PDF pages only when they are needed, keeps the most recently
+used ones in a bounded LRU cache and prefetches neighbours in the background.
+"""
+
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from PIL import Image
+
+from pdf_backend import open_pdf
+
+
+class PageImageCache:
+    """Bounded LRU cache of rendered pages for one PDF."""
+
+    def __init__(self, pdf_path: Path, page_sizes: list[tuple[int, int]],
+                 dpi: int = 150, max_pages: int = 8, raster_store=None):
+        """
+        Args:
+            pdf_path: PDF to render
+            page_sizes: Expected (width, height) of each page in pixels at this DPI
+            dpi: Rendering DPI
+            max_pages: Maximum number of rendered pages kept in memory
+            raster_store: Optional RasterStore; grayscale pages are then served from it
+                as memory-mapped arrays instead of being rendered into PIL images
+        """
+        self.pdf_path = Path(pdf_path)
+        self.page_sizes = page_sizes
+        self.dpi = dpi
+        self.max_pages = max_pages
+        self.raster_store = raster_store
+        self._doc = None  # Opened on first render
+
+        self._cache: OrderedDict = OrderedDict()  # (page_num, grayscale) -> Image
+        self._pending: dict = {}  # (page_num, grayscale) -> Future
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="page-prefetch")
+
+    def __len__(self) -> int:
+        return len(self.page_sizes)
+
+    def size(self, page_num: int) -> tuple[int, int]:
+        """Get (width, height) of a page without rendering it."""
+        return self.page_sizes[page_num]
+
+    def _render(self, page_num: int, grayscale: bool) -> Image.Image:
+        if grayscale and self.raster_store is not None:
+            return self.raster_store.get(self.pdf_path, page_num, self.dpi)
+
+        with self._lock:
+            if self._doc is None:
+                self._doc = open_pdf(self.pdf_path)
+            doc = self._doc
+        return doc.render(page_num, self.dpi, grayscale)
+
+    def _store(self, key, img: Image.Image):
+        with self._lock:
+            self._cache[key] = img
+            self._cache.move_to_end(key)
+            self._pending.pop(key, None)
+            while len(self._cache) > self.max_pages:
+                self._cache.popitem(last=False)
+
+    def get(self, page_num: int, grayscale: bool = False) -> Image.Image:
+        """Get a rendered page, rendering it now if it is not cached."""
+        key = (page_num, grayscale)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+            future = self._pending.get(key)
+
+        if future is not None:
+            # Already being prefetched - wait for it instead of rendering twice
+            img = future.result()
+        else:
+            img = self._render(page_num, grayscale)
+            self._store(key, img)
+        return img
+
+    def prefetch(self, page_nums, grayscale: bool = False):
+        """Render pages in the background so a later get() is instant."""
+        for page_num in page_nums:
+            if not 0 <= page_num < len(self):
+                continue
+            key = (page_num, grayscale)
+            with self._lock:
+                if key in self._cache or key in self._pending:
+                    continue
+                self._pending[key] = self._executor.submit(self._prefetch_one, key)
+
+    def _prefetch_one(self, key) -> Image.Image:
+        try:
+            img = self._render(*key)
+        except Exception:
+            with self._lock:
+                self._pending.pop(key, None)
+            raise
+        self._store(key, img)
+        return img
+
+    def view(self, grayscale: bool = True) -> 'PageView':
+        """Sequence of pages for crop functions that index page images by number."""
+        return PageView(self, grayscale)
+
+    def close(self):
+        """Stop background rendering and drop cached pages."""
+        # Wait for a prefetch that is already rendering: it still uses the document closed below
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        with self._lock:
+            self._cache.clear()
+            self._pending.clear()
+            if self._doc is not None:
+                self._doc.close()
+                self._doc = None
+
+
+class PageView:
+    """Read-only list-like view of a PageImageCache in one colour mode."""
+
+    def __init__(self, cache: PageImageCache, grayscale: bool):
+        self.cache = cache
+        self.grayscale = grayscale
+
+    def __len__(self) -> int:
+        return len(self.cache)
+
+    def __getitem__(self, page_num: int) -> Image.Image:
+        if not 0 <= page_num < len(self.cache):
+            raise IndexError(page_num)
+        return self.cache.get(page_num, self.grayscale)
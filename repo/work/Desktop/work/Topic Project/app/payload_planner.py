@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Classifier Payload Planner
+Decides what the classifier uploads for a question instead of always sending
+the full 150 DPI crop:
+
+  - text:   the extracted text alone, when it passes a quality check and the
+            crop has nothing but text lines (most morning questions)
+  - figure: the text plus only the figure blocks of the crop (afternoon
+            questions, whose long stems and code are already in the text)
+  - image:  the text plus the whole crop (morning questions with a figure, or
+            whose text failed the check)
+
+Crops are split into blocks at blank rows: a text line is one short block,
+while tables, diagrams and framed code are tall ones. Every image is shrunk to
+at most one Gemini tile across, converted to grayscale and re-encoded with the
+cropper's reduction (1-bit or 16-level palette when near-monochrome).
+
+Print the plan and byte counts for some crops:
+    python3 app/payload_planner.py [--exam 2024A_B] [--limit 20]
+"""
+
+import io
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from content_profile import row_content
+from image_encoder import PNG_OPTIONS, prepare_image
+
+BASE_DIR = Path(__file__).parent.parent
+QUESTIONS_DIR = BASE_DIR / "data" / "output" / "cropped_questions"
+
+MIN_TEXT_CHARS = 40  # Shorter extracted text is not trusted on its own
+MIN_LETTER_RATIO = 0.5  # Share of letters among non-space characters of usable text
+OPTIONS_PATTERN = re.compile(r"(?s)\ba\).*\bb\).*\bc\).*\bd\)")  # Morning answer choices a) to d)
+FIGURE_WORDS = re.compile(r"\b(figures?|diagrams?|tables?|graphs?|charts?|flowcharts?)\b", re.IGNORECASE)
+BLANK_GAP = 3  # White rows that end a block
+FIGURE_MIN_HEIGHT = 34  # Rows of a block that is a figure, not a text line (lines are 17-32 rows at 150 DPI)
+FIGURE_PADDING = 6  # White rows kept around each figure block
+FIGURE_SPACING = 12  # White rows between stacked figure blocks
+MAX_WIDTH = 768  # One Gemini image tile across (about 100 DPI for a full-width crop)
+
+
+@dataclass
+class Payload:
+    """What is uploaded for one question."""
+    mode: str  # "text", "figure", "image" or "full" (the crop file as is)
+    image: bytes = None  # PNG bytes, or None for text only
+    size: tuple = (0, 0)  # Pixel size of the image sent
+    text_bytes: int = 0
+    source_bytes: int = 0  # Size of the crop file, i.e. what used to be sent
+
+    @property
+    def sent_bytes(self) -> int:
+        return self.text_bytes + (len(self.image) if self.image else 0)
+
+    def blob(self) -> dict:
+        """Image as an inline blob for generate_content (sent byte for byte)."""
+        return {"mime_type": "image/png", "data": self.image}
+
+
+def is_afternoon(img_path) -> bool:
+    """Whether a crop belongs to an afternoon (subject B) exam, e.g. .../2024A_B/Q06.png."""
+    return Path(img_path).parent.name.endswith("_B")
+
+
+def text_is_usable(text: str, afternoon: bool = False) -> bool:
+    """
+    Quality check of extracted text: long enough, decoded cleanly, mostly
+    letters, and (for morning questions) containing all four answer choices.
+    """
+    text = (text or "").strip()
+    if len(text) < MIN_TEXT_CHARS or "(cid:" in text or "�" in text:
+        return False
+    visible = re.sub(r"\s", "", text)
+    if sum(c.isalpha() for c in visible) < MIN_LETTER_RATIO * len(visible):
+        return False
+    return afternoon or OPTIONS_PATTERN.search(text) is not None
+
+
+def content_blocks(gray: np.ndarray) -> list[tuple[int, int]]:
+    """(top, bottom) rows of the runs of content rows in a grayscale crop, split at BLANK_GAP white rows."""
+    rows = np.flatnonzero(row_content(gray))
+    if len(rows) == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(rows) > BLANK_GAP)
+    starts = np.concatenate(([rows[0]], rows[breaks + 1]))
+    ends = np.concatenate((rows[breaks], [rows[-1]])) + 1
+    return list(zip(starts.tolist(), ends.tolist()))
+
+
+def figure_blocks(blocks: list[tuple[int, int]]) -> list[tuple[int, int]]:
+    """Blocks much taller than a text line (tables, diagrams, framed code)."""
+    return [(top, bottom) for top, bottom in blocks if bottom - top >= FIGURE_MIN_HEIGHT]
+
+
+def stack_figures(gray: np.ndarray, figures: list[tuple[int, int]]) -> np.ndarray:
+    """The figure blocks of a crop stacked into one image, trimmed to their columns."""
+    height, _ = gray.shape
+    slices = [gray[max(0, top - FIGURE_PADDING):min(height, bottom + FIGURE_PADDING)] for top, bottom in figures]
+    spacer = np.full((FIGURE_SPACING, gray.shape[1]), 255, dtype=gray.dtype)
+    stacked = np.concatenate([part for s in slices for part in (s, spacer)][:-1])
+    columns = np.flatnonzero(row_content(stacked.T))
+    left = max(0, int(columns[0]) - FIGURE_PADDING)
+    right = min(stacked.shape[1], int(columns[-1]) + 1 + FIGURE_PADDING)
+    return stacked[:, left:right]
+
+
+def encode_small(gray: np.ndarray) -> tuple[bytes, tuple[int, int]]:
+    """Downscale a grayscale image to MAX_WIDTH and encode it as the smallest legible PNG."""
+    img = Image.fromarray(gray)
+    if img.width > MAX_WIDTH:
+        img = img.resize((MAX_WIDTH, max(1, round(img.height * MAX_WIDTH / img.width))), Image.LANCZOS)
+    prepared, png_options, _ = prepare_image(img)
+    buf = io.BytesIO()
+    prepared.save(buf, "PNG", **PNG_OPTIONS, **png_options)
+    return buf.getvalue(), img.size
+
+
+@lru_cache(maxsize=256)  # Grouping estimates a payload before it is sent; plan each question once
+def plan_payload(img_path: str, ocr_text: str, full_images: bool = False) -> Payload:
+    """
+    Choose the smallest upload that still shows the model the whole question.
+
+    Args:
+        img_path: Cropped question image
+        ocr_text: Text extracted by the cropper
+        full_images: Send the crop file unchanged (the old behaviour)
+
+    Returns:
+        Payload; its text is always the OCR text, sent alongside any image
+    """
+    path = Path(img_path)
+    source = path.read_bytes()
+    text_bytes = len((ocr_text or "").encode("utf-8"))
+    if full_images:
+        with Image.open(io.BytesIO(source)) as img:
+            size = img.size
+        return Payload("full", source, size, text_bytes, len(source))
+
+    with Image.open(io.BytesIO(source)) as img:
+        gray = np.asarray(img.convert("L"))
+    afternoon = is_afternoon(path)
+    figures = figure_blocks(content_blocks(gray))
+
+    if text_is_usable(ocr_text, afternoon):
+        if not figures and not FIGURE_WORDS.search(ocr_text):
+            return Payload("text", None, (0, 0), text_bytes, len(source))
+        if afternoon and figures:
+            image, size = encode_small(stack_figures(gray, figures))
+            return Payload("figure", image, size, text_bytes, len(source))
+    image, size = encode_small(gray)
+    return Payload("image", image, size, text_bytes, len(source))
+
+
+if __name__ == "__main__":
+    import argparse
+    from collections import Counter
+
+    from state_store import StateStore
+
+    parser = argparse.ArgumentParser(description="Show what the classifier would upload for each question")
+    parser.add_argument("--exam", default=None, help="Only this exam folder, e.g. 2024A_B")
+    parser.add_argument("--limit", type=int, default=None, help="Most questions to plan")
+    args = parser.parse_args()
+
+    store = StateStore()
+    texts = store.question_texts()
+    store.close()
+
+    paths = sorted(QUESTIONS_DIR.glob(f"{args.exam or '*'}/Q*.png"))[:args.limit]
+    modes, sent, source = Counter(), 0, 0
+    for path in paths:
+        rel_path = f"{path.parent.name}/{path.name}"
+        payload = plan_payload(str(path), texts.get(rel_path, ""))
+        modes[payload.mode] += 1
+        sent += payload.sent_bytes
+        source += payload.source_bytes
+        print(f"{rel_path}: {payload.mode:<6} {payload.sent_bytes / 1024:7.1f} KB "
+              f"(crop {payload.source_bytes / 1024:.1f} KB)")
+
+    if paths:
+        print(f"\n✓ {len(paths)} question(s): {sent / 1024:.0f} KB to send instead of {source / 1024:.0f} KB "
+              f"({sent / max(1, source):.0%}); " + ", ".join(f"{n} {mode}" for mode, n in modes.most_common()))
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Pluggable PDF Backends
+One interface for everything the pipeline asks of a PDF: open the document,
+list words with boxes, extract text in a box, and render a page or a clip.
+
+Backends:
+    pdfplumber - pdfplumber for words/text, pdf2image (poppler) for rendering
+    pymupdf    - PyMuPDF (fitz) for everything
+
+Select with --backend on the CLI scripts or the FE_PDF_BACKEND environment variable.
+"""
+
+import os
+import threading
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+BACKEND_ENV_VAR = "FE_PDF_BACKEND"
+DEFAULT_BACKEND = "pdfplumber"
+
+
+class PdfDocument:
+    """Base class for an open PDF. Coordinates are PDF points unless noted."""
+
+    name = ""
+
+    def __init__(self, pdf_path: Path):
+        self.pdf_path = Path(pdf_path)
+        # Rendering libraries are not thread-safe per document
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def page_count(self) -> int:
+        raise NotImplementedError
+
+    def page_size(self, page_num: int) -> tuple[float, float]:
+        """(width, height) of a page in points."""
+        raise NotImplementedError
+
+    def words(self, page_num: int) -> list[tuple]:
+        """Words of a page as (text, x0, top, x1, bottom) tuples, in reading order."""
+        raise NotImplementedError
+
+    def text_in_bbox(self, page_num: int, bbox: tuple[float, float, float, float]) -> str:
+        """Text of the region (x0, top, x1, bottom) of a page."""
+        raise NotImplementedError
+
+    def page_text(self, page_num: int) -> str:
+        """Full text of a page, one line per text line."""
+        raise NotImplementedError
+
+    def render(self, page_num: int, dpi: int, grayscale: bool = False) -> Image.Image:
+        """Render a whole page ('L' or 'RGB')."""
+        raise NotImplementedError
+
+    def render_pages(self, first_page: int, last_page: int, dpi: int, grayscale: bool = False) -> list[Image.Image]:
+        """Render a range of pages (0-indexed, inclusive)."""
+        return [self.render(n, dpi, grayscale) for n in range(first_page, last_page + 1)]
+
+    def render_clip(self, page_num: int, dpi: int, box: tuple[int, int, int, int]) -> np.ndarray:
+        """
+        Render the pixel box (x1, y1, x2, y2) of a page at the given DPI as a 2D grayscale
+        uint8 array of exactly the box's size. Areas outside the page are white.
+        Backends that cannot clip render the page and cut the box out of it.
+        """
+        page = np.asarray(self.render(page_num, dpi, grayscale=True))
+        return _place(page, 0, 0, box)
+
+    def close(self):
+        pass
+
+
+def _place(pixels: np.ndarray, origin_x: int, origin_y: int, box: tuple[int, int, int, int]) -> np.ndarray:
+    """Copy the part of a rendered area (top-left at origin) that falls in box onto a white canvas."""
+    x1, y1, x2, y2 = box
+    out = np.full((max(0, y2 - y1), max(0, x2 - x1)), 255, dtype=np.uint8)
+    dx, dy = origin_x - x1, origin_y - y1
+    sx1, sy1 = max(0, -dx), max(0, -dy)
+    tx1, ty1 = max(0, dx), max(0, dy)
+    w = min(pixels.shape[1] - sx1, out.shape[1] - tx1)
+    h = min(pixels.shape[0] - sy1, out.shape[0] - ty1)
+    if w > 0 and h > 0:
+        out[ty1:ty1 + h, tx1:tx1 + w] = pixels[sy1:sy1 + h, sx1:sx1 + w]
+    return out
+
+
+class PlumberDocument(PdfDocument):
+    """pdfplumber for text, pdf2image/poppler for rendering."""
+
+    name = "pdfplumber"
+
+    def __init__(self, pdf_path: Path):
+        import pdfplumber
+        super().__init__(pdf_path)
+        self._pdf = pdfplumber.open(self.pdf_path)
+        self._last_render = None  # (page_num, dpi, grayscale, image) - clips reuse the page
+
+    @property
+    def page_count(self) -> int:
+        return len(self._pdf.pages)
+
+    def page_size(self, page_num):
+        page = self._pdf.pages[page_num]
+        return float(page.width), float(page.height)
+
+    # pdfplumber pages are not thread-safe: text is read under the same lock as render()
+    def words(self, page_num):
+        with self._lock:
+            return [(w['text'], w['x0'], w['top'], w['x1'], w['bottom'])
+                    for w in self._pdf.pages[page_num].extract_words()]
+
+    def text_in_bbox(self, page_num, bbox):
+        with self._lock:
+            return self._pdf.pages[page_num].within_bbox(bbox).extract_text() or ""
+
+    def page_text(self, page_num):
+        with self._lock:
+            return self._pdf.pages[page_num].extract_text() or ""
+
+    def render(self, page_num, dpi, grayscale=False):
+        from pdf2image import convert_from_path
+        with self._lock:
+            cached = self._last_render
+            if cached and cached[:3] == (page_num, dpi, grayscale):
+                return cached[3]
+            img = convert_from_path(
+                str(self.pdf_path), dpi=dpi,
+                first_page=page_num + 1, last_page=page_num + 1,
+                grayscale=grayscale
+            )[0]
+            self._last_render = (page_num, dpi, grayscale, img)
+            return img
+
+    def render_pages(self, first_page, last_page, dpi, grayscale=False):
+        # One poppler run for the whole range instead of one per page
+        from pdf2image import convert_from_path
+        return convert_from_path(
+            str(self.pdf_path), dpi=dpi,
+            first_page=first_page + 1, last_page=last_page + 1,
+            grayscale=grayscale
+        )
+
+    def close(self):
+        with self._lock:  # Not while another thread is still reading the document
+            self._pdf.close()
+            self._last_render = None
+
+
+class MuPdfDocument(PdfDocument):
+    """PyMuPDF (fitz) for text and rendering."""
+
+    name = "pymupdf"
+
+    def __init__(self, pdf_path: Path):
+        try:
+            import pymupdf as fitz
+        except ImportError:  # PyMuPDF < 1.24.3 only ships the fitz name
+            import fitz
+        super().__init__(pdf_path)
+        self._fitz = fitz
+        self._doc = fitz.open(self.pdf_path)
+
+    @property
+    def page_count(self) -> int:
+        return self._doc.page_count
+
+    def page_size(self, page_num):
+        rect = self._doc[page_num].rect
+        return float(rect.width), float(rect.height)
+
+    def words(self, page_num):
+        with self._lock:
+            return [(w[4], w[0], w[1], w[2], w[3]) for w in self._doc[page_num].get_text("words")]
+
+    def text_in_bbox(self, page_num, bbox):
+        with self._lock:
+            return self._doc[page_num].get_text("text", clip=self._fitz.Rect(bbox)).strip()
+
+    def page_text(self, page_num):
+        with self._lock:
+            return self._doc[page_num].get_text("text")
+
+    def _pixmap(self, page_num, dpi, grayscale, clip=None):
+        colorspace = self._fitz.csGRAY if grayscale else self._fitz.csRGB
+        with self._lock:
+            return self._doc[page_num].get_pixmap(dpi=dpi, clip=clip, colorspace=colorspace, alpha=False)
+
+    def render(self, page_num, dpi, grayscale=False):
+        pix = self._pixmap(page_num, dpi, grayscale)
+        return Image.frombytes("L" if grayscale else "RGB", (pix.width, pix.height),
+                               pix.samples, "raw", "L" if grayscale else "RGB", pix.stride)
+
+    def render_clip(self, page_num, dpi, box):
+        x1, y1, x2, y2 = box
+        scale = 72.0 / dpi
+        clip = self._fitz.Rect(x1 * scale, y1 * scale, x2 * scale, y2 * scale)
+        pix = self._pixmap(page_num, dpi, True, clip=clip)
+        if not (pix.width and pix.height):
+            return _place(np.zeros((0, 0), dtype=np.uint8), x1, y1, box)
+        pixels = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.stride)[:, :pix.width]
+        # Place the pixmap by its own origin (clip rounding can shift it by a pixel)
+        return _place(pixels, pix.x, pix.y, box)
+
+    def close(self):
+        with self._lock:  # Not while another thread is still rendering (use-after-close in get_pixmap)
+            self._doc.close()
+
+
+BACKENDS = {
+    PlumberDocument.name: PlumberDocument,
+    MuPdfDocument.name: MuPdfDocument,
+}
+
+
+def get_backend_name(name: str = None) -> str:
+    """Resolve a backend name: explicit argument, then FE_PDF_BACKEND, then the default."""
+    name = name or os.environ.get(BACKEND_ENV_VAR) or DEFAULT_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown PDF backend '{name}'. Choose from: {', '.join(BACKENDS)}")
+    return name
+
+
+def set_backend(name: str):
+    """Select the backend for this process and any worker processes it starts."""
+    os.environ[BACKEND_ENV_VAR] = get_backend_name(name)
+
+
+def open_pdf(pdf_path: Path, backend: str = None) -> PdfDocument:
+    """Open a PDF with the selected backend."""
+    return BACKENDS[get_backend_name(backend)](pdf_path)
+
+
+def add_backend_argument(parser):
+    """Add the shared --backend option to a script's argument parser."""
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default=None,
+                        help=f"PDF backend (default: ${BACKEND_ENV_VAR} or {DEFAULT_BACKEND})")
@@ -7,20 +7,33 @@ Interactive tool for cropping individual questions from ITPEC FE exam PDFs.
 import os
 import re
 import json
+import math
+import threading
 from pathlib import Path
 from dataclasses import dataclass, asdict
 from typing import Optional
-import pdfplumber
 from PIL import Image
 
+from layout_cache import load_layout, words_to_text
+from content_profile import (
+    PageProfiles, bottom_trim_height, compose_segments, plan_segment_rows, row_content, stack_segments,
+    top_trim_offset
+)
+from pdf_backend import add_backend_argument, open_pdf, set_backend
+from page_cache import PageImageCache
+from raster_store import RasterStore
+from image_encoder import add_variants_argument, save_question_image, set_variants
+from state_store import StateStore
+from classifier_journal import load_topics
+
 # GUI-only imports (lazy - only needed when running the cropper GUI)
-# tkinter, ImageTk, pdf2image are imported inside QuestionCropperApp
+# tkinter and ImageTk are imported inside QuestionCropperApp; pdf2image inside PageImageCache
 
 # Configuration
 BASE_DIR = Path(__file__).parent.parent
 QUESTIONS_DIR = BASE_DIR / "data" / "input" / "past_exams"
 OUTPUT_DIR = BASE_DIR / "data" / "output" / "cropped_questions"
-PROGRESS_FILE = BASE_DIR / "data" / "state" / ".cropper_progress.json"
+AUTO_CROP_STATE_DIR = BASE_DIR / "data" / "state" / "auto_crop"  # Per-exam checkpoints of --auto runs
 TOPICS_FILE = BASE_DIR / "data" / "output" / "topics.json"
 DPI = 150  # Resolution for PDF conversion
 
@@ -149,23 +162,20 @@ def parse_exam_folders() -> list[ExamInfo]:
 
 def detect_question_positions(pdf_path: Path) -> list[tuple[int, int, float]]:
     """
-    Detect question positions in PDF.
+    Detect question positions in PDF (from the cached word layout).
     Returns list of (question_num, page_num, y_position).
     """
     questions = []
     
-    with pdfplumber.open(pdf_path) as pdf:
-        for page_num, page in enumerate(pdf.pages):
-            words = page.extract_words()
-            
-            for i, word in enumerate(words):
-                text = word['text']
-                # Match Q1., Q2., etc.
-                match = re.match(r'^Q(\d+)\.$', text)
-                if match:
-                    q_num = int(match.group(1))
-                    y_pos = word['top']
-                    questions.append((q_num, page_num, y_pos))
+    for page_num, page in enumerate(load_layout(pdf_path)):
+        for word in page.iter_words():
+            text = word['text']
+            # Match Q1., Q2., etc.
+            match = re.match(r'^Q(\d+)\.$', text)
+            if match:
+                q_num = int(match.group(1))
+                y_pos = word['top']
+                questions.append((q_num, page_num, y_pos))
     
     return sorted(questions, key=lambda x: (x[0]))
 
@@ -178,138 +188,422 @@ def detect_page_number_positions(pdf_path: Path) -> dict[int, float]:
     """
     page_num_positions = {}
     
-    with pdfplumber.open(pdf_path) as pdf:
-        for page_num, page in enumerate(pdf.pages):
-            words = page.extract_words()
-            
-            # Look for page number patterns at the bottom of the page
-            # They are usually in the bottom 10% of the page
-            bottom_threshold = page.height * 0.90
-            
-            for word in words:
-                if word['top'] > bottom_threshold:
-                    text = word['text']
-                    # Match patterns like '-23-', '- 23 -', or just numbers at bottom
-                    if re.match(r'^-?\d+-?$', text.replace(' ', '')):
-                        page_num_positions[page_num] = word['top']
-                        break
+    for page_num, page in enumerate(load_layout(pdf_path)):
+        # Look for page number patterns at the bottom of the page
+        # They are usually in the bottom 10% of the page
+        bottom_threshold = page.height * 0.90
+        
+        for word in page.iter_words():
+            if word['top'] > bottom_threshold:
+                text = word['text']
+                # Match patterns like '-23-', '- 23 -', or just numbers at bottom
+                if re.match(r'^-?\d+-?$', text.replace(' ', '')):
+                    page_num_positions[page_num] = word['top']
+                    break
     
     return page_num_positions
 
 
+def get_page_pixel_sizes(pdf_path: Path, dpi: int = DPI) -> list[tuple[int, int]]:
+    """
+    Get (width, height) in pixels of every page at the given DPI, without rendering.
+    Matches poppler's rounding (pixel sizes are rounded up).
+    """
+    scale = dpi / 72.0
+    return [(math.ceil(p.width * scale), math.ceil(p.height * scale)) for p in load_layout(pdf_path)]
+
+
+def _gray_pixels(img):
+    """Grayscale pixels of a PIL image, or a 2D uint8 page array as-is (no copy)."""
+    import numpy as np
+    
+    if isinstance(img, np.ndarray):
+        return img
+    return np.array(img.convert('L'))
+
+
+def _image_size(img) -> tuple[int, int]:
+    """(width, height) of a PIL image or a 2D page array."""
+    if isinstance(img, Image.Image):
+        return img.size
+    return img.shape[1], img.shape[0]
+
+
+def crop_region(page, box: tuple[int, int, int, int]):
+    """
+    Crop (x1, y1, x2, y2) from a PIL page image or a 2D page array.
+    Arrays are sliced without copying; like PIL, areas outside the page are black.
+    """
+    import numpy as np
+    
+    if isinstance(page, Image.Image):
+        return page.crop(box)
+    
+    x1, y1, x2, y2 = box
+    height, width = page.shape
+    if 0 <= x1 <= x2 <= width and 0 <= y1 <= y2 <= height:
+        return page[y1:y2, x1:x2]
+    
+    out = np.zeros((max(0, y2 - y1), max(0, x2 - x1)), dtype=np.uint8)
+    sx1, sy1 = max(x1, 0), max(y1, 0)
+    sx2, sy2 = min(x2, width), min(y2, height)
+    if sx2 > sx1 and sy2 > sy1:
+        out[sy1 - y1:sy2 - y1, sx1 - x1:sx2 - x1] = page[sy1:sy2, sx1:sx2]
+    return out
+
+
 def trim_whitespace_bottom(img: Image.Image, threshold: int = 245, min_content_rows: int = 5) -> Image.Image:
     """
     Trim whitespace from the bottom of an image.
     
     Args:
-        img: PIL Image to trim
+        img: PIL Image (or 2D grayscale page array) to trim
         threshold: Pixel brightness threshold (0-255), pixels above this are "white"
         min_content_rows: Minimum consecutive non-white rows to consider as content
     
     Returns:
-        Trimmed image
+        Trimmed image (arrays are returned as zero-copy slices)
     """
-    import numpy as np
-    
-    # Convert to grayscale numpy array
-    gray = img.convert('L')
-    pixels = np.array(gray)
+    width, height = _image_size(img)
+    new_height = bottom_trim_height(row_content(_gray_pixels(img), threshold))
+    if new_height < height:
+        return crop_region(img, (0, 0, width, new_height))
+    return img
+
+
+def trim_whitespace_top(img: Image.Image, threshold: int = 245) -> Image.Image:
+    """Trim whitespace from the top of an image (PIL Image or 2D grayscale page array)."""
+    width, height = _image_size(img)
+    new_top = top_trim_offset(row_content(_gray_pixels(img), threshold))
+    if new_top > 0:
+        return crop_region(img, (0, new_top, width, height))
+    return img
+
+
+def crop_segment_boxes(crop: 'QuestionCrop') -> list[tuple[int, tuple[int, int, int, int]]]:
+    """List the (page_num, (x1, y1, x2, y2)) pixel box of every page segment of a crop."""
+    boxes = [(crop.page_num, (crop.x1, crop.y1, crop.x2, crop.y2))]
+    for ep in crop.extra_pages or []:
+        # Use same x coordinates as first page
+        boxes.append((ep['page_num'], (crop.x1, ep['y1'], crop.x2, ep['y2'])))
+    return boxes
+
+
+def combine_crop_segments(segments: list) -> Image.Image:
+    """
+    Trim and vertically concatenate the page segments of a question.
     
-    # Find rows that have content (not all white)
-    # Use stricter threshold to avoid cutting light text
-    row_has_content = np.any(pixels < threshold, axis=1)
+    Args:
+        segments: Cropped segments (PIL Images or 2D grayscale arrays), first page first
     
-    # Find the last row with content
-    content_rows = np.where(row_has_content)[0]
-    if len(content_rows) == 0:
-        return img  # All white, return as-is
+    Returns:
+        Combined image with all page segments vertically concatenated
+    """
+    # Trim whitespace from bottom of first page
+    images = [trim_whitespace_bottom(segments[0])]
     
-    last_content_row = content_rows[-1]
+    # Trim whitespace from top and bottom of each additional page segment
+    for segment in segments[1:]:
+        images.append(trim_whitespace_bottom(trim_whitespace_top(segment)))
     
-    # Add generous padding to ensure text isn't cut
-    new_height = min(last_content_row + 70, img.height)
+    return stack_segments(images)
+
+
+def combine_multipage_crop(page_images: list[Image.Image], crop: 'QuestionCrop') -> Image.Image:
+    """
+    Combine crops from multiple pages into a single image.
     
-    # Only crop if there's substantial whitespace (more than 60 pixels)
-    if img.height - new_height > 60:
-        return img.crop((0, 0, img.width, new_height))
+    Args:
+        page_images: List of page images (PIL Images, or 2D grayscale arrays such as
+            RasterStore memmaps)
+        crop: QuestionCrop with optional extra_pages
     
-    return img
+    Returns:
+        Combined image with all page segments vertically concatenated
+    """
+    segments = [crop_region(page_images[page_num], box) for page_num, box in crop_segment_boxes(crop)]
+    return combine_crop_segments(segments)
 
 
-def trim_whitespace_top(img: Image.Image, threshold: int = 245) -> Image.Image:
-    """Trim whitespace from the top of an image."""
-    import numpy as np
+def crop_question_image(page_images, crop: 'QuestionCrop', profiles: Optional[PageProfiles] = None,
+                        mode: str = 'L') -> Image.Image:
+    """
+    Cut, trim and stack a question from its pages, deciding every trim from cached
+    row-content profiles. Gives exactly the pixels of
+    trim_whitespace_bottom(combine_multipage_crop(page_images, crop)).
     
-    gray = img.convert('L')
-    pixels = np.array(gray)
+    Args:
+        page_images: Grayscale page images (PIL Images or 2D arrays) indexed by page number
+        crop: QuestionCrop with optional extra_pages
+        profiles: PageProfiles of the same pages, shared across the exam's crops
+        mode: 'L' (grayscale) or 'P' (palette) output
     
-    row_has_content = np.any(pixels < threshold, axis=1)
-    content_rows = np.where(row_has_content)[0]
+    Returns:
+        Final question image
+    """
+    if profiles is None:
+        profiles = PageProfiles(page_images)
+    boxes = crop_segment_boxes(crop)
+    ranges = plan_segment_rows([profiles.segment_rows(page_num, box) for page_num, box in boxes])
     
-    if len(content_rows) == 0:
-        return img
+    # Only the kept rows are copied, straight from each page into the output
+    parts = [
+        (page_images[page_num], (x1, y1 + top, x2, y1 + end))
+        for (page_num, (x1, y1, x2, y2)), (top, end) in zip(boxes, ranges)
+    ]
+    return compose_segments(parts, mode)
+
+
+def trim_rendered_segments(segments: list, mode: str = 'L') -> Image.Image:
+    """
+    Trim and stack already rendered segments (e.g. clip renders), scanning each one once.
+    Gives exactly the pixels of trim_whitespace_bottom(combine_crop_segments(segments)).
+    """
+    ranges = plan_segment_rows([row_content(_gray_pixels(s)) for s in segments])
+    parts = [(s, (0, top, _image_size(s)[0], end)) for s, (top, end) in zip(segments, ranges)]
+    return compose_segments(parts, mode)
+
+
+def render_crop_segments(doc, crop: 'QuestionCrop', dpi: int = DPI) -> list:
+    """
+    Render only the clip rectangles of a crop (never whole pages, where the backend can clip).
+    
+    Args:
+        doc: Open PdfDocument of the exam PDF
+        crop: QuestionCrop (pixel coordinates at the given DPI)
+        dpi: Rendering DPI
     
-    first_content_row = content_rows[0]
+    Returns:
+        One 2D grayscale uint8 array per page segment, exactly the size of its box
+    """
+    return [doc.render_clip(page_num, dpi, box) for page_num, box in crop_segment_boxes(crop)]
+
+
+def plan_question_crops(page_sizes: list[tuple[int, int]],
+                        question_positions: list[tuple[int, int, float]],
+                        page_num_positions: dict[int, float],
+                        dpi: int = DPI) -> list[QuestionCrop]:
+    """
+    Compute the default crop region of every detected question.
     
-    # Keep a small margin at the top
-    new_top = max(0, first_content_row - 10)
+    Args:
+        page_sizes: (width, height) of each page image in pixels
+        question_positions: Output of detect_question_positions()
+        page_num_positions: Output of detect_page_number_positions()
+        dpi: DPI of the page images
     
-    if new_top > 30:
-        return img.crop((0, new_top, img.width, img.height))
+    Returns:
+        List of unconfirmed QuestionCrop objects (multi-page questions get extra_pages)
+    """
+    # Scale factor from PDF points to image pixels
+    scale = dpi / 72.0
     
-    return img
+    crops = []
+    for i, (q_num, page_num, y_pos) in enumerate(question_positions):
+        # Calculate crop region
+        page_height = page_sizes[page_num][1]
+        page_width = page_sizes[page_num][0]
+        
+        # y1: Start a bit above the "Q" text
+        y1 = int(y_pos * scale) - 10
+        
+        # Determine where the next question starts
+        if i + 1 < len(question_positions):
+            next_q = question_positions[i + 1]
+            next_q_page = next_q[1]
+            next_q_y = int(next_q[2] * scale) - 15
+        else:
+            # Last question - use end of last page, but check for page number
+            next_q_page = len(page_sizes) - 1
+            if next_q_page in page_num_positions:
+                next_q_y = int(page_num_positions[next_q_page] * scale) - 20
+            else:
+                next_q_y = page_sizes[next_q_page][1] - 50
+        
+        extra_pages = []
+        
+        if next_q_page == page_num:
+            # Same page - simple case
+            y2 = next_q_y
+        elif next_q_page == page_num + 1:
+            # Next page - single page break
+            # First page: crop to page number or page bottom
+            if page_num in page_num_positions:
+                page_num_y = int(page_num_positions[page_num] * scale) - 20
+                y2 = min(page_num_y, page_height - 50)
+            else:
+                y2 = page_height - 50
+                
+            # Second page: from top to next question
+            next_page_height = page_sizes[next_q_page][1]
+            extra_pages.append({
+                'page_num': next_q_page,
+                'y1': 50,  # Start below header
+                'y2': next_q_y
+            })
+        else:
+            # Multi-page question (spans 3+ pages)
+            # First page: crop to page number
+            if page_num in page_num_positions:
+                page_num_y = int(page_num_positions[page_num] * scale) - 20
+                y2 = min(page_num_y, page_height - 50)
+            else:
+                y2 = page_height - 50
+            
+            # Middle pages: full page (minus header/footer)
+            for mid_page in range(page_num + 1, next_q_page):
+                mid_page_height = page_sizes[mid_page][1]
+                if mid_page in page_num_positions:
+                    mid_page_num_y = int(page_num_positions[mid_page] * scale) - 20
+                    mid_y2 = min(mid_page_num_y, mid_page_height - 50)
+                else:
+                    mid_y2 = mid_page_height - 50
+                extra_pages.append({
+                    'page_num': mid_page,
+                    'y1': 50,
+                    'y2': mid_y2
+                })
+            
+            # Last page: from top to next question
+            extra_pages.append({
+                'page_num': next_q_page,
+                'y1': 50,
+                'y2': next_q_y
+            })
+        
+        crops.append(QuestionCrop(
+            question_num=q_num,
+            page_num=page_num,
+            x1=30,
+            y1=max(0, y1),
+            x2=page_width - 30,
+            y2=min(page_height, y2),
+            confirmed=False,
+            extra_pages=extra_pages
+        ))
+    
+    return crops
 
 
-def combine_multipage_crop(page_images: list[Image.Image], crop: 'QuestionCrop') -> Image.Image:
+def plan_exam_crops(pdf_path: Path, dpi: int = DPI) -> list[QuestionCrop]:
     """
-    Combine crops from multiple pages into a single image.
+    Plan every question crop of an exam from its word layout alone
+    (no GUI and no page rendering).
+    """
+    return plan_question_crops(
+        get_page_pixel_sizes(pdf_path, dpi),
+        detect_question_positions(pdf_path),
+        detect_page_number_positions(pdf_path),
+        dpi
+    )
+
+
+def apply_saved_crops(crops: list[QuestionCrop], saved_crops: list[dict]):
+    """Apply saved progress (adjusted bounds, confirmation, text) onto detected crops."""
+    for saved_crop in saved_crops:
+        for crop in crops:
+            if crop.question_num == saved_crop['question_num']:
+                crop.x2 = saved_crop['x2']
+                crop.y2 = saved_crop['y2']
+                crop.confirmed = saved_crop['confirmed']
+                crop.extracted_text = saved_crop.get('extracted_text', "")
+                break
+
+
+def clean_extracted_text(text: str) -> str:
+    """Simple cleanup: remove excessive newlines."""
+    return re.sub(r'\n+', '\n', text).strip()
+
+
+def crop_text_bboxes(crop: QuestionCrop, page_sizes: list[tuple[float, float]],
+                     dpi: int = DPI) -> list[tuple[int, tuple[float, float, float, float]]]:
+    """
+    Convert a crop's page segments from pixels to PDF points, clamped to each page.
     
     Args:
-        page_images: List of page images
-        crop: QuestionCrop with optional extra_pages
+        crop: QuestionCrop object
+        page_sizes: (width, height) of every page in points
+        dpi: DPI the crop coordinates are in
     
     Returns:
-        Combined image with all page segments vertically concatenated
+        [(page_num, (x0, top, x1, bottom)), ...] for segments with a non-empty area
     """
-    # Crop the first page
-    first_page = page_images[crop.page_num]
-    first_crop = first_page.crop((crop.x1, crop.y1, crop.x2, crop.y2))
-    # Trim whitespace from bottom of first page
-    first_crop = trim_whitespace_bottom(first_crop)
-    images = [first_crop]
+    scale = 72.0 / dpi
+    bboxes = []
     
-    # Crop extra pages if any
-    if crop.extra_pages:
-        for ep in crop.extra_pages:
-            page_img = page_images[ep['page_num']]
-            # Use same x coordinates as first page
-            cropped = page_img.crop((crop.x1, ep['y1'], crop.x2, ep['y2']))
-            # Trim whitespace from top and bottom of each additional page segment
-            cropped = trim_whitespace_top(cropped)
-            cropped = trim_whitespace_bottom(cropped)
-            images.append(cropped)
+    # First page, then extra pages (same X coordinates, different Y)
+    for page_num, (x1, y1, x2, y2) in crop_segment_boxes(crop):
+        if page_num >= len(page_sizes):
+            continue
+        page_width, page_height = page_sizes[page_num]
+        bbox = (
+            max(0, x1 * scale),
+            max(0, y1 * scale),
+            min(page_width, x2 * scale),
+            min(page_height, y2 * scale)
+        )
+        
+        # Check for valid area
+        if bbox[2] > bbox[0] and bbox[3] > bbox[1]:
+            bboxes.append((page_num, bbox))
+    
+    return bboxes
+
+
+def extract_crop_text(doc, crop: QuestionCrop, dpi: int = DPI) -> str:
+    """
+    Extract the text of a crop directly from an open PdfDocument (the backend's own
+    text extraction, used to compare backends).
     
-    if len(images) == 1:
-        return images[0]
+    Args:
+        doc: Open PdfDocument of the exam PDF
+        crop: QuestionCrop object
+        dpi: DPI the crop coordinates are in
     
-    # Calculate total height
-    total_height = sum(img.height for img in images)
-    max_width = max(img.width for img in images)
+    Returns:
+        Extracted text string
+    """
+    page_sizes = [doc.page_size(n) for n in range(doc.page_count)]
+    full_text = []
+    for page_num, bbox in crop_text_bboxes(crop, page_sizes, dpi):
+        text = doc.text_in_bbox(page_num, bbox)
+        if text:
+            full_text.append(text)
+    return "\n".join(full_text)
+
+
+def extract_texts_from_crops(pdf_path: Path, crops: list, dpi: int = DPI) -> list[str]:
+    """
+    Extract the text of many crops of one PDF in a single pass.
+    Words come from the cached layout (the PDF is parsed at most once) and are
+    assigned to each crop segment by bisecting on their sorted tops.
     
-    # Create combined image
-    combined = Image.new('RGB', (max_width, total_height), (255, 255, 255))
+    Args:
+        pdf_path: Path to the PDF file
+        crops: QuestionCrop objects (or anything with the same fields)
+        dpi: DPI the crop coordinates are in
     
-    y_offset = 0
-    for img in images:
-        combined.paste(img, (0, y_offset))
-        y_offset += img.height
+    Returns:
+        Extracted text string for each crop, in order
+    """
+    pages = load_layout(pdf_path)
+    page_sizes = [(p.width, p.height) for p in pages]
     
-    return combined
+    texts = []
+    for crop in crops:
+        full_text = []
+        for page_num, bbox in crop_text_bboxes(crop, page_sizes, dpi):
+            text = words_to_text(pages[page_num].words_in_bbox(bbox))
+            if text:
+                full_text.append(text)
+        texts.append("\n".join(full_text))
+    return texts
 
 
 def extract_text_from_crop(pdf_path: Path, crop: QuestionCrop, dpi: int = 150) -> str:
     """
     Extract text from the PDF region corresponding to the crop.
+    For more than one crop of the same PDF use extract_texts_from_crops().
     
     Args:
         pdf_path: Path to the PDF file
@@ -319,65 +613,146 @@ def extract_text_from_crop(pdf_path: Path, crop: QuestionCrop, dpi: int = 150) -
     Returns:
         Extracted text string
     """
-    scale = 72.0 / dpi
-    full_text = []
-    
     try:
-        with pdfplumber.open(pdf_path) as pdf:
-            # First page
-            if crop.page_num < len(pdf.pages):
-                page = pdf.pages[crop.page_num]
-                # Convert pixels to points
-                bbox = (
-                    crop.x1 * scale,
-                    crop.y1 * scale,
-                    crop.x2 * scale,
-                    crop.y2 * scale
-                )
-                # Ensure bbox is within page
-                bbox = (
-                    max(0, bbox[0]),
-                    max(0, bbox[1]),
-                    min(page.width, bbox[2]),
-                    min(page.height, bbox[3])
-                )
-                
-                # Check for valid area
-                if bbox[2] > bbox[0] and bbox[3] > bbox[1]:
-                    text = page.within_bbox(bbox).extract_text()
-                    if text:
-                        full_text.append(text)
-            
-            # Extra pages
-            if crop.extra_pages:
-                for ep in crop.extra_pages:
-                    p_num = ep['page_num']
-                    if p_num < len(pdf.pages):
-                        page = pdf.pages[p_num]
-                        # Use same X coordinates, different Y
-                        bbox = (
-                            crop.x1 * scale,
-                            ep['y1'] * scale,
-                            crop.x2 * scale,
-                            ep['y2'] * scale
-                        )
-                        bbox = (
-                            max(0, bbox[0]),
-                            max(0, bbox[1]),
-                            min(page.width, bbox[2]),
-                            min(page.height, bbox[3])
-                        )
-                        
-                        if bbox[2] > bbox[0] and bbox[3] > bbox[1]:
-                            text = page.within_bbox(bbox).extract_text()
-                            if text:
-                                full_text.append(text)
-                                
+        return extract_texts_from_crops(pdf_path, [crop], dpi)[0]
     except Exception as e:
         print(f"Error extracting text for Q{crop.question_num}: {e}")
         return ""
 
-    return "\n".join(full_text)
+
+def _checkpoint_file(exam: ExamInfo) -> Path:
+    return AUTO_CROP_STATE_DIR / f"{exam.output_folder}.json"
+
+
+def load_auto_checkpoint(exam: ExamInfo) -> dict[int, dict]:
+    """Load per-question results of an interrupted headless run (question_num -> crop dict)."""
+    checkpoint = _checkpoint_file(exam)
+    if not checkpoint.exists():
+        return {}
+    try:
+        with open(checkpoint) as f:
+            return {c['question_num']: c for c in json.load(f)}
+    except (json.JSONDecodeError, OSError, KeyError):
+        return {}
+
+
+def save_auto_checkpoint(exam: ExamInfo, done: dict[int, dict]):
+    """Checkpoint finished questions of a headless run."""
+    checkpoint = _checkpoint_file(exam)
+    checkpoint.parent.mkdir(parents=True, exist_ok=True)
+    # Temp file per writer: a --force run or the GUI may checkpoint the same exam
+    tmp_file = checkpoint.with_name(f"{checkpoint.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp_file, 'w') as f:
+        json.dump(list(done.values()), f)
+    os.replace(tmp_file, checkpoint)
+
+
+def auto_crop_exam(exam: ExamInfo, saved_crops: list[dict], force: bool = False,
+                   dpi: int = DPI, renderer: str = "clip") -> tuple[str, list[dict], int]:
+    """
+    Crop, save and extract text for every remaining question of one exam.
+    Runs without the GUI (in a worker process) and checkpoints after each question,
+    so a crashed run resumes where it stopped.
+    
+    Args:
+        exam: Exam to process
+        saved_crops: Saved progress of this exam (adjusted bounds are respected)
+        force: Re-crop questions that are already confirmed
+        dpi: Rendering DPI
+        renderer: "clip" renders only the question regions with PyMuPDF;
+            "pages" crops full grayscale pages from the raster store
+    
+    Returns:
+        (exam key, all crops as dicts, number of questions cropped in this run)
+    """
+    crops = plan_exam_crops(exam.pdf_path, dpi)
+    apply_saved_crops(crops, saved_crops)
+    
+    doc = None
+    if renderer == "clip":
+        # PyMuPDF is the backend that can rasterize a clip without rendering the page
+        doc = open_pdf(exam.pdf_path, "pymupdf")
+        
+        def crop_image(crop):
+            return trim_rendered_segments(render_crop_segments(doc, crop, dpi))
+    else:
+        # Full grayscale pages as memmaps, rendered once and reused by every later run
+        page_count = len(get_page_pixel_sizes(exam.pdf_path, dpi))
+        page_images = RasterStore().pages(exam.pdf_path, dpi, page_count)
+        profiles = PageProfiles(page_images)
+        
+        def crop_image(crop):
+            return crop_question_image(page_images, crop, profiles)
+    
+    try:
+        done = load_auto_checkpoint(exam)
+        output_dir = OUTPUT_DIR / exam.output_folder
+        output_dir.mkdir(parents=True, exist_ok=True)
+        texts = extract_texts_from_crops(exam.pdf_path, crops, dpi)
+        
+        cropped_count = 0
+        for i, crop in enumerate(crops):
+            if crop.question_num in done:
+                # Finished by an earlier, interrupted run
+                crops[i] = QuestionCrop(**done[crop.question_num])
+                continue
+            if crop.confirmed and not force:
+                continue
+            
+            cropped = crop_image(crop)
+            save_question_image(cropped, output_dir / f"Q{crop.question_num:02d}.png")
+            crop.confirmed = True
+            
+            if texts[i]:
+                crop.extracted_text = clean_extracted_text(texts[i])
+            
+            done[crop.question_num] = asdict(crop)
+            save_auto_checkpoint(exam, done)
+            cropped_count += 1
+    finally:
+        if doc:
+            doc.close()
+    return exam.output_folder, [asdict(c) for c in crops], cropped_count
+
+
+def run_auto_crop(jobs: Optional[int] = None, force: bool = False, renderer: str = "clip"):
+    """Headless batch mode: auto-crop every exam on a process pool."""
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    
+    exams = parse_exam_folders()
+    store = StateStore()
+    progress = store.all_crops()
+    jobs = jobs or os.cpu_count() or 1
+    
+    print(f"Auto-cropping {len(exams)} exams with {jobs} worker(s) ({renderer} rendering)...")
+    total_cropped = 0
+    failed = []
+    
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = {
+            pool.submit(auto_crop_exam, exam, progress.get(exam.output_folder, []), force, DPI, renderer): exam
+            for exam in exams
+        }
+        for n, future in enumerate(as_completed(futures), 1):
+            exam = futures[future]
+            try:
+                exam_key, crops, cropped_count = future.result()
+            except Exception as e:
+                print(f"[{n}/{len(exams)}] ❌ {exam.display_name}: {e}")
+                failed.append(exam.display_name)
+                continue
+            
+            # Save the finished exam to the state store, then drop its checkpoint
+            store.save_exam_crops(exam_key, crops)
+            _checkpoint_file(exam).unlink(missing_ok=True)
+            
+            total_cropped += cropped_count
+            print(f"[{n}/{len(exams)}] ✅ {exam.display_name}: {cropped_count} cropped")
+    
+    store.close()
+    print(f"✓ Auto-crop finished: {total_cropped} questions cropped.")
+    if failed:
+        print(f"  {len(failed)} exam(s) failed; re-run to resume: {', '.join(failed)}")
 
 
 class QuestionCropperApp:
@@ -385,17 +760,16 @@ class QuestionCropperApp:
     
     def __init__(self, root):
         # Lazy-import GUI-only dependencies into module globals
-        # so all existing tk., ttk., messagebox., ImageTk., convert_from_path references work
+        # so all existing tk., ttk., messagebox., ImageTk. references work
+        # (pages are rendered through PageImageCache, which imports pdf2image itself)
         import tkinter as _tk
         from tkinter import ttk as _ttk, messagebox as _messagebox
         from PIL import ImageTk as _ImageTk
-        from pdf2image import convert_from_path as _cfp
         g = globals()
         g['tk'] = _tk
         g['ttk'] = _ttk
         g['messagebox'] = _messagebox
         g['ImageTk'] = _ImageTk
-        g['convert_from_path'] = _cfp
         
         self.root = root
         self.root.title("FE Question Cropper")
@@ -405,11 +779,13 @@ class QuestionCropperApp:
         self.exams = parse_exam_folders()
         self.current_exam_idx = 0
         self.current_question_idx = 0
-        self.page_images: list[Image.Image] = []
+        self.pages: Optional[PageImageCache] = None  # Rendered on demand
+        self.page_profiles: Optional[PageProfiles] = None  # Row-content profiles of the pages
+        self.raster_store = RasterStore()  # Grayscale pages for cropping
         self.question_positions: list[tuple[int, int, float]] = []
         self.crops: list[QuestionCrop] = []
         self.crops: list[QuestionCrop] = []
-        self.progress: dict = self.load_progress()
+        self.state = StateStore()  # Crops are saved per question, read per exam
         
         # Tagging state
         self.topics = self.load_topics()
@@ -423,11 +799,10 @@ class QuestionCropperApp:
         self.load_exam(0)
     
     def load_topics(self) -> dict:
-        """Load topics from JSON file."""
+        """Load topics (topics.json plus topics the classifier has journaled since)."""
         if TOPICS_FILE.exists():
             try:
-                with open(TOPICS_FILE) as f:
-                    return json.load(f)
+                return load_topics()
             except Exception as e:
                 messagebox.showerror("Error", f"Failed to load topics: {e}")
         return {}
@@ -622,23 +997,6 @@ class QuestionCropperApp:
         
         ttk.Button(right_frame, text="Delete Tag", command=self.delete_current_tag).pack(pady=10, anchor=tk.W)
     
-    def load_progress(self) -> dict:
-        """Load progress from file."""
-        if PROGRESS_FILE.exists():
-            try:
-                with open(PROGRESS_FILE) as f:
-                    content = f.read().strip()
-                    if content:
-                        return json.loads(content)
-            except (json.JSONDecodeError, OSError):
-                pass  # Return empty dict on error
-        return {}
-    
-    def save_progress(self):
-        """Save current progress to file."""
-        with open(PROGRESS_FILE, 'w') as f:
-            json.dump(self.progress, f, indent=2)
-    
     def load_exam(self, idx: int):
         """Load an exam's PDF and detect questions."""
         if idx < 0 or idx >= len(self.exams):
@@ -651,8 +1009,13 @@ class QuestionCropperApp:
         self.status_var.set(f"Loading {exam.display_name}...")
         self.root.update()
         
-        # Convert PDF to images
-        self.page_images = convert_from_path(str(exam.pdf_path), dpi=DPI)
+        # Pages are rendered lazily; only their sizes are needed up front
+        if self.pages:
+            self.pages.close()
+        page_sizes = get_page_pixel_sizes(exam.pdf_path, DPI)
+        self.pages = PageImageCache(exam.pdf_path, page_sizes, DPI, raster_store=self.raster_store)
+        # Row-content profiles of this exam's pages, reused by every trim
+        self.page_profiles = PageProfiles(self.pages.view(grayscale=True))
         
         # Detect question positions
         self.question_positions = detect_question_positions(exam.pdf_path)
@@ -660,105 +1023,11 @@ class QuestionCropperApp:
         # Detect page number positions (to exclude them from crops)
         self.page_num_positions = detect_page_number_positions(exam.pdf_path)
         
-        # Scale factor from PDF points to image pixels
-        scale = DPI / 72.0
-        
-        # Initialize crops
-        self.crops = []
-        for i, (q_num, page_num, y_pos) in enumerate(self.question_positions):
-            # Calculate crop region
-            page_height = self.page_images[page_num].height
-            page_width = self.page_images[page_num].width
-            
-            # y1: Start a bit above the "Q" text
-            y1 = int(y_pos * scale) - 10
-            
-            # Determine where the next question starts
-            if i + 1 < len(self.question_positions):
-                next_q = self.question_positions[i + 1]
-                next_q_page = next_q[1]
-                next_q_y = int(next_q[2] * scale) - 15
-            else:
-                # Last question - use end of last page, but check for page number
-                next_q_page = len(self.page_images) - 1
-                if next_q_page in self.page_num_positions:
-                    next_q_y = int(self.page_num_positions[next_q_page] * scale) - 20
-                else:
-                    next_q_y = self.page_images[next_q_page].height - 50
-            
-            extra_pages = []
-            
-            if next_q_page == page_num:
-                # Same page - simple case
-                y2 = next_q_y
-            elif next_q_page == page_num + 1:
-                # Next page - single page break
-                # First page: crop to page number or page bottom
-                if page_num in self.page_num_positions:
-                    page_num_y = int(self.page_num_positions[page_num] * scale) - 20
-                    y2 = min(page_num_y, page_height - 50)
-                else:
-                    y2 = page_height - 50
-                    
-                # Second page: from top to next question
-                next_page_height = self.page_images[next_q_page].height
-                extra_pages.append({
-                    'page_num': next_q_page,
-                    'y1': 50,  # Start below header
-                    'y2': next_q_y
-                })
-            else:
-                # Multi-page question (spans 3+ pages)
-                # First page: crop to page number
-                if page_num in self.page_num_positions:
-                    page_num_y = int(self.page_num_positions[page_num] * scale) - 20
-                    y2 = min(page_num_y, page_height - 50)
-                else:
-                    y2 = page_height - 50
-                
-                # Middle pages: full page (minus header/footer)
-                for mid_page in range(page_num + 1, next_q_page):
-                    mid_page_height = self.page_images[mid_page].height
-                    if mid_page in self.page_num_positions:
-                        mid_page_num_y = int(self.page_num_positions[mid_page] * scale) - 20
-                        mid_y2 = min(mid_page_num_y, mid_page_height - 50)
-                    else:
-                        mid_y2 = mid_page_height - 50
-                    extra_pages.append({
-                        'page_num': mid_page,
-                        'y1': 50,
-                        'y2': mid_y2
-                    })
-                
-                # Last page: from top to next question
-                extra_pages.append({
-                    'page_num': next_q_page,
-                    'y1': 50,
-                    'y2': next_q_y
-                })
-            
-            self.crops.append(QuestionCrop(
-                question_num=q_num,
-                page_num=page_num,
-                x1=30,
-                y1=max(0, y1),
-                x2=page_width - 30,
-                y2=min(page_height, y2),
-                confirmed=False,
-                extra_pages=extra_pages
-            ))
+        # Initialize crops from the detected positions
+        self.crops = plan_question_crops(page_sizes, self.question_positions, self.page_num_positions)
         
         # Load saved progress for this exam
-        exam_key = exam.output_folder
-        if exam_key in self.progress:
-            for saved_crop in self.progress[exam_key]:
-                for crop in self.crops:
-                    if crop.question_num == saved_crop['question_num']:
-                        crop.x2 = saved_crop['x2']
-                        crop.y2 = saved_crop['y2']
-                        crop.confirmed = saved_crop['confirmed']
-                        crop.extracted_text = saved_crop.get('extracted_text', "")
-                        break
+        apply_saved_crops(self.crops, self.state.exam_crops(exam.output_folder))
         
         # Update question list
         self.update_question_list()
@@ -801,7 +1070,7 @@ class QuestionCropperApp:
             return
         
         crop = self.crops[self.current_question_idx]
-        page_img = self.page_images[crop.page_num]
+        page_img = self.pages.get(crop.page_num)
         
         # Store reference to prevent garbage collection
         self.current_photo = ImageTk.PhotoImage(page_img)
@@ -822,6 +1091,18 @@ class QuestionCropperApp:
         self.question_listbox.selection_clear(0, tk.END)
         self.question_listbox.selection_set(self.current_question_idx)
         self.question_listbox.see(self.current_question_idx)
+        
+        self.prefetch_around_current()
+    
+    def prefetch_around_current(self):
+        """Render pages of the neighbouring questions (and this crop's pages) in the background."""
+        idx = self.current_question_idx
+        neighbours = [self.crops[i].page_num for i in (idx - 1, idx + 1) if 0 <= i < len(self.crops)]
+        self.pages.prefetch(neighbours)
+        
+        # Pages used only for cropping on confirm are rendered in grayscale
+        crop = self.crops[idx]
+        self.pages.prefetch([crop.page_num] + [ep['page_num'] for ep in crop.extra_pages], grayscale=True)
     
     def draw_crop_rect(self):
         """Draw the crop rectangle on canvas."""
@@ -945,11 +1226,11 @@ class QuestionCropperApp:
             crop.x2 = orig_x2 + dx
         
         # Ensure valid bounds
-        page_img = self.page_images[crop.page_num]
+        page_width, page_height = self.pages.size(crop.page_num)
         crop.x1 = max(0, min(crop.x1, crop.x2 - 50))
         crop.y1 = max(0, min(crop.y1, crop.y2 - 50))
-        crop.x2 = min(page_img.width, max(crop.x2, crop.x1 + 50))
-        crop.y2 = min(page_img.height, max(crop.y2, crop.y1 + 50))
+        crop.x2 = min(page_width, max(crop.x2, crop.x1 + 50))
+        crop.y2 = min(page_height, max(crop.y2, crop.y1 + 50))
         
         self.draw_crop_rect()
     
@@ -987,14 +1268,11 @@ class QuestionCropperApp:
         output_dir = OUTPUT_DIR / exam.output_folder
         output_dir.mkdir(parents=True, exist_ok=True)
         
-        # Crop and save image (handles multi-page questions)
-        cropped = combine_multipage_crop(self.page_images, crop)
-        
-        # Trim whitespace from bottom
-        cropped = trim_whitespace_bottom(cropped)
+        # Crop, trim and save image (handles multi-page questions)
+        cropped = crop_question_image(self.pages.view(grayscale=True), crop, self.page_profiles)
         
         output_path = output_dir / f"Q{crop.question_num:02d}.png"
-        cropped.save(output_path, "PNG")
+        save_question_image(cropped, output_path)
         
         # Mark as confirmed
         crop.confirmed = True
@@ -1004,17 +1282,14 @@ class QuestionCropperApp:
         try:
             text = extract_text_from_crop(exam.pdf_path, crop, DPI)
             if text:
-                # Simple cleanup: remove excessive newlines
-                clean_text = re.sub(r'\n+', '\n', text).strip()
+                clean_text = clean_extracted_text(text)
                 crop.extracted_text = clean_text
                 print(f"Extracted text for Q{crop.question_num}: {clean_text[:50]}...")
         except Exception as e:
             print(f"Failed to extract text: {e}")
         
-        # Save progress
-        exam_key = exam.output_folder
-        self.progress[exam_key] = [asdict(c) for c in self.crops]
-        self.save_progress()
+        # Save progress (only this question's row)
+        self.state.save_crop(exam.output_folder, asdict(crop))
         self.update_question_list()
         self.update_progress_label()
         self.status_var.set(f"Saved Q{crop.question_num}")
@@ -1050,7 +1325,7 @@ class QuestionCropperApp:
         idx = self.current_question_idx
         q_num, page_num, y_pos = self.question_positions[idx]
         
-        page_img = self.page_images[page_num]
+        page_width, page_height = self.pages.size(page_num)
         scale = DPI / 72.0
         y1 = int(y_pos * scale) - 10
         
@@ -1059,15 +1334,15 @@ class QuestionCropperApp:
             if next_q[1] == page_num:
                 y2 = int(next_q[2] * scale) - 15
             else:
-                y2 = page_img.height - 50
+                y2 = page_height - 50
         else:
-            y2 = page_img.height - 50
+            y2 = page_height - 50
         
         crop = self.crops[idx]
         crop.x1 = 30
         crop.y1 = max(0, y1)
-        crop.x2 = page_img.width - 30
-        crop.y2 = min(page_img.height, y2)
+        crop.x2 = page_width - 30
+        crop.y2 = min(page_height, y2)
         crop.confirmed = False
         
         self.draw_crop_rect()
@@ -1079,8 +1354,7 @@ class QuestionCropperApp:
             return
         
         crop = self.crops[self.current_question_idx]
-        page_img = self.page_images[crop.page_num]
-        crop.y2 = page_img.height - 30
+        crop.y2 = self.pages.size(crop.page_num)[1] - 30
         
         self.draw_crop_rect()
     
@@ -1108,6 +1382,13 @@ class QuestionCropperApp:
         output_dir = OUTPUT_DIR / exam.output_folder
         output_dir.mkdir(parents=True, exist_ok=True)
         
+        # Text of every crop in one pass over the cached layout
+        try:
+            texts = extract_texts_from_crops(exam.pdf_path, self.crops, DPI)
+        except Exception as e:
+            print(f"Failed to extract text: {e}")
+            texts = [""] * len(self.crops)
+        
         # Process all remaining
         for i, crop in enumerate(self.crops):
             if crop.confirmed:
@@ -1117,31 +1398,21 @@ class QuestionCropperApp:
             self.status_var.set(f"Auto-generating Q{crop.question_num}... ({i+1}/{len(self.crops)})")
             self.root.update()
             
-            # Crop and save (handles multi-page questions)
-            cropped = combine_multipage_crop(self.page_images, crop)
-            
-            # Trim whitespace from bottom
-            cropped = trim_whitespace_bottom(cropped)
+            # Crop, trim and save (handles multi-page questions)
+            cropped = crop_question_image(self.pages.view(grayscale=True), crop, self.page_profiles)
             
             output_path = output_dir / f"Q{crop.question_num:02d}.png"
-            cropped.save(output_path, "PNG")
+            save_question_image(cropped, output_path)
             
             # Mark as confirmed
             crop.confirmed = True
             
-            # Extract text
-            try:
-                text = extract_text_from_crop(exam.pdf_path, crop, DPI)
-                if text:
-                    clean_text = re.sub(r'\n+', '\n', text).strip()
-                    crop.extracted_text = clean_text
-            except Exception:
-                pass
+            # Extracted text
+            if texts[i]:
+                crop.extracted_text = clean_extracted_text(texts[i])
         
-        # Save progress
-        exam_key = exam.output_folder
-        self.progress[exam_key] = [asdict(c) for c in self.crops]
-        self.save_progress()
+        # Save progress (the generated questions, in one transaction)
+        self.state.save_exam_crops(exam.output_folder, [asdict(c) for c in remaining])
         
         # Update UI
         self.update_question_list()
@@ -1297,6 +1568,24 @@ class QuestionCropperApp:
 
 def main():
     """Main entry point."""
+    import argparse
+    parser = argparse.ArgumentParser(description="Crop questions from FE exam PDFs")
+    parser.add_argument("--auto", action="store_true",
+                        help="Headless mode: auto-crop every exam without the GUI")
+    parser.add_argument("--jobs", "-j", type=int, default=None,
+                        help="Worker processes for --auto (default: all cores)")
+    parser.add_argument("--force", "-f", action="store_true",
+                        help="With --auto, re-crop questions that are already confirmed")
+    parser.add_argument("--renderer", choices=["clip", "pages"], default="clip",
+                        help="With --auto: render only question regions or full pages")
+    add_backend_argument(parser)
+    add_variants_argument(parser)
+    args = parser.parse_args()
+    if args.backend:
+        set_backend(args.backend)
+    if args.variants is not None:
+        set_variants(args.variants)
+    
     # Ensure output directory exists
     OUTPUT_DIR.mkdir(exist_ok=True)
     
@@ -1311,6 +1600,10 @@ def main():
     for exam in exams:
         print(f"  - {exam.display_name}: {exam.pdf_path.name}")
     
+    if args.auto:
+        run_auto_crop(jobs=args.jobs, force=args.force, renderer=args.renderer)
+        return
+    
     # Launch GUI
     import tkinter as tk
     root = tk.Tk()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Memory-mapped Raster Page Store
+Writes each rendered page once as a raw grayscale uint8 array, keyed by
+(PDF hash, backend, page, DPI), and serves it back with numpy.memmap. Crops and trims
+become zero-copy slices, and unchanged PDFs are never rendered twice.
+"""
+
+import os
+import re
+import threading
+from pathlib import Path
+
+import numpy as np
+
+from layout_cache import get_pdf_hash
+from pdf_backend import get_backend_name, open_pdf
+
+BASE_DIR = Path(__file__).parent.parent
+RASTER_DIR = BASE_DIR / "data" / "state" / "raster_cache"
+MAX_STORE_BYTES = 2 * 1024 ** 3  # Evict least recently used pages above 2 GB
+
+# <hash>-<backend>_p<page>_d<dpi>_<height>x<width>.u8
+RASTER_NAME_RE = re.compile(r'^(?P<key>[0-9a-z-]+)_p(?P<page>\d+)_d(?P<dpi>\d+)_(?P<h>\d+)x(?P<w>\d+)\.u8$')
+
+
+def render_pages_gray(pdf_path: Path, first_page: int, last_page: int, dpi: int) -> list[np.ndarray]:
+    """Render a range of pages (0-indexed, inclusive) as grayscale uint8 arrays."""
+    with open_pdf(pdf_path) as doc:
+        images = doc.render_pages(first_page, last_page, dpi, grayscale=True)
+    return [np.asarray(img.convert('L'), dtype=np.uint8) for img in images]
+
+
+def _pdf_key(pdf_path: Path) -> str:
+    # Backends rasterize differently, so their pages are stored separately
+    return f"{get_pdf_hash(pdf_path)}-{get_backend_name()}"
+
+
+class RasterStore:
+    """Size-bounded on-disk store of rendered pages, read through numpy.memmap."""
+
+    def __init__(self, root: Path = RASTER_DIR, max_bytes: int = MAX_STORE_BYTES, render=render_pages_gray):
+        """
+        Args:
+            root: Directory holding the raw page files
+            max_bytes: Total size above which least recently used pages are evicted
+            render: Function (pdf_path, first_page, last_page, dpi) -> list of 2D uint8 arrays
+        """
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.render = render
+        self._known = {}  # (pdf_key, page_num, dpi) -> (path, shape) of pages seen by this process
+
+    def _prefix(self, pdf_key: str, page_num: int, dpi: int) -> str:
+        return f"{pdf_key}_p{page_num:04d}_d{dpi}_"
+
+    def _find(self, pdf_key: str, page_num: int, dpi: int):
+        """
+        Find the stored file of a page, returning (path, shape) or None. Pages this process
+        has seen are looked up in memory; only others are searched for on disk.
+        """
+        key = (pdf_key, page_num, dpi)
+        found = self._known.get(key)
+        if found is not None and found[0].exists():
+            return found
+        self._known.pop(key, None)
+        for path in self.root.glob(self._prefix(pdf_key, page_num, dpi) + "*.u8"):
+            match = RASTER_NAME_RE.match(path.name)
+            if match:
+                found = self._known[key] = path, (int(match.group('h')), int(match.group('w')))
+                return found
+        return None
+
+    def _write(self, pdf_key: str, page_num: int, dpi: int, pixels: np.ndarray) -> tuple[Path, tuple[int, int]]:
+        self.root.mkdir(parents=True, exist_ok=True)
+        h, w = pixels.shape
+        path = self.root / f"{self._prefix(pdf_key, page_num, dpi)}{h}x{w}.u8"
+        # Temp file per writer: workers rendering the same page must not write into one file
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        np.ascontiguousarray(pixels, dtype=np.uint8).tofile(tmp_path)
+        os.replace(tmp_path, path)
+        self._known[(pdf_key, page_num, dpi)] = path, (h, w)
+        return path, (h, w)
+
+    def ensure(self, pdf_path: Path, page_nums, dpi: int) -> dict[int, tuple[Path, tuple[int, int]]]:
+        """
+        Render and store every listed page that is not in the store yet (in one render call).
+
+        Returns:
+            {page_num: (path, shape)} of every listed page
+        """
+        pdf_key = _pdf_key(pdf_path)
+        stored = {n: self._find(pdf_key, n, dpi) for n in page_nums}
+        missing = [n for n, found in stored.items() if found is None]
+        if not missing:
+            return stored
+
+        first, last = min(missing), max(missing)
+        for page_num, pixels in zip(range(first, last + 1), self.render(pdf_path, first, last, dpi)):
+            if page_num in missing:
+                stored[page_num] = self._write(pdf_key, page_num, dpi, pixels)
+        self.evict()
+        return stored
+
+    def get(self, pdf_path: Path, page_num: int, dpi: int) -> np.memmap:
+        """Get a page as a read-only (height, width) uint8 memmap, rendering it if needed."""
+        pdf_key = _pdf_key(pdf_path)
+        found = self._find(pdf_key, page_num, dpi)
+        for _ in range(3):
+            if found is None:
+                found = self.ensure(pdf_path, [page_num], dpi)[page_num]
+            path, shape = found
+            try:
+                os.utime(path)  # Mark as recently used for eviction
+                return np.memmap(path, dtype=np.uint8, mode='r', shape=shape)  # Stays readable if unlinked later
+            except FileNotFoundError:  # Evicted by another worker in between: render it again
+                self._known.pop((pdf_key, page_num, dpi), None)
+                found = None
+        raise FileNotFoundError(f"Page {page_num} of {pdf_path} keeps being evicted; raise max_bytes")
+
+    def pages(self, pdf_path: Path, dpi: int, page_count: int) -> 'RasterPages':
+        """List-like view of a PDF's pages, for crop functions that index pages by number."""
+        return RasterPages(self, Path(pdf_path), dpi, page_count)
+
+    def evict(self):
+        """Delete least recently used pages until the store fits in max_bytes."""
+        if not self.root.exists():
+            return
+        files = []
+        for path in self.root.glob("*.u8"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue  # Evicted concurrently by another worker
+            files.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+
+class RasterPages:
+    """Read-only sequence of memory-mapped pages of one PDF at one DPI."""
+
+    def __init__(self, store: RasterStore, pdf_path: Path, dpi: int, page_count: int):
+        self.store = store
+        self.pdf_path = pdf_path
+        self.dpi = dpi
+        self.page_count = page_count
+
+    def __len__(self) -> int:
+        return self.page_count
+
+    def __getitem__(self, page_num: int) -> np.memmap:
+        if not 0 <= page_num < self.page_count:
+            raise IndexError(page_num)
+        return self.store.get(self.pdf_path, page_num, self.dpi)
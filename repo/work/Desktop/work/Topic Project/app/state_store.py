@@ -0,0 +1,504 @@
+#!/usr/bin/env python3
+"""
+Pipeline State Store
+One SQLite database (data/state/state.db) for the state the cropper, classifier
+and search index builder used to keep in whole-file JSON rewrites:
+
+  exams / crops / texts   <- .cropper_progress.json
+  tags                    <- question_tags.json + .classifier_progress.json
+  index_records           <- .search_index_state.json
+  term_tags               textbook terms found in each question (term_tagger.py)
+  fingerprints / duplicates  (find_duplicates.py)
+  work_queue              questions leased to classifier workers
+
+Every save is a per-row upsert in its own short transaction, and the database
+runs in WAL mode, so saving one question costs the same however large the
+corpus grows, and the GUI, the classifier and the index builder can run at the
+same time without overwriting each other's work.
+
+The JSON files are imported once, the first time the store is opened, and can
+be written back on demand:
+    python3 app/state_store.py --export
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).parent.parent
+STATE_DIR = BASE_DIR / "data" / "state"
+DB_FILE = STATE_DIR / "state.db"
+
+# Legacy JSON files (migration sources and --export targets)
+CROPPER_PROGRESS_FILE = STATE_DIR / ".cropper_progress.json"
+CLASSIFIER_PROGRESS_FILE = STATE_DIR / ".classifier_progress.json"
+SEARCH_INDEX_STATE_FILE = STATE_DIR / ".search_index_state.json"
+TAGS_FILE = BASE_DIR / "data" / "output" / "question_tags.json"
+
+BUSY_TIMEOUT = 30  # Seconds to wait for another process's write to finish
+
+CROP_COLUMNS = ("question_num", "page_num", "x1", "y1", "x2", "y2", "confirmed", "extra_pages")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS exams (
+    exam_key TEXT PRIMARY KEY,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS crops (
+    exam_key TEXT NOT NULL REFERENCES exams(exam_key),
+    question_num INTEGER NOT NULL,
+    page_num INTEGER NOT NULL,
+    x1 INTEGER NOT NULL,
+    y1 INTEGER NOT NULL,
+    x2 INTEGER NOT NULL,
+    y2 INTEGER NOT NULL,
+    confirmed INTEGER NOT NULL DEFAULT 0,
+    extra_pages TEXT NOT NULL DEFAULT '[]',
+    PRIMARY KEY (exam_key, question_num)
+);
+CREATE TABLE IF NOT EXISTS texts (
+    exam_key TEXT NOT NULL,
+    question_num INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    PRIMARY KEY (exam_key, question_num)
+);
+CREATE TABLE IF NOT EXISTS tags (
+    rel_path TEXT PRIMARY KEY,
+    data TEXT,
+    completed INTEGER NOT NULL DEFAULT 1,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS index_records (
+    item_id TEXT PRIMARY KEY,
+    hash TEXT,
+    record TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS term_tags (
+    rel_path TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS fingerprints (
+    rel_path TEXT PRIMARY KEY,
+    source_hash TEXT NOT NULL,
+    height INTEGER NOT NULL,
+    shingles INTEGER NOT NULL,
+    dhash BLOB NOT NULL,
+    minhash BLOB
+);
+CREATE TABLE IF NOT EXISTS duplicates (
+    rel_path TEXT PRIMARY KEY,
+    cluster TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS work_queue (
+    rel_path TEXT PRIMARY KEY,
+    worker TEXT,
+    lease_until REAL NOT NULL DEFAULT 0,
+    claims INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+
+def _load_json(path: Path, default):
+    if not path.exists():
+        return default
+    try:
+        with open(path) as f:
+            content = f.read().strip()
+        return json.loads(content) if content else default
+    except (json.JSONDecodeError, OSError):
+        return default
+
+
+def _write_json(path: Path, data, indent=2):
+    """Write a JSON file atomically, so a crash never truncates it."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")  # One per writer
+    with open(tmp_file, "w") as f:
+        json.dump(data, f, indent=indent)
+    os.replace(tmp_file, path)
+
+
+class StateStore:
+    """Connection to the pipeline state database (one per process)."""
+
+    def __init__(self, db_path: Path = None, migrate: bool = True, read_only: bool = False):
+        """
+        Args:
+            db_path: Database file (default: data/state/state.db)
+            migrate: Import the legacy JSON files if this database has not seen them yet
+            read_only: Open an existing database for reading only (no schema update, no migration);
+                raises sqlite3.OperationalError if there is none
+        """
+        self.db_path = Path(db_path or DB_FILE)
+        if read_only:
+            self.conn = sqlite3.connect(f"{self.db_path.resolve().as_uri()}?mode=ro", uri=True, timeout=BUSY_TIMEOUT)
+            return
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self.conn:
+            self.conn.executescript(SCHEMA)
+        if migrate and self.get_meta("migrated_from_json") is None:
+            self.migrate_from_json(once=True)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # --- Meta ---
+
+    def get_meta(self, key: str):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value: str):
+        self.conn.execute("INSERT INTO meta (key, value) VALUES (?, ?) "
+                          "ON CONFLICT(key) DO UPDATE SET value = excluded.value", (key, value))
+
+    def set_meta(self, key: str, value: str):
+        with self.conn:
+            self._set_meta(key, value)
+
+    # --- Crops and texts (cropper progress) ---
+
+    def _upsert_crop(self, exam_key: str, crop: dict):
+        self.conn.execute(
+            "INSERT INTO exams (exam_key, updated_at) VALUES (?, ?) "
+            "ON CONFLICT(exam_key) DO UPDATE SET updated_at = excluded.updated_at",
+            (exam_key, time.time()))
+        self.conn.execute(
+            f"INSERT OR REPLACE INTO crops (exam_key, {', '.join(CROP_COLUMNS)}) "
+            f"VALUES (?, {', '.join('?' * len(CROP_COLUMNS))})",
+            (exam_key, crop['question_num'], crop['page_num'], crop['x1'], crop['y1'],
+             crop['x2'], crop['y2'], int(bool(crop.get('confirmed'))),
+             json.dumps(crop.get('extra_pages') or [])))
+        text = crop.get('extracted_text') or ""
+        if text:
+            self.conn.execute("INSERT OR REPLACE INTO texts (exam_key, question_num, text) VALUES (?, ?, ?)",
+                              (exam_key, crop['question_num'], text))
+        else:
+            self.conn.execute("DELETE FROM texts WHERE exam_key = ? AND question_num = ?",
+                              (exam_key, crop['question_num']))
+
+    def save_crop(self, exam_key: str, crop: dict):
+        """Save one question's crop (bounds, confirmation and extracted text)."""
+        with self.conn:
+            self._upsert_crop(exam_key, crop)
+
+    def save_exam_crops(self, exam_key: str, crops: list[dict]):
+        """Save several crops of one exam in a single transaction."""
+        with self.conn:
+            for crop in crops:
+                self._upsert_crop(exam_key, crop)
+
+    def _crop_rows(self, where: str = "", params: tuple = ()) -> list[tuple[str, dict]]:
+        rows = self.conn.execute(
+            f"SELECT c.exam_key, {', '.join('c.' + col for col in CROP_COLUMNS)}, t.text "
+            f"FROM crops c JOIN exams e ON e.exam_key = c.exam_key "
+            f"LEFT JOIN texts t ON t.exam_key = c.exam_key AND t.question_num = c.question_num "
+            f"{where} ORDER BY e.rowid, c.question_num", params)
+        crops = []
+        for exam_key, question_num, page_num, x1, y1, x2, y2, confirmed, extra_pages, text in rows:
+            crops.append((exam_key, {
+                'question_num': question_num, 'page_num': page_num,
+                'x1': x1, 'y1': y1, 'x2': x2, 'y2': y2,
+                'confirmed': bool(confirmed), 'extracted_text': text or "",
+                'extra_pages': json.loads(extra_pages),
+            }))
+        return crops
+
+    def exam_crops(self, exam_key: str) -> list[dict]:
+        """Saved crops of one exam, in question order."""
+        return [crop for _, crop in self._crop_rows("WHERE c.exam_key = ?", (exam_key,))]
+
+    def all_crops(self) -> dict[str, list[dict]]:
+        """Saved crops of every exam ({exam_key: [crop dict]}, the old progress file layout)."""
+        progress = {}
+        for exam_key, crop in self._crop_rows():
+            progress.setdefault(exam_key, []).append(crop)
+        return progress
+
+    def question_texts(self) -> dict[str, str]:
+        """Extracted text by image path relative to cropped_questions, e.g. "2007A_A/Q01.png"."""
+        rows = self.conn.execute("SELECT exam_key, question_num, text FROM texts")
+        return {f"{exam_key}/Q{q_num:02d}.png": text for exam_key, q_num, text in rows}
+
+    # --- Tags (classifier results and progress) ---
+
+    def save_tag(self, rel_path: str, result: dict):
+        """Save one classifier result and mark the question as done."""
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO tags (rel_path, data, completed, updated_at) VALUES (?, ?, 1, ?) "
+                "ON CONFLICT(rel_path) DO UPDATE SET data = excluded.data, completed = 1, "
+                "updated_at = excluded.updated_at",
+                (rel_path, json.dumps(result, ensure_ascii=False), time.time()))
+
+    def tags(self) -> dict[str, dict]:
+        """Classifier results by image path ("2007A_A/Q01.png")."""
+        rows = self.conn.execute("SELECT rel_path, data FROM tags WHERE data IS NOT NULL ORDER BY rowid")
+        return {rel_path: json.loads(data) for rel_path, data in rows}
+
+    def completed_tags(self) -> list[str]:
+        """Image paths the classifier has finished, in the order it finished them."""
+        rows = self.conn.execute("SELECT rel_path FROM tags WHERE completed ORDER BY rowid")
+        return [rel_path for rel_path, in rows]
+
+    def clear_tags(self):
+        """Forget every classifier result (and the classifier work queue)."""
+        with self.conn:
+            self.conn.execute("DELETE FROM tags")
+            self.conn.execute("DELETE FROM work_queue")
+
+    def is_tagged(self, rel_path: str) -> bool:
+        return self.conn.execute("SELECT 1 FROM tags WHERE rel_path = ? AND completed",
+                                 (rel_path,)).fetchone() is not None
+
+    # --- Classifier work queue ---
+    # A question is claimable when no worker holds an unexpired lease on it. Claims run in
+    # an IMMEDIATE transaction, so two workers can never claim the same question; a worker
+    # that dies without releasing its claims loses them when their leases run out.
+
+    def enqueue(self, rel_paths: list[str]) -> int:
+        """Add questions to the work queue (ones already queued keep their lease). Returns how many were new."""
+        with self.conn:
+            before = self.conn.total_changes
+            self.conn.executemany("INSERT OR IGNORE INTO work_queue (rel_path) VALUES (?)",
+                                  [(rel_path,) for rel_path in rel_paths])
+            return self.conn.total_changes - before
+
+    def claim(self, worker: str, limit: int, lease_seconds: float) -> list[str]:
+        """
+        Lease up to `limit` queued questions to a worker, oldest first.
+
+        Args:
+            worker: Name of the claiming worker
+            limit: Most questions to claim
+            lease_seconds: How long the claim holds unless renewed
+
+        Returns:
+            Image paths claimed (questions tagged meanwhile are dropped from the queue instead)
+        """
+        now = time.time()
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            self.conn.execute("DELETE FROM work_queue WHERE rel_path IN (SELECT rel_path FROM tags WHERE completed)")
+            claimed = [rel_path for rel_path, in self.conn.execute(
+                "SELECT rel_path FROM work_queue WHERE lease_until < ? ORDER BY rowid LIMIT ?", (now, limit))]
+            self.conn.executemany(
+                "UPDATE work_queue SET worker = ?, lease_until = ?, claims = claims + 1 WHERE rel_path = ?",
+                [(worker, now + lease_seconds, rel_path) for rel_path in claimed])
+        return claimed
+
+    def renew_claims(self, worker: str, lease_seconds: float) -> int:
+        """Extend every lease a worker holds (its heartbeat). Returns how many it holds."""
+        with self.conn:
+            return self.conn.execute("UPDATE work_queue SET lease_until = ? WHERE worker = ?",
+                                     (time.time() + lease_seconds, worker)).rowcount
+
+    def finish_claim(self, rel_path: str, worker: str) -> bool:
+        """Remove a finished question from the queue. Returns False if the worker no longer held it."""
+        with self.conn:
+            return self.conn.execute("DELETE FROM work_queue WHERE rel_path = ? AND worker = ?",
+                                     (rel_path, worker)).rowcount > 0
+
+    def release_claims(self, worker: str) -> int:
+        """Hand a worker's unfinished questions back to the queue. Returns how many."""
+        with self.conn:
+            return self.conn.execute("UPDATE work_queue SET worker = NULL, lease_until = 0 WHERE worker = ?",
+                                     (worker,)).rowcount
+
+    def queue_status(self) -> dict:
+        """Queued questions: 'waiting' to be claimed and 'leased' to a worker."""
+        leased = self.conn.execute("SELECT COUNT(*) FROM work_queue WHERE lease_until >= ?",
+                                   (time.time(),)).fetchone()[0]
+        total = self.conn.execute("SELECT COUNT(*) FROM work_queue").fetchone()[0]
+        return {"waiting": total - leased, "leased": leased}
+
+    # --- Search index state ---
+
+    def index_records(self) -> dict[str, dict]:
+        """Search records of the last index build by item id, with their image hash as '_hash'."""
+        rows = self.conn.execute("SELECT record FROM index_records ORDER BY rowid")
+        return {record['id']: record for record in (json.loads(r) for r, in rows)}
+
+    def _upsert_index_records(self, records: list[dict]):
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO index_records (item_id, hash, record) VALUES (?, ?, ?)",
+            [(r['id'], r.get('_hash'), json.dumps(r, ensure_ascii=False)) for r in records])
+
+    def save_index_records(self, records: list[dict], keep_only: bool = True):
+        """
+        Upsert search records in one transaction.
+
+        Args:
+            records: Records with 'id' and '_hash'
+            keep_only: Also delete records of items not in records
+        """
+        with self.conn:
+            self._upsert_index_records(records)
+            if keep_only:
+                keep = {r['id'] for r in records}
+                stale = [(item_id,) for item_id, in self.conn.execute("SELECT item_id FROM index_records")
+                         if item_id not in keep]
+                self.conn.executemany("DELETE FROM index_records WHERE item_id = ?", stale)
+
+    def term_tags(self) -> dict[str, dict]:
+        """Textbook term tags of every question by image path, as saved by save_term_tags()."""
+        rows = self.conn.execute("SELECT rel_path, data FROM term_tags")
+        return {rel_path: json.loads(data) for rel_path, data in rows}
+
+    def save_term_tags(self, tags: dict[str, dict]):
+        """Replace every question's term tags ({image path: tags}) in one transaction."""
+        with self.conn:
+            self.conn.execute("DELETE FROM term_tags")
+            self.conn.executemany("INSERT INTO term_tags (rel_path, data) VALUES (?, ?)",
+                                  [(rel_path, json.dumps(data, ensure_ascii=False)) for rel_path, data in tags.items()])
+
+    # --- Duplicate detection ---
+
+    def fingerprints(self) -> dict[str, dict]:
+        """Fingerprints of cropped questions by image path, as saved by save_fingerprints()."""
+        rows = self.conn.execute("SELECT rel_path, source_hash, height, shingles, dhash, minhash FROM fingerprints")
+        return {rel_path: {'rel_path': rel_path, 'source_hash': source_hash, 'height': height,
+                           'shingles': shingles, 'dhash': dhash, 'minhash': minhash}
+                for rel_path, source_hash, height, shingles, dhash, minhash in rows}
+
+    def save_fingerprints(self, fingerprints: list[dict], keep_only: bool = True):
+        """
+        Upsert fingerprints in one transaction.
+
+        Args:
+            fingerprints: Dicts with 'rel_path', 'source_hash', 'height', 'shingles', 'dhash' and
+                'minhash' (bytes, or None for crops without enough text)
+            keep_only: Also delete fingerprints of images not in fingerprints
+        """
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO fingerprints (rel_path, source_hash, height, shingles, dhash, minhash) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(f['rel_path'], f['source_hash'], f['height'], f['shingles'], f['dhash'], f['minhash'])
+                 for f in fingerprints])
+            if keep_only:
+                keep = {f['rel_path'] for f in fingerprints}
+                stale = [(rel_path,) for rel_path, in self.conn.execute("SELECT rel_path FROM fingerprints")
+                         if rel_path not in keep]
+                self.conn.executemany("DELETE FROM fingerprints WHERE rel_path = ?", stale)
+
+    def save_duplicate_clusters(self, clusters: list[list[str]]):
+        """Replace every duplicate cluster (each a list of image paths; the first one names the cluster)."""
+        with self.conn:
+            self.conn.execute("DELETE FROM duplicates")
+            self.conn.executemany("INSERT INTO duplicates (rel_path, cluster) VALUES (?, ?)",
+                                  [(rel_path, members[0]) for members in clusters for rel_path in members])
+
+    def duplicates(self) -> dict[str, list[str]]:
+        """Other appearances of every question that has any ({image path: [image paths]})."""
+        clusters = {}
+        for rel_path, cluster in self.conn.execute("SELECT rel_path, cluster FROM duplicates ORDER BY rel_path"):
+            clusters.setdefault(cluster, []).append(rel_path)
+        return {rel_path: [other for other in members if other != rel_path]
+                for members in clusters.values() for rel_path in members}
+
+    # --- Migration and export ---
+
+    def migrate_from_json(self, once: bool = False) -> dict:
+        """
+        Import the legacy JSON files (rows already in the store are overwritten), in one
+        IMMEDIATE transaction so processes opening a new store at the same time import once.
+
+        Args:
+            once: Skip the import if the store has already been migrated
+
+        Returns:
+            {table: rows imported}, or None if skipped
+        """
+        counts = {"crops": 0, "tags": 0, "index_records": 0}
+        progress = _load_json(CROPPER_PROGRESS_FILE, {})
+        tags = _load_json(TAGS_FILE, {})
+        completed = _load_json(CLASSIFIER_PROGRESS_FILE, {}).get("completed", [])
+        records = _load_json(SEARCH_INDEX_STATE_FILE, {}).get("index", [])
+        now = time.time()
+
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            # Checked again under the write lock: another process may have imported meanwhile
+            if once and self.get_meta("migrated_from_json") is not None:
+                return None
+
+            for exam_key, crops in progress.items():
+                for crop in crops:
+                    self._upsert_crop(exam_key, crop)
+                counts["crops"] += len(crops)
+
+            # Completed order first, then tags the progress file does not know about
+            for rel_path in dict.fromkeys(completed + list(tags)):
+                data = tags.get(rel_path)
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO tags (rel_path, data, completed, updated_at) VALUES (?, ?, ?, ?)",
+                    (rel_path, json.dumps(data, ensure_ascii=False) if data is not None else None,
+                     int(rel_path in completed or data is not None), now))
+                counts["tags"] += 1
+
+            self._upsert_index_records(records)
+            counts["index_records"] = len(records)
+
+            self._set_meta("migrated_from_json", time.strftime("%Y-%m-%d %H:%M:%S"))
+        return counts
+
+    def export_json(self) -> list[Path]:
+        """Write the store back to the legacy JSON files. Returns the files written."""
+        records = list(self.index_records().values())
+        exports = {
+            CROPPER_PROGRESS_FILE: self.all_crops(),
+            TAGS_FILE: self.tags(),
+            CLASSIFIER_PROGRESS_FILE: {"completed": self.completed_tags()},
+            SEARCH_INDEX_STATE_FILE: {"processed": {r['id']: r.get('_hash') for r in records},
+                                      "index": records},
+        }
+        for path, data in exports.items():
+            _write_json(path, data)
+        return list(exports)
+
+    def stats(self) -> dict:
+        """Row counts of every table."""
+        return {table: self.conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                for table in ("exams", "crops", "texts", "tags", "index_records", "term_tags", "fingerprints",
+                              "duplicates", "work_queue")}
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Pipeline state database (crops, texts, tags, index state)")
+    parser.add_argument("--export", action="store_true",
+                        help="Write the state back to the legacy JSON files")
+    parser.add_argument("--migrate", action="store_true",
+                        help="Re-import the legacy JSON files (overwrites matching rows)")
+    parser.add_argument("--clear-tags", action="store_true", help="Delete all classifier results")
+    args = parser.parse_args()
+
+    with StateStore() as store:
+        if args.migrate:
+            counts = store.migrate_from_json()
+            print("✓ Imported " + ", ".join(f"{n} {table}" for table, n in counts.items()))
+        if args.clear_tags:
+            store.clear_tags()
+            print("✓ Cleared all tags")
+        if args.export:
+            for path in store.export_json():
+                print(f"✓ Exported {path.relative_to(BASE_DIR)}")
+        print(f"State store {store.db_path.relative_to(BASE_DIR)}: "
+              + ", ".join(f"{n} {table}" for table, n in store.stats().items()))
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Textbook Term Tagger
+Tags every question offline with the textbook index terms it mentions, in one
+pass over its extracted text:
+
+  - vocabulary: every term of topics.json (with its chapter, section and
+    topic) and of raw_terms.txt; "ALU (Arithmetic and Logical Unit)" gives
+    both "ALU" and "Arithmetic and Logical Unit"
+  - matching: one Aho-Corasick automaton (keyword_automaton.py) over the
+    lowercased text, whole words only, plurals allowed; short all-caps
+    acronyms ("IT", "AM") must match in capitals
+  - hits: term and character positions in the extracted text; a hit inside a
+    longer one ("search" in "binary search") is dropped
+  - weight: a term's word count times its inverse document frequency over
+    the corpus, so "binary search tree" counts for more than "process"
+  - sections: each term found adds its weight to the sections it is filed
+    under in topics.json, split evenly if it is under several
+
+Results are saved in the state store (term_tags) and build_search_index.py
+adds each question's terms and best section to the web index.
+
+Tag the corpus and report coverage and timing, or show one question's hits:
+    python3 app/term_tagger.py [--show 2024A_A/Q12.png]
+"""
+
+import json
+import math
+import re
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+
+from build_topics import BLACKLIST, RAW_FILE, clean_term
+from classifier_journal import load_topics
+from keyword_automaton import KeywordAutomaton
+
+MIN_TERM_CHARS = 3  # Shorter terms only as capitalised acronyms
+MAX_ACRONYM_CHARS = 4  # All-caps terms up to this long must match in capitals ("IT" is not "it")
+PLURAL_SUFFIXES = ("s", "es")
+MAX_SECTIONS = 3  # Candidate sections kept per question
+
+
+@dataclass
+class Term:
+    """One matchable form of a textbook term."""
+    name: str  # As written in the index
+    key: str  # Lowercase form matched by the automaton
+    sections: list = field(default_factory=list)  # (chapter, section, topic) it is filed under
+    exact: bool = False  # Acronym that must match in capitals
+
+    @property
+    def words(self) -> int:
+        return len(self.key.split())
+
+
+def term_forms(raw_term: str) -> list[str]:
+    """Matchable forms of an index entry: the term without its parenthesis, and the parenthesis itself."""
+    forms = [clean_term(raw_term)]
+    forms += [inner.strip() for inner in re.findall(r"\(([^()]*)\)", raw_term)]
+    return [re.sub(r"\s+", " ", form) for form in forms if form]
+
+
+def is_acronym(form: str) -> bool:
+    return len(form) <= MAX_ACRONYM_CHARS and form.isupper()
+
+
+class TermTagger:
+    """Automaton over the vocabulary of topics.json and raw_terms.txt."""
+
+    def __init__(self, topics: dict, raw_terms: list[str] = ()):
+        """
+        Args:
+            topics: Taxonomy as in topics.json ({chapter: {section: {topic: [terms]}}})
+            raw_terms: Lines of raw_terms.txt (terms not filed under any section)
+        """
+        self.terms = []
+        by_key = {}
+
+        def add(raw_term, section=None):
+            for form in term_forms(raw_term):
+                key = form.lower()
+                exact = is_acronym(form)
+                if key in BLACKLIST or not re.search(r"[a-z]", key):
+                    continue
+                if len(key) < MIN_TERM_CHARS and not exact:
+                    continue
+                if key not in by_key:
+                    by_key[key] = len(self.terms)
+                    self.terms.append(Term(form, key, exact=exact))
+                term = self.terms[by_key[key]]
+                if section and section not in term.sections:
+                    term.sections.append(section)
+
+        for chapter, sections in topics.items():
+            for section, specific_topics in sections.items():
+                for topic, terms in specific_topics.items():
+                    for raw_term in terms or []:
+                        add(raw_term, (chapter, section, topic))
+        for line in raw_terms:
+            if line.strip():
+                add(line.strip())
+        self.automaton = KeywordAutomaton(by_key)
+
+    def hits(self, text: str) -> list[tuple[int, int, Term]]:
+        """(start, end, term) of every term in the text, hits inside a longer hit dropped."""
+        text = text or ""
+        found = []
+        for start, end, index in self.automaton.matches(re.sub(r"\s", " ", text), PLURAL_SUFFIXES):
+            term = self.terms[index]
+            if term.exact and text[start:start + len(term.key)] != term.name:
+                continue
+            found.append((start, end, term))
+        found.sort(key=lambda hit: (hit[0], -hit[1]))
+        kept = []
+        for hit in found:
+            if not any(s <= hit[0] and hit[1] <= e for s, e, _ in kept):
+                kept.append(hit)
+        return kept
+
+    def tag(self, text: str, weights: dict[str, float] = None) -> dict:
+        """Term-level tags of one question (see summarize())."""
+        return self.summarize(self.hits(text), weights)
+
+    def summarize(self, hits: list[tuple[int, int, Term]], weights: dict[str, float] = None) -> dict:
+        """
+        Term-level tags from a question's hits.
+
+        Args:
+            hits: As returned by hits()
+            weights: Weight of each term key (default: its word count)
+
+        Returns:
+            {"terms": [{"term", "weight", "positions": [[start, end], ...]}] in order of first appearance,
+             "sections": [{"category", "subcategory", "score"}] best first}
+        """
+        positions, terms = {}, {}
+        for start, end, term in hits:
+            positions.setdefault(term.key, []).append([start, end])
+            terms[term.key] = term
+        weight = {key: (weights or {}).get(key, term.words) for key, term in terms.items()}
+        scores = Counter()
+        for key, term in terms.items():
+            for chapter, section, _ in term.sections:
+                scores[(chapter, section)] += weight[key] / len(term.sections)
+        return {
+            "terms": [{"term": terms[key].name, "weight": round(weight[key], 2), "positions": spans}
+                      for key, spans in positions.items()],
+            "sections": [{"category": chapter, "subcategory": section, "score": round(score, 2)}
+                         for (chapter, section), score in scores.most_common(MAX_SECTIONS)],
+        }
+
+
+def load_tagger() -> TermTagger:
+    raw_terms = RAW_FILE.read_text().splitlines() if RAW_FILE.exists() else []
+    return TermTagger(load_topics(), raw_terms)
+
+
+def term_weights(corpus_hits: list[list[tuple[int, int, Term]]]) -> dict[str, float]:
+    """Word count times inverse document frequency (log N / df) of every term found in the corpus."""
+    terms, document_frequency = {}, Counter()
+    for found in corpus_hits:
+        for term in {term.key: term for _, _, term in found}.values():
+            terms[term.key] = term
+            document_frequency[term.key] += 1
+    n = len(corpus_hits)
+    return {key: terms[key].words * math.log((1 + n) / df) for key, df in document_frequency.items()}
+
+
+def tag_corpus(store, texts: dict[str, str] = None, tagger: TermTagger = None) -> dict[str, dict]:
+    """
+    Tag every question with text and save the results (replacing the previous ones).
+
+    Args:
+        store: StateStore to read texts from and save tags to
+        texts: {image path: text} to tag instead of the extracted texts in the store
+
+    Returns:
+        {image path: tags}
+    """
+    tagger = tagger or load_tagger()
+    texts = store.question_texts() if texts is None else texts
+    hits = {rel_path: tagger.hits(text) for rel_path, text in texts.items() if text}
+    weights = term_weights(list(hits.values()))
+    tags = {rel_path: tagger.summarize(found, weights) for rel_path, found in hits.items()}
+    store.save_term_tags(tags)
+    return tags
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from state_store import StateStore
+
+    parser = argparse.ArgumentParser(description="Tag questions with the textbook index terms they mention")
+    parser.add_argument("--show", metavar="REL_PATH", help="Print the hits of one question, e.g. 2024A_A/Q12.png")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    tagger = load_tagger()
+    build_seconds = time.perf_counter() - start
+    store = StateStore()
+
+    if args.show:
+        text = store.question_texts().get(args.show, "")
+        if not text:
+            print(f"No extracted text for {args.show}")
+        for s, e, term in tagger.hits(text):
+            filed = "; ".join(f"{c} > {sec} > {top}" for c, sec, top in term.sections) or "not filed in topics.json"
+            print(f"  {s:>5}-{e:<5} {text[s:e]!r:32} {term.name} ({filed})")
+        print(json.dumps(tagger.tag(text)["sections"], indent=2))
+        store.close()
+    else:
+        start = time.perf_counter()
+        tags = tag_corpus(store, tagger=tagger)
+        tag_seconds = time.perf_counter() - start
+        store.close()
+
+        tagged = [t for t in tags.values() if t["terms"]]
+        with_section = sum(1 for t in tags.values() if t["sections"])
+        counts = Counter(term["term"] for t in tags.values() for term in t["terms"])
+        print(f"Vocabulary: {len(tagger.terms)} terms, {len(tagger.automaton.next)} automaton states "
+              f"(built in {build_seconds * 1000:.0f} ms)")
+        print(f"✓ Tagged {len(tags)} questions in {tag_seconds:.2f} s: {len(tagged)} mention a term "
+              f"({sum(len(t['terms']) for t in tagged) / max(1, len(tagged)):.1f} on average), "
+              f"{with_section} have a candidate section")
+        print("  Most frequent: " + ", ".join(f"{term} ({n})" for term, n in counts.most_common(10)))
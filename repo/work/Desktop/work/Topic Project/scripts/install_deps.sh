@@ -102,7 +102,7 @@ packages = [
     ('fitz', 'PyMuPDF'),
     ('pdf2image', 'pdf2image'),
     ('pdfplumber', 'pdfplumber'),
-    ('google.generativeai', 'google-generativeai'),
+    ('google.genai', 'google-genai'),
 ]
 all_ok = True
 for module, name in packages:
@@ -11,6 +11,8 @@ else
 fi
 
 echo "Rebuilding all web data..."
+$PYTHON_BIN app/build_thumbnails.py
+$PYTHON_BIN app/find_duplicates.py
 $PYTHON_BIN app/build_search_index.py
 $PYTHON_BIN app/build_web_topics.py
 $PYTHON_BIN app/build_papers_list.py
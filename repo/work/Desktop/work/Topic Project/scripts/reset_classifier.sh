@@ -4,9 +4,17 @@
 read -p "Are you sure you want to delete all AI-generated tags and restart? [y/N] " confirm
 if [[ $confirm == [yY] || $confirm == [yY][eE][sS] ]]; then
     echo "Resetting classifier state..."
+    if [ -f "venv/bin/python3" ]; then
+        PYTHON_BIN="venv/bin/python3"
+    else
+        PYTHON_BIN="python3"
+    fi
+    $PYTHON_BIN app/state_store.py --clear-tags
     rm -f data/output/question_tags.json
     rm -f data/state/.classifier_progress.json
     echo "✓ Progress and tags cleared."
+    echo "Cached results are kept, so unchanged questions are re-tagged without API calls."
+    echo "To clear them as well, run: python3 app/classify_cache.py --clear"
     
     echo "Note: data/output/topics.json may still contain AI-suggested topics."
     echo "If you want to reset the topic list as well, run: python3 app/build_topics.py --force"
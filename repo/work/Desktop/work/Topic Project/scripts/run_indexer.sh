@@ -13,5 +13,11 @@ else
     PYTHON_CMD="python3"
 fi
 
+echo "Building thumbnails..."
+$PYTHON_CMD app/build_thumbnails.py
+
+echo "Finding questions reused across exams..."
+$PYTHON_CMD app/find_duplicates.py
+
 echo "Running Search Index Builder..."
 $PYTHON_CMD app/build_search_index.py "$@"
@@ -23,6 +23,7 @@ const papersYearsContainer = document.getElementById('papers-years');
 const paperDetailContainer = document.getElementById('paper-detail');
 
 let allData = [];
+let dataById = new Map();
 let topicsData = {};
 let papersData = [];
 let fuse;
@@ -50,6 +51,62 @@ function getImagePath(imgPath) {
     return imgPath;
 }
 
+// Build a <picture> that lets the browser take the smallest format it supports.
+// item.formats lists the files on disk smallest first; the PNG is the fallback.
+// Cards show the thumbnail pyramid (item.thumbs) when it exists, so the
+// full-resolution image is only downloaded when the question is opened.
+const THUMB_SIZES = '(max-width: 768px) 100vw, 400px';
+
+function smallerFormats(formats) {
+    formats = formats || ['png'];
+    return formats.slice(0, Math.max(0, formats.indexOf('png')));
+}
+
+function pictureHtml(item, imgPath, alt) {
+    const thumbs = item.thumbs || {};
+    // Crops narrower than a level are stored at their own width; list each width once
+    const levels = ['small', 'medium'].filter(level => thumbs[level])
+        .filter((level, i, all) => i === 0 || thumbs[level].width !== thumbs[all[i - 1]].width);
+    if (!levels.length) {
+        const sources = smallerFormats(item.formats)
+            .map(fmt => `<source type="image/${fmt}" srcset="${imgPath.replace(/\.png$/, '.' + fmt)}">`)
+            .join('');
+        return `<picture>${sources}<img src="${imgPath}" alt="${alt}" loading="lazy"></picture>`;
+    }
+
+    const srcset = fmt => levels
+        .filter(level => fmt === 'png' || (thumbs[level].formats || []).includes(fmt))
+        .map(level => `${getImagePath(thumbs[level].path).replace(/\.png$/, '.' + fmt)} ${thumbs[level].width}w`)
+        .join(', ');
+    const small = thumbs[levels[0]];
+    const sources = smallerFormats(small.formats)
+        .map(fmt => `<source type="image/${fmt}" srcset="${srcset(fmt)}" sizes="${THUMB_SIZES}">`)
+        .join('');
+    return `<picture>${sources}<img src="${getImagePath(small.path)}" srcset="${srcset('png')}" ` +
+        `sizes="${THUMB_SIZES}" width="${small.width}" height="${small.height}" ` +
+        `alt="${alt}" loading="lazy" decoding="async"></picture>`;
+}
+
+// "Also appeared in" links to copies of a question in other exams (item.also_in, by id).
+// Each link opens that copy's image without triggering the card's own click.
+function alsoInHtml(item) {
+    const copies = (item.also_in || []).map(id => dataById.get(id)).filter(copy => !!copy);
+    if (!copies.length) return '';
+    const links = copies
+        .map(copy => `<a href="${getImagePath(copy.img_path)}" target="_blank" onclick="event.stopPropagation()">` +
+            `${copy.term.slice(0, 3)} ${copy.year} Q${copy.q_num}</a>`)
+        .join(', ');
+    return `<div class="also-in">Also appeared in: ${links}</div>`;
+}
+
+// Textbook index terms the question mentions (item.terms, from term_tagger.py) and
+// the section they point to (item.section).
+function termsHtml(item) {
+    if (!item.terms || !item.terms.length) return '';
+    const section = item.section ? `<div class="terms-section">${item.section}</div>` : '';
+    return `<div class="terms">${item.terms.map(term => `<span class="term">${term}</span>`).join('')}</div>${section}`;
+}
+
 // Helper to escape special regex characters
 function escapeRegex(string) {
     return string.replace(/[.*+?^${}()|[\]\\]/g, '\\$&');
@@ -62,6 +119,7 @@ function init() {
             throw new Error("SEARCH_DATA not found. Make sure data.js is loaded.");
         }
         allData = window.SEARCH_DATA;
+        dataById = new Map(allData.map(d => [d.id, d]));
         topicsData = window.TOPICS_DATA || {};
         papersData = window.PAPERS_DATA || [];
 
@@ -71,7 +129,7 @@ function init() {
 
         // Setup Fuse for fuzzy search (fallback)
         const options = {
-            keys: ['text', 'tag', 'id'],
+            keys: ['text', 'tag', 'terms', 'id'],
             threshold: 0.35,
             includeScore: true,
             ignoreLocation: true,
@@ -341,11 +399,13 @@ function renderResults(items, container, showAll = false) {
 
         card.innerHTML = `
             <div class="card-img-container">
-                <img src="${imgPath}" alt="Q${item.q_num}" loading="lazy">
+                ${pictureHtml(item, imgPath, `Q${item.q_num}`)}
             </div>
             <div class="card-body">
                 ${badgesHtml}
                 <div class="question-title">Question ${item.q_num}</div>
+                ${termsHtml(item)}
+                ${alsoInHtml(item)}
             </div>
         `;
 
@@ -423,7 +483,7 @@ function parseTokens(str) {
 
 function matchToken(item, token) {
     const text = (item.text || '').toLowerCase();
-    const tag = (item.tag || '').toLowerCase();
+    const tag = [item.tag || '', ...(item.terms || [])].join('\n').toLowerCase();
     let pattern = escapeRegex(token.value);
     let hasWildcards = false;
     if (token.type === 'pattern') {